@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Invoice, InvoiceLineItem, Payment
+from .models import Invoice, InvoiceLineItem, OverdueSweep, Payment, PaymentEvent, PdfJob
 
 
 class InvoiceLineItemInline(admin.TabularInline):
@@ -31,3 +31,31 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ('method', 'payment_date')
     search_fields = ('invoice__tenant__first_name', 'reference_number')
     readonly_fields = ('created_at',)
+
+
+@admin.register(OverdueSweep)
+class OverdueSweepAdmin(admin.ModelAdmin):
+    list_display = ('run_date', 'timezone', 'swept', 'started_at', 'finished_at')
+    readonly_fields = ('run_date', 'timezone', 'swept', 'started_at', 'finished_at')
+
+
+@admin.register(PdfJob)
+class PdfJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'requested_by', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('transaction_id', 'provider', 'status', 'detail', 'received_at', 'processed_at')
+    list_filter = ('provider', 'status')
+    search_fields = ('transaction_id',)
+    readonly_fields = ('payload', 'payment', 'received_at', 'processed_at')
+    actions = ['requeue']
+
+    @admin.action(description='Requeue for the payment applier')
+    def requeue(self, request, queryset):
+        queryset.exclude(status=PaymentEvent.APPLIED).update(
+            status=PaymentEvent.PENDING, detail='', processed_at=None,
+        )
@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class BillingConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'billing'
+
+    def ready(self):
+        from . import conditional  # noqa: F401  (signal receivers)
+
+        if settings.OVERDUE_SWEEP_SCHEDULER:
+            from .overdue import start_scheduler
+            start_scheduler()
+        if settings.MPESA_APPLIER_SCHEDULER:
+            from .mpesa import start_applier
+            start_applier()
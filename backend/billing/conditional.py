@@ -0,0 +1,196 @@
+"""
+Conditional GET (ETag / Last-Modified) for the invoice and payment lists.
+
+The validator for a list is one aggregate over the same filtered queryset
+the view would serialize: ``COUNT(*)`` plus the newest row timestamp
+(``updated_at`` for invoices, ``created_at`` and id for payments, which are
+not edited in place). It is answered from an index alone, so a 304 costs
+one small query instead of a full serialization.
+
+The rows also show names of tenants, units and apartments, and invoice
+status depends on today's date. Both are folded in: the ETag includes the
+date, and a *related version* timestamp for the list's scope, one per
+landlord (their lists) and one per tenant (the tenant portal). A scope's
+version is replaced when something its lists show changes in a way the row
+aggregate cannot see: an apartment, unit, tenant profile or user is saved
+or deleted, a payment is saved or an invoice or payment deleted, or
+``invoices_changed`` is sent. Payments update their invoice with
+``updated_at = now()``, which PostgreSQL fixes at the start of the
+transaction, so the newest ``updated_at`` can stay the same after a commit;
+the bump on commit covers that. Only the landlord concerned and their
+tenants are bumped, so one landlord's writes leave every other landlord's
+304s intact. With several workers the versions need a shared cache
+(CACHE_DIR), like the dashboard cache.
+"""
+import hashlib
+import time
+from datetime import datetime, time as dt_time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from properties.models import Apartment, TenantProfile, Unit
+from users.models import User
+
+from .models import Invoice, Payment
+from .signals import invoices_changed
+
+# Bumped for every scope at once (maintenance commands that rewrite rows).
+RELATED_VERSION_KEY = 'billing:related-version'
+SCOPE_VERSION_KEY = 'billing:related-version:{}:{}'
+LANDLORD = 'landlord'
+TENANT = 'tenant'
+
+
+def related_version(scope):
+    """``(global version, version of scope)`` for a ``(LANDLORD|TENANT, user id)`` scope."""
+    keys = [RELATED_VERSION_KEY, SCOPE_VERSION_KEY.format(*scope)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time(), None)
+            found[key] = cache.get(key, time.time())
+    return tuple(found[key] for key in keys)
+
+
+def bump_related_version(landlord_ids=None, tenant_ids=()):
+    """
+    Invalidate the list validators of ``landlord_ids`` and ``tenant_ids``,
+    or of every scope when neither is given, now and again when the
+    transaction commits.
+    """
+    if landlord_ids is None and not tenant_ids:
+        keys = [RELATED_VERSION_KEY]
+    else:
+        keys = [SCOPE_VERSION_KEY.format(LANDLORD, pk) for pk in set(landlord_ids or ()) if pk is not None]
+        keys += [SCOPE_VERSION_KEY.format(TENANT, pk) for pk in set(tenant_ids) if pk is not None]
+        if not keys:
+            return
+
+    def bump():
+        now = time.time()
+        cache.set_many({key: now for key in keys}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+class ListValidator:
+    """
+    Validator for one request's list. ``not_modified()`` returns a 304 when
+    the client's copy is current; otherwise build the response as usual and
+    pass it through ``apply()``.
+    """
+
+    def __init__(self, request, queryset, modified_field, scope):
+        self.request = request
+        fields = {'count': Count('*'), 'modified': Max(modified_field)}
+        if modified_field != 'updated_at':
+            fields['last_id'] = Max('pk')
+        row = queryset.order_by().aggregate(**fields)
+        versions = related_version(scope)
+        today = timezone.localdate()
+
+        key = '|'.join(str(part) for part in (
+            request.path, request.user.pk, request.GET.urlencode(), request.META.get('HTTP_ACCEPT', ''),
+            today, *versions, row['count'], row['modified'], row.get('last_id'),
+        ))
+        self.etag = quote_etag(hashlib.sha1(key.encode()).hexdigest())
+        candidates = [
+            timezone.make_aware(datetime.combine(today, dt_time.min)).timestamp(),
+            *versions,
+        ]
+        if row['modified'] is not None:
+            candidates.append(row['modified'].timestamp())
+        self.last_modified = int(max(candidates))
+
+    def not_modified(self):
+        response = get_conditional_response(
+            self.request._request, etag=self.etag, last_modified=self.last_modified,
+        )
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+# ── Changes the row aggregate does not see ────────────────────────────────────
+
+def _tenants_of(landlord_ids):
+    return TenantProfile.objects.filter(landlord_id__in=landlord_ids).values_list('user_id', flat=True)
+
+
+def _bump_landlords(landlord_ids):
+    """A landlord's lists and their tenants' portals (apartment, unit and landlord names)."""
+    landlord_ids = [pk for pk in landlord_ids if pk is not None]
+    if landlord_ids:
+        bump_related_version(landlord_ids, list(_tenants_of(landlord_ids)))
+
+
+def _invoice_scope(instance, origin):
+    """``(landlord id, tenant id)`` of a payment's invoice."""
+    if isinstance(origin, Invoice):
+        return origin.landlord_id, origin.tenant_id  # cascading from an invoice delete
+    if Payment.invoice.is_cached(instance):
+        return instance.invoice.landlord_id, instance.invoice.tenant_id
+    return Invoice.objects.filter(pk=instance.invoice_id).values_list(
+        'landlord_id', 'tenant_id',
+    ).first() or (None, None)
+
+
+@receiver([post_save, post_delete], sender=Apartment)
+def apartment_changed(sender, instance, **kwargs):
+    _bump_landlords([instance.landlord_id])
+
+
+@receiver([post_save, post_delete], sender=Unit)
+def unit_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Apartment):
+        landlord_id = origin.landlord_id  # cascading from an apartment delete
+    elif Unit.apartment.is_cached(instance):
+        landlord_id = instance.apartment.landlord_id
+    else:
+        landlord_id = Apartment.objects.filter(pk=instance.apartment_id).values_list(
+            'landlord_id', flat=True,
+        ).first()
+    _bump_landlords([landlord_id])
+
+
+@receiver([post_save, post_delete], sender=TenantProfile)
+def tenant_profile_changed(sender, instance, **kwargs):
+    bump_related_version([instance.landlord_id], [instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return  # logins change nothing the lists show
+    # Shown as a tenant in their landlords' lists, and as the recorder of
+    # payments in their own lists and their tenants' portals.
+    landlord_ids = TenantProfile.objects.filter(user=instance).values_list('landlord_id', flat=True)
+    bump_related_version([instance.pk, *landlord_ids], [instance.pk, *_tenants_of([instance.pk])])
+
+
+@receiver(post_delete, sender=Invoice)
+def invoice_deleted(sender, instance, **kwargs):
+    bump_related_version([instance.landlord_id], [instance.tenant_id])
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def payment_changed(sender, instance, origin=None, **kwargs):
+    landlord_id, tenant_id = _invoice_scope(instance, origin)
+    bump_related_version([landlord_id], [tenant_id])
+
+
+@receiver(invoices_changed)
+def invoices_bulk_changed(sender, landlord_ids, **kwargs):
+    _bump_landlords(landlord_ids)
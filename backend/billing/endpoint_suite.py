@@ -0,0 +1,220 @@
+"""
+Every API endpoint, callable through the test client against a sample portfolio.
+
+Shared by the query budget tests and ``check_query_budgets`` (query counts)
+and by ``run_benchmarks`` (latency and memory). Requests go through the full middleware and DRF stack
+with real JWT tokens. Endpoints that write take a sequence number, so calling
+them repeatedly creates distinct invoices, payments and transaction ids.
+"""
+import io
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.urls import get_resolver, reverse
+from rest_framework.test import APIClient
+
+from users.authentication import user_state
+from users.models import User
+from users.views import FlexibleTokenSerializer
+
+CALLBACK_TOKEN = 'endpoint-suite'
+SHORTCODE = '600999'
+
+# (label, role, method, url name, url kwargs, query params / body, max queries).
+# JWT authentication builds the user from the token (users.authentication), so
+# budgets count no users query; the conditional-GET lists (billing.conditional)
+# include their validator query.
+# Ids in kwargs and bodies are looked up in the suite's context.
+ENDPOINTS = [
+    # properties
+    ('apartment list', 'landlord', 'get', 'apartment-list', {}, {}, 1),
+    ('apartment detail', 'landlord', 'get', 'apartment-detail', {'pk': 'apartment'}, {}, 1),
+    ('unit list', 'landlord', 'get', 'unit-list', {}, {}, 2),
+    ('unit list (sparse)', 'landlord', 'get', 'unit-list', {}, {'omit': 'active_tenant_name'}, 1),
+    ('unit detail', 'landlord', 'get', 'unit-detail', {'pk': 'unit'}, {}, 2),
+    ('tenant list', 'landlord', 'get', 'tenant-list', {}, {}, 2),
+    ('tenant detail', 'landlord', 'get', 'tenant-detail', {'pk': 'profile'}, {}, 2),
+    # billing: invoices
+    ('invoice list', 'landlord', 'get', 'invoice-list', {}, {}, 2),
+    ('invoice list page', 'landlord', 'get', 'invoice-list', {}, {'page_size': 5}, 2),
+    ('invoice list (sparse)', 'landlord', 'get', 'invoice-list', {}, {'fields': 'id,total_amount,status'}, 2),
+    ('invoice create', 'landlord', 'post', 'invoice-list', {}, 'new_invoice', 12),
+    ('invoice generate (dry run)', 'landlord', 'post', 'invoice-generate', {}, 'generate', 3),
+    ('invoice export', 'landlord', 'get', 'invoice-export', {}, {'status': 'paid'}, 3),
+    ('invoice detail', 'landlord', 'get', 'invoice-detail', {'pk': 'invoice'}, {}, 2),
+    ('invoice pdf', 'landlord', 'get', 'invoice-pdf', {'pk': 'invoice'}, {}, 2),
+    ('invoice pdf (async)', 'landlord', 'get', 'invoice-pdf', {'pk': 'invoice'}, {'async': 'true'}, 5),
+    # billing: payments
+    ('payment list', 'landlord', 'get', 'payment-list', {}, {}, 2),
+    ('payment create', 'landlord', 'post', 'payment-list', {}, 'new_payment', 8),
+    ('payment import', 'landlord', 'post', 'payment-import', {}, 'statement', 10),
+    ('payment detail', 'landlord', 'get', 'payment-detail', {'pk': 'payment'}, {}, 1),
+    ('payment receipt', 'landlord', 'get', 'payment-receipt', {'pk': 'payment'}, {}, 1),
+    ('pdf job status', 'landlord', 'get', 'pdf-job-status', {'pk': 'pdf_job'}, {}, 1),
+    ('pdf job download', 'landlord', 'get', 'pdf-job-download', {'pk': 'pdf_job'}, {}, 1),
+    ('mpesa callback', 'anonymous', 'post', 'mpesa-callback', {'token': CALLBACK_TOKEN}, 'callback', 1),
+    # billing: tenant portal
+    ('tenant invoices', 'tenant', 'get', 'tenant-invoices', {}, {}, 2),
+    ('tenant invoice detail', 'tenant', 'get', 'tenant-invoice-detail', {'pk': 'tenant_invoice'}, {}, 2),
+    ('tenant invoice pdf', 'tenant', 'get', 'tenant-invoice-pdf', {'pk': 'tenant_invoice'}, {}, 2),
+    ('tenant payments', 'tenant', 'get', 'tenant-payments', {}, {}, 2),
+    # reports
+    ('landlord dashboard', 'landlord', 'get', 'landlord-dashboard', {}, {}, 5),
+    ('payment report', 'landlord', 'get', 'payment-report', {}, {}, 2),
+    ('payment report csv', 'landlord', 'get', 'payment-report', {}, {'format': 'csv'}, 1),
+    ('outstanding report', 'landlord', 'get', 'outstanding-report', {}, {}, 2),
+    ('outstanding report ndjson', 'landlord', 'get', 'outstanding-report', {}, {'format': 'ndjson'}, 1),
+    ('tenant dashboard', 'tenant', 'get', 'tenant-dashboard', {}, {}, 4),
+]
+URL_MODULES = ('billing.urls', 'properties.urls', 'reports.urls')
+QUIET_LOGGERS = ('rental_system.requests', 'django.request')
+
+# Portfolios the budgets are checked against: each endpoint must stay within
+# its budget on the larger one and make no more queries there than on the
+# smaller one.
+BUDGET_SCALES = {
+    'small': {'apartments': 1, 'units_per_apartment': 4, 'months': 2},
+    'large': {'apartments': 3, 'units_per_apartment': 8, 'months': 4},
+}
+
+
+def uncovered_url_names():
+    """URL names in the API modules that have no entry in ENDPOINTS."""
+    names = set()
+    for module in URL_MODULES:
+        names.update(p.name for p in get_resolver(module).url_patterns if p.name)
+    return names - {name for _, _, _, name, _, _, _ in ENDPOINTS}
+
+
+def settings_overrides(landlord_username):
+    """
+    Settings the suite needs: the test client's host allowed, PDFs rendered
+    in-process on every request, a known callback token and short code
+    (paying ``landlord_username``), user state that stays cached for the
+    whole run, and no read replicas (they cannot see the rolled-back sample
+    data).
+    """
+    return {
+        'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        'JWT_USER_CACHE_TTL': 3600,
+        'DATABASE_REPLICAS': [],
+        'PDF_CACHE_ENABLED': False,
+        'PDF_EXPORT_WORKERS': 0,
+        'MPESA_CALLBACK_TOKEN': CALLBACK_TOKEN,
+        'MPESA_SHORTCODES': {SHORTCODE: landlord_username},
+    }
+
+
+@contextmanager
+def quiet_request_logs():
+    """Keep per-request log lines out of timings and command or test output."""
+    loggers = [logging.getLogger(name) for name in QUIET_LOGGERS]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.ERROR)
+    try:
+        yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+def _client(user):
+    client = APIClient()
+    if user is not None:
+        token = FlexibleTokenSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+class EndpointSuite:
+    """
+    Builds requests for the portfolio ``ids`` (as returned by
+    ``create_portfolio``). ``run`` distinguishes references written by
+    different suites in the same database.
+    """
+
+    def __init__(self, ids, run):
+        self.run = run
+        self.landlord = User.objects.get(pk=ids['landlord'])
+        self.tenant = User.objects.get(pk=ids['tenants'][0])
+        self.open_invoice = self.landlord.created_invoices.filter(
+            status__in=['unpaid', 'partial', 'overdue'],
+        ).values_list('id', flat=True).first()
+        self.ids = {
+            'apartment': ids['apartments'][0],
+            'unit': ids['units'][0],
+            'profile': ids['profiles'][0],
+            'invoice': ids['invoices'][0],
+            'tenant_invoice': self.tenant.invoices.values_list('id', flat=True).first(),
+            'payment': ids['payments'][0],
+        }
+        self.clients = {
+            'landlord': _client(self.landlord),
+            'tenant': _client(self.tenant),
+            'anonymous': _client(None),
+        }
+        for user in (self.landlord, self.tenant):
+            user_state(user.id)
+        # A queued job for the pdf-jobs endpoints.
+        response = self.clients['landlord'].get(
+            reverse('invoice-pdf', kwargs={'pk': self.ids['invoice']}), {'async': 'true'},
+        )
+        if response.status_code != 202:
+            raise CommandError(
+                f'Could not queue the sample PDF job: HTTP {response.status_code} '
+                f'{response.content[:200].decode(errors="replace")}'
+            )
+        self.ids['pdf_job'] = response.data['job_id']
+
+    # ── request bodies; ``n`` makes repeated writes distinct ───────────────────
+
+    def new_invoice(self, n):
+        return {
+            'unit': self.ids['unit'], 'tenant': self.tenant.id, 'month': n % 12 + 1, 'year': 2001 + n // 12,
+            'invoice_date': '2001-01-01', 'due_date': '2001-01-05', 'base_rent': '1000.00',
+            'line_items': [{'description': 'Water', 'amount': '100.00', 'order': 0}],
+        }
+
+    def new_payment(self, n):
+        return {
+            'invoice': self.open_invoice, 'amount': '10.00', 'payment_date': '2001-01-02',
+            'method': 'cash', 'reference_number': f'ES-{self.run}-{n}',
+        }
+
+    def generate(self, n):
+        return {'month': 1, 'year': 2001, 'dry_run': True}
+
+    def callback(self, n):
+        return {
+            'TransID': f'ESCB{self.run}{n}', 'TransTime': '20010102101500', 'TransAmount': '10.00',
+            'BusinessShortCode': SHORTCODE, 'BillRefNumber': f'INV-{self.open_invoice:05d}',
+            'MSISDN': '254700000000',
+        }
+
+    def statement(self, n):
+        rows = ['reference,date,amount,account']
+        rows += [
+            f'ESST{self.run}-{n}-{i},2001-01-03,5.00,INV-{self.ids["invoice"]:05d}' for i in range(20)
+        ]
+        handle = io.BytesIO('\n'.join(rows).encode())
+        handle.name = 'statement.csv'
+        return {'method': 'mpesa', 'file': handle}
+
+    # ── calls ──────────────────────────────────────────────────────────────────
+
+    def request(self, endpoint, n=0):
+        """Make one request for an ENDPOINTS entry; streamed bodies are consumed."""
+        label, role, method, name, kwargs, params, _ = endpoint
+        url = reverse(name, kwargs={k: self.ids.get(v, v) for k, v in kwargs.items()})
+        client = self.clients[role]
+        if isinstance(params, str):
+            body = getattr(self, params)(n)
+            response = client.post(url, body, format='multipart' if 'file' in body else 'json')
+        else:
+            response = getattr(client, method)(url, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
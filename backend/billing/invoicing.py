@@ -0,0 +1,145 @@
+"""Bulk monthly invoice generation for a whole portfolio."""
+import calendar
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+
+from properties.models import TenantProfile, Unit
+
+from .ledger import recompute_outstanding
+from .models import Invoice
+from .signals import invoices_changed
+
+BATCH_SIZE = 500
+
+SKIP_EXISTS = 'exists'
+SKIP_NO_TENANT = 'no_active_tenant'
+SKIP_DUPLICATE_TENANT = 'multiple_active_tenants'
+
+
+def _unit_display(apartment_name, unit_number):
+    # Mirrors Unit.__str__ without loading the Unit/Apartment instances.
+    return f'{apartment_name} – {unit_number}'
+
+
+def default_dates(month, year):
+    """Invoice on the 1st of the month, due on INVOICE_DUE_DAY (or the month's last day)."""
+    due_day = min(getattr(settings, 'INVOICE_DUE_DAY', 5), calendar.monthrange(year, month)[1])
+    return date(year, month, 1), date(year, month, due_day)
+
+
+def generate_monthly_invoices(month, year, landlord=None, invoice_date=None,
+                              due_date=None, dry_run=False):
+    """
+    Create rent invoices for every occupied unit with an active tenant.
+
+    Works in a fixed number of queries regardless of portfolio size: one for
+    the candidate units, one for units already invoiced this period, one for
+    occupied units without a tenant, then batched INSERTs. Units that already
+    have an invoice for (month, year) are skipped, and the INSERT ignores
+    unique_together conflicts so concurrent runs cannot fail each other.
+
+    Returns a report dict with the created invoices and the skipped units.
+    """
+    default_invoice_date, default_due_date = default_dates(month, year)
+    invoice_date = invoice_date or default_invoice_date
+    due_date = due_date or default_due_date
+
+    profiles = TenantProfile.objects.filter(
+        is_active=True,
+        unit__is_active=True,
+        unit__status=Unit.OCCUPIED,
+    )
+    vacant_occupied = Unit.objects.filter(is_active=True, status=Unit.OCCUPIED).exclude(
+        tenant_profiles__is_active=True,
+    )
+    existing = Invoice.objects.filter(month=month, year=year)
+    if landlord is not None:
+        profiles = profiles.filter(unit__apartment__landlord=landlord)
+        vacant_occupied = vacant_occupied.filter(apartment__landlord=landlord)
+        existing = existing.filter(unit__apartment__landlord=landlord)
+
+    rows = profiles.values(
+        'unit_id', 'user_id', 'unit__base_rent',
+        'unit__apartment__landlord_id', 'unit__apartment__name', 'unit__unit_number',
+    ).order_by('unit_id', '-created_at')
+    invoiced_units = set(existing.values_list('unit_id', flat=True))
+
+    skipped = [
+        {'unit_id': u['id'], 'unit': _unit_display(u['apartment__name'], u['unit_number']),
+         'reason': SKIP_NO_TENANT}
+        for u in vacant_occupied.values('id', 'unit_number', 'apartment__name').order_by('id')
+    ]
+
+    to_create = []
+    seen_units = set()
+    for row in rows:
+        unit_id = row['unit_id']
+        display = _unit_display(row['unit__apartment__name'], row['unit__unit_number'])
+        if unit_id in seen_units:
+            # Most recent active profile wins; report the stale one.
+            skipped.append({'unit_id': unit_id, 'unit': display, 'tenant_id': row['user_id'],
+                            'reason': SKIP_DUPLICATE_TENANT})
+            continue
+        seen_units.add(unit_id)
+        if unit_id in invoiced_units:
+            skipped.append({'unit_id': unit_id, 'unit': display, 'tenant_id': row['user_id'],
+                            'reason': SKIP_EXISTS})
+            continue
+        to_create.append((display, Invoice(
+            unit_id=unit_id,
+            tenant_id=row['user_id'],
+            landlord_id=row['unit__apartment__landlord_id'],
+            month=month,
+            year=year,
+            invoice_date=invoice_date,
+            due_date=due_date,
+            base_rent=row['unit__base_rent'],
+            total_amount=row['unit__base_rent'],
+        )))
+
+    created = []
+    if dry_run:
+        created = [
+            {'invoice_id': None, 'unit_id': inv.unit_id, 'unit': display,
+             'tenant_id': inv.tenant_id, 'total_amount': str(inv.total_amount)}
+            for display, inv in to_create
+        ]
+    elif to_create:
+        with transaction.atomic():
+            Invoice.objects.bulk_create(
+                [inv for _, inv in to_create], batch_size=BATCH_SIZE, ignore_conflicts=True,
+            )
+            recompute_outstanding({inv.tenant_id for _, inv in to_create})
+            invoices_changed.send(sender=Invoice, landlord_ids={inv.landlord_id for _, inv in to_create})
+        # ignore_conflicts means PKs are not returned, so read them back.
+        unit_ids = [inv.unit_id for _, inv in to_create]
+        inserted = {}
+        for start in range(0, len(unit_ids), BATCH_SIZE):
+            inserted.update(
+                (r['unit_id'], r) for r in Invoice.objects.filter(
+                    month=month, year=year, unit_id__in=unit_ids[start:start + BATCH_SIZE],
+                ).values('id', 'unit_id', 'tenant_id', 'total_amount')
+            )
+        for display, inv in to_create:
+            row = inserted.get(inv.unit_id)
+            if row is None or row['tenant_id'] != inv.tenant_id:
+                # Lost a race with another run that billed this unit first.
+                skipped.append({'unit_id': inv.unit_id, 'unit': display,
+                                'tenant_id': inv.tenant_id, 'reason': SKIP_EXISTS})
+                continue
+            created.append({'invoice_id': row['id'], 'unit_id': inv.unit_id, 'unit': display,
+                            'tenant_id': inv.tenant_id, 'total_amount': str(row['total_amount'])})
+
+    return {
+        'month': month,
+        'year': year,
+        'invoice_date': str(invoice_date),
+        'due_date': str(due_date),
+        'dry_run': dry_run,
+        'created_count': len(created),
+        'skipped_count': len(skipped),
+        'created': created,
+        'skipped': skipped,
+    }
@@ -0,0 +1,157 @@
+"""
+Database-backed queue for PDF rendering, so no external broker is needed.
+
+Web requests enqueue a PdfJob and return immediately. ``run_pdf_worker``
+claims queued jobs with ``SELECT ... FOR UPDATE SKIP LOCKED``, which lets
+several workers share the table. It renders them in a process pool of
+PDF_WORKER_CONCURRENCY processes and stores the results in the PDF cache,
+which the download endpoint serves.
+"""
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import pdf_cache
+from .models import Invoice, Payment, PdfJob
+from .pdf_export import get_pool, invoice_filename, render_document
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+
+def load_document(kind, object_id):
+    """Fetch an invoice or payment with everything its PDF needs."""
+    if kind == PdfJob.INVOICE:
+        return Invoice.objects.for_detail().get(pk=object_id)
+    return Payment.objects.select_related(
+        'invoice', 'invoice__unit', 'invoice__unit__apartment', 'invoice__tenant',
+    ).get(pk=object_id)
+
+
+def enqueue(kind, obj, user):
+    """
+    Queue a render of ``obj`` for ``user``. A pending or finished job for the
+    same document version is reused, so repeated clicks do not pile up work.
+    """
+    fingerprint = pdf_cache.fingerprint(kind, obj)
+    existing = PdfJob.objects.filter(
+        kind=kind, object_id=obj.pk, fingerprint=fingerprint, requested_by=user,
+        status__in=[PdfJob.QUEUED, PdfJob.RUNNING, PdfJob.DONE],
+    ).order_by('-created_at').first()
+    if existing is not None and (existing.status != PdfJob.DONE or os.path.exists(existing.file_path)):
+        return existing
+    filename = invoice_filename(obj) if kind == PdfJob.INVOICE else f'receipt-{obj.pk}.pdf'
+    return PdfJob.objects.create(
+        kind=kind, object_id=obj.pk, fingerprint=fingerprint,
+        requested_by=user, filename=filename,
+    )
+
+
+def claim(limit):
+    """Mark up to ``limit`` queued jobs as running and return them."""
+    with transaction.atomic():
+        jobs = list(
+            PdfJob.objects.select_for_update(skip_locked=True)
+            .filter(status=PdfJob.QUEUED).order_by('created_at')[:limit]
+        )
+        now = timezone.now()
+        for job in jobs:
+            job.status = PdfJob.RUNNING
+            job.started_at = now
+            job.attempts += 1
+        PdfJob.objects.bulk_update(jobs, ['status', 'started_at', 'attempts'])
+    return jobs
+
+
+def _finish(job, path=None, error=''):
+    job.finished_at = timezone.now()
+    if path is not None:
+        job.status = PdfJob.DONE
+        job.file_path = str(path)
+    elif job.attempts < MAX_ATTEMPTS:
+        job.status = PdfJob.QUEUED
+    else:
+        job.status = PdfJob.FAILED
+    job.error = error
+    job.save(update_fields=['status', 'file_path', 'error', 'finished_at'])
+
+
+def process(jobs, concurrency):
+    """Render claimed jobs, using the cache where possible and the pool otherwise."""
+    pool = get_pool(concurrency) if concurrency else None
+    pending = []
+    for job in jobs:
+        try:
+            obj = load_document(job.kind, job.object_id)
+        except (Invoice.DoesNotExist, Payment.DoesNotExist):
+            job.attempts = MAX_ATTEMPTS
+            _finish(job, error='Document no longer exists.')
+            continue
+        fingerprint = pdf_cache.fingerprint(job.kind, obj)
+        path = pdf_cache.lookup(job.kind, job.object_id, fingerprint)
+        if path is not None:
+            _finish(job, path)
+        elif pool is None:
+            pending.append((job, fingerprint, None, obj))
+        else:
+            pending.append((job, fingerprint, pool.submit(render_document, job.kind, obj), obj))
+
+    for job, fingerprint, future, obj in pending:
+        try:
+            pdf_bytes = future.result() if future else render_document(job.kind, obj)
+            _finish(job, pdf_cache.store(job.kind, job.object_id, fingerprint, pdf_bytes))
+        except Exception as exc:
+            logger.exception('PDF job %s failed', job.pk)
+            _finish(job, error=str(exc))
+
+
+def requeue_stale(timeout=None):
+    """
+    Put jobs left running by a crashed worker back on the queue, or fail
+    them once they have used up MAX_ATTEMPTS, so that a document that kills
+    its worker is not retried forever.
+    """
+    timeout = timeout or settings.PDF_JOB_TIMEOUT
+    now = timezone.now()
+    stale = PdfJob.objects.filter(status=PdfJob.RUNNING, started_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=PdfJob.FAILED, finished_at=now,
+        error=f'The worker stopped while rendering; gave up after {MAX_ATTEMPTS} attempts.',
+    )
+    return failed + stale.update(status=PdfJob.QUEUED)
+
+
+def cleanup(retention=None):
+    """Delete finished and failed jobs older than the retention window."""
+    retention = retention or settings.PDF_JOB_RETENTION
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    deleted, _ = PdfJob.objects.filter(
+        status__in=[PdfJob.DONE, PdfJob.FAILED], created_at__lt=cutoff,
+    ).delete()
+    return deleted
+
+
+def run_worker(concurrency=None, poll_interval=1.0, once=False):
+    """Claim and process jobs until stopped (or the queue is empty, with ``once``)."""
+    concurrency = settings.PDF_WORKER_CONCURRENCY if concurrency is None else concurrency
+    batch = max(concurrency, 1) * 2
+    last_housekeeping = 0.0
+    while True:
+        if time.monotonic() - last_housekeeping > 60:
+            requeue_stale()
+            cleanup()
+            last_housekeeping = time.monotonic()
+        jobs = claim(batch)
+        if jobs:
+            process(jobs, concurrency)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
+        close_old_connections()
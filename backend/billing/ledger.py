@@ -0,0 +1,42 @@
+"""
+Maintenance of the denormalized ``TenantProfile.outstanding_balance``.
+
+Callers must invoke these inside the same transaction as the invoice or
+payment write they account for, so the stored balance never drifts from the
+invoices it summarises.
+"""
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from properties.models import TenantProfile
+
+from .models import MONEY, ZERO, Invoice, remaining_balance_expr
+
+CHUNK_SIZE = 500
+
+
+def outstanding_subquery():
+    """Correlated subquery: sum of remaining balances for the outer profile's user."""
+    totals = Invoice.objects.filter(tenant_id=OuterRef('user_id')).order_by().values(
+        'tenant_id',
+    ).annotate(total=Sum(remaining_balance_expr())).values('total')
+    return Coalesce(Subquery(totals, output_field=MONEY), ZERO)
+
+
+def adjust_outstanding(tenant_id, delta):
+    """Add ``delta`` to a tenant's stored balance with a single atomic UPDATE."""
+    if delta:
+        TenantProfile.objects.filter(user_id=tenant_id).update(
+            outstanding_balance=F('outstanding_balance') + delta,
+        )
+
+
+def recompute_outstanding(tenant_ids):
+    """Recompute stored balances from the invoices, one UPDATE per chunk."""
+    tenant_ids = list(tenant_ids)
+    updated = 0
+    for start in range(0, len(tenant_ids), CHUNK_SIZE):
+        updated += TenantProfile.objects.filter(
+            user_id__in=tenant_ids[start:start + CHUNK_SIZE],
+        ).update(outstanding_balance=outstanding_subquery())
+    return updated
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from billing.mpesa import requeue_unmatched, run_applier
+
+
+class Command(BaseCommand):
+    help = 'Apply queued payment-provider callbacks (M-Pesa) to invoices in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events per transaction (default: MPESA_APPLIER_BATCH_SIZE).')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new events instead of exiting when the queue is empty.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty (with --loop).')
+        parser.add_argument('--retry-unmatched', action='store_true',
+                            help='First requeue events that matched no invoice (e.g. paid before '
+                                 'the month was invoiced).')
+
+    def handle(self, *args, **options):
+        if options['retry_unmatched']:
+            self.stdout.write(f'Requeued {requeue_unmatched()} unmatched event(s).')
+        counts = run_applier(
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            once=not options['loop'],
+        )
+        summary = ', '.join(f'{n} {state}' for state, n in sorted(counts.items())) or 'nothing pending'
+        self.stdout.write(self.style.SUCCESS(f'Processed payment events: {summary}.'))
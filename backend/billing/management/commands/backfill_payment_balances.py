@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from billing.conditional import bump_related_version
+from billing.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Fill in Payment.balance_after (running invoice balance) for existing payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of invoices recomputed per transaction.')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every payment, not just rows with no stored balance.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        payments = Payment.objects.all()
+        if not options['all']:
+            payments = payments.filter(balance_after__isnull=True)
+        invoice_ids = list(
+            payments.order_by('invoice_id').values_list('invoice_id', flat=True).distinct()
+        )
+
+        updated = 0
+        for start in range(0, len(invoice_ids), chunk_size):
+            chunk = invoice_ids[start:start + chunk_size]
+            # The window needs every payment of each invoice, so select whole invoices.
+            rows = Payment.objects.filter(invoice_id__in=chunk).with_running_balance().values_list(
+                'id', 'running_balance',
+            )
+            batch = [Payment(id=pk, balance_after=balance) for pk, balance in rows]
+            with transaction.atomic():
+                Payment.objects.bulk_update(batch, ['balance_after'], batch_size=chunk_size)
+            updated += len(batch)
+            self.stdout.write(f'  {min(start + chunk_size, len(invoice_ids))}/{len(invoice_ids)} invoices')
+        if updated:
+            bump_related_version()  # the payment lists show balance_after
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated balance_after on {updated} payment(s) across {len(invoice_ids)} invoice(s).'
+        ))
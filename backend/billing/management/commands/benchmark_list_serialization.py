@@ -0,0 +1,127 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.renderers import JSONRenderer
+
+from billing.list_values import InvoiceListValues, PaymentValues
+from billing.models import Invoice, Payment
+from billing.sample_data import create_portfolio
+from billing.serializers import InvoiceListSerializer, PaymentSerializer
+from rental_system.fieldsets import load_related
+from reports.exports import CHUNK_SIZE
+from reports.views import _payment_rows
+
+MONTHS = 12
+UNITS_PER_APARTMENT = 100
+
+
+def _payment_rows_in_python(qs):
+    """payment_report rows with the display strings built in Python, as before list_values."""
+    method_labels = dict(Payment.METHOD_CHOICES)
+    values = qs.order_by('-payment_date').values(
+        'id', 'payment_date', 'amount', 'method', 'reference_number', 'invoice_id',
+        'invoice__tenant__first_name', 'invoice__tenant__last_name',
+        'invoice__unit__unit_number', 'invoice__unit__apartment__name',
+    )
+    for p in values.iterator(chunk_size=CHUNK_SIZE):
+        apartment = p['invoice__unit__apartment__name']
+        yield {
+            'id': p['id'],
+            'date': str(p['payment_date']),
+            'tenant': f"{p['invoice__tenant__first_name']} {p['invoice__tenant__last_name']}".strip(),
+            'unit': f"{apartment} – {p['invoice__unit__unit_number']}",
+            'apartment': apartment,
+            'amount': str(p['amount']),
+            'method': method_labels.get(p['method'], p['method']),
+            'reference': p['reference_number'],
+            'invoice_id': p['invoice_id'],
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the invoice list, payment list and payment report serialization: the '
+        'model serializers (and Python-built report strings) against the values() path '
+        'in billing.list_values, on a synthetic portfolio of each size (rolled back '
+        'afterwards). That both produce the same JSON is checked by billing.tests.ListValuesTests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000,100000',
+                            help='Comma-separated invoice counts to benchmark.')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per path (best is kept).')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def _best(self, call, repeat):
+        best, body = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = call()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    def _cases(self, landlord_id):
+        invoices = Invoice.objects.filter(landlord_id=landlord_id).with_effective_status()
+        payments = Payment.objects.filter(invoice__landlord_id=landlord_id)
+        render = JSONRenderer().render
+
+        def serializer(serializer_class, qs):
+            return lambda: render(serializer_class(load_related(qs, serializer_class, None), many=True).data)
+
+        def values(values_class, qs):
+            return lambda: render(values_class().serialize(values_class().queryset(qs).iterator(chunk_size=2000)))
+
+        return {
+            'invoice list': (serializer(InvoiceListSerializer, invoices), values(InvoiceListValues, invoices)),
+            'payment list': (serializer(PaymentSerializer, payments), values(PaymentValues, payments)),
+            'payment report': (lambda: render(list(_payment_rows_in_python(payments))),
+                               lambda: render(list(_payment_rows(payments)))),
+        }
+
+    def _run(self, rows, repeat):
+        tenants = max(1, rows // MONTHS)
+        ids = create_portfolio(
+            f'listbench-{rows}', apartments=-(-tenants // UNITS_PER_APARTMENT),
+            units_per_apartment=UNITS_PER_APARTMENT, months=MONTHS, tenants=tenants,
+        )
+        results = {}
+        for label, (before, after) in self._cases(ids['landlord']).items():
+            before_s, _ = self._best(before, repeat)
+            after_s, after_body = self._best(after, repeat)
+            count = len(ids['payments'] if label.startswith('payment') else ids['invoices'])
+            results[label] = {
+                'rows': count,
+                'bytes': len(after_body),
+                'serializer_rows_per_s': round(count / before_s),
+                'values_rows_per_s': round(count / after_s),
+                'speedup': round(before_s / after_s, 2),
+            }
+        return results
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(n) for n in options['rows'].split(',') if n.strip()]
+        except ValueError:
+            raise CommandError('--rows takes comma-separated integers.')
+        if not sizes or min(sizes) < 1 or options['repeat'] < 1:
+            raise CommandError('--rows and --repeat must be positive.')
+
+        report = {'database': connection.vendor, 'sizes': {}}
+        for rows in sizes:
+            with transaction.atomic():
+                report['sizes'][rows] = self._run(rows, options['repeat'])
+                transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'invoices':>9}  {'case':<15}{'rows':>8}{'serializer/s':>14}{'values/s':>11}{'speedup':>9}")
+        for rows, results in report['sizes'].items():
+            for label, r in results.items():
+                self.stdout.write(
+                    f"{rows:>9}  {label:<15}{r['rows']:>8}{r['serializer_rows_per_s']:>14}"
+                    f"{r['values_rows_per_s']:>11}{r['speedup']:>8}x"
+                )
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from billing.endpoint_suite import (
+    BUDGET_SCALES, ENDPOINTS, EndpointSuite, quiet_request_logs, settings_overrides, uncovered_url_names,
+)
+from billing.sample_data import create_portfolio
+from rental_system.query_budget import track_queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Exercise every billing, properties and reports endpoint against a small and a '
+        'larger sample portfolio (rolled back afterwards) and fail if any endpoint exceeds '
+        'its query budget or makes more queries as the data grows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+        parser.add_argument('--verbose-sql', action='store_true',
+                            help='Print the SQL of endpoints that fail.')
+
+    def _run(self, suite):
+        results = []
+        for endpoint in ENDPOINTS:
+            label, _, _, name, _, _, budget = endpoint
+            with track_queries(capture=True) as stats:
+                response = suite.request(endpoint)  # streamed bodies are read inside the block
+            if response.status_code >= 500 or response.status_code in (401, 403):
+                raise CommandError(f'{label}: unexpected HTTP {response.status_code}')
+            results.append((label, name, budget, stats))
+        return results
+
+    def handle(self, *args, **options):
+        missing = uncovered_url_names()
+        if missing:
+            raise CommandError(f'No query budget declared for: {", ".join(sorted(missing))}')
+
+        runs = {}
+        with quiet_request_logs(), override_settings(**settings_overrides('qb-large')), transaction.atomic():
+            for run, scale in BUDGET_SCALES.items():
+                ids = create_portfolio(f'qb-{run}', **scale)
+                runs[run] = self._run(EndpointSuite(ids, run))
+            transaction.set_rollback(True)
+
+        rows = []
+        failures = []
+        for (label, name, budget, small), (_, _, _, large) in zip(runs['small'], runs['large']):
+            problems = []
+            if large.count > budget:
+                problems.append(f'over budget ({large.count} > {budget})')
+            if large.count > small.count:
+                problems.append(f'grows with data ({small.count} -> {large.count})')
+            rows.append({'endpoint': label, 'url_name': name, 'budget': budget,
+                         'small': small.count, 'large': large.count,
+                         'ok': not problems, 'problems': problems})
+            if problems:
+                failures.append((label, problems, large))
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+        else:
+            for row in rows:
+                mark = 'ok  ' if row['ok'] else 'FAIL'
+                self.stdout.write(
+                    f"{mark} {row['endpoint']:<28} {row['small']:>3} / {row['large']:>3} "
+                    f"(budget {row['budget']}) {'; '.join(row['problems'])}"
+                )
+        if options['verbose_sql']:
+            for label, _, stats in failures:
+                self.stdout.write(f'\n-- {label}')
+                for sql in stats.statements:
+                    self.stdout.write(f'   {sql}')
+        if failures:
+            raise CommandError(f'{len(failures)} endpoint(s) over their query budget.')
+        self.stdout.write(self.style.SUCCESS(f'All {len(rows)} endpoint checks within budget.'))
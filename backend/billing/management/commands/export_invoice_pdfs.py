@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.models import Invoice
+from billing.pdf_export import iter_invoice_zip
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Render invoice PDFs in a process pool and write them to a ZIP archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP file to write.')
+        parser.add_argument('--landlord', help='Username or id of a single landlord (default: all).')
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--apartment', type=int)
+        parser.add_argument('--status')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: PDF_EXPORT_WORKERS; 0 renders inline).')
+
+    def handle(self, *args, **options):
+        qs = Invoice.objects.with_effective_status()
+        if options['landlord']:
+            lookup = options['landlord']
+            landlords = User.objects.filter(role=User.LANDLORD)
+            landlord = (landlords.filter(pk=lookup) if lookup.isdigit()
+                        else landlords.filter(username=lookup)).first()
+            if landlord is None:
+                raise CommandError(f'Landlord "{lookup}" not found.')
+            qs = qs.filter(landlord=landlord)
+        if options['month']:
+            qs = qs.filter(month=options['month'])
+        if options['year']:
+            qs = qs.filter(year=options['year'])
+        if options['apartment']:
+            qs = qs.filter(unit__apartment_id=options['apartment'])
+        if options['status']:
+            qs = qs.filter(effective_status=options['status'])
+        qs = qs.for_detail()
+
+        count = qs.count()
+        with open(options['output'], 'wb') as fh:
+            for chunk in iter_invoice_zip(qs.iterator(chunk_size=100), workers=options['workers']):
+                fh.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} invoice PDF(s) to {options['output']}."))
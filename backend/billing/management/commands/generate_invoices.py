@@ -0,0 +1,54 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.invoicing import generate_monthly_invoices
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Generate monthly rent invoices for every occupied unit with an active tenant.'
+
+    def add_arguments(self, parser):
+        today = date.today()
+        parser.add_argument('--month', type=int, default=today.month)
+        parser.add_argument('--year', type=int, default=today.year)
+        parser.add_argument('--landlord', help='Username or id of a single landlord (default: all).')
+        parser.add_argument('--invoice-date', type=date.fromisoformat)
+        parser.add_argument('--due-date', type=date.fromisoformat)
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON.')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['month'] <= 12:
+            raise CommandError('--month must be between 1 and 12.')
+
+        landlord = None
+        if options['landlord']:
+            lookup = options['landlord']
+            qs = User.objects.filter(role=User.LANDLORD)
+            landlord = (qs.filter(pk=lookup) if lookup.isdigit() else qs.filter(username=lookup)).first()
+            if landlord is None:
+                raise CommandError(f'Landlord "{lookup}" not found.')
+
+        report = generate_monthly_invoices(
+            month=options['month'],
+            year=options['year'],
+            landlord=landlord,
+            invoice_date=options['invoice_date'],
+            due_date=options['due_date'],
+            dry_run=options['dry_run'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for entry in report['skipped']:
+            self.stdout.write(f"  skipped {entry['unit']}: {entry['reason']}")
+        verb = 'Would create' if report['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['created_count']} invoice(s) for {report['month']}/{report['year']}, "
+            f"skipped {report['skipped_count']}."
+        ))
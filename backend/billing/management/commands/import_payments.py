@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.models import Payment
+from billing.payment_import import BATCH_SIZE, ImportFileError, import_payments
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Import payments from a bank / M-Pesa statement CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to the statement CSV.')
+        parser.add_argument('--landlord', required=True, help='Username or id of the landlord.')
+        parser.add_argument('--method', required=True, choices=[c for c, _ in Payment.METHOD_CHOICES])
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON.')
+
+    def handle(self, *args, **options):
+        lookup = options['landlord']
+        qs = User.objects.filter(role=User.LANDLORD)
+        landlord = (qs.filter(pk=lookup) if lookup.isdigit() else qs.filter(username=lookup)).first()
+        if landlord is None:
+            raise CommandError(f'Landlord "{lookup}" not found.')
+
+        try:
+            with open(options['file'], 'rb') as fh:
+                report = import_payments(
+                    fh, landlord=landlord, method=options['method'],
+                    dry_run=options['dry_run'], batch_size=options['batch_size'],
+                )
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for entry in report['skipped']:
+            self.stdout.write(f"  row {entry['row']} ({entry['reference'] or 'no reference'}): {entry['reason']}")
+        verb = 'Would import' if report['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['created_count']} of {report['rows']} payment(s) "
+            f"totalling {report['total_amount']} across {report['invoices_updated']} invoice(s), "
+            f"skipped {report['skipped_count']}."
+        ))
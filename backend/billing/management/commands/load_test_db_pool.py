@@ -0,0 +1,110 @@
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from rental_system.db_pool import POOLED_ENGINES, get_pool
+
+DEFAULT_QUERY = 'SELECT id, status, total_amount FROM billing_invoice ORDER BY id DESC LIMIT 20'
+
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the default database the way requests use it: connect, run a query, '
+        'close. Each of --concurrency threads makes its share of --requests, once with '
+        'direct connections and once through the connection pool, and the latencies '
+        'of both are reported.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Simulated requests per mode.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Threads making requests.')
+        parser.add_argument('--pool-size', type=int, help='Pool size (default: DB_POOL_SIZE or 10).')
+        parser.add_argument('--query', default=DEFAULT_QUERY, help='SQL run once per simulated request.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def _engines(self):
+        engine = connections['default'].settings_dict['ENGINE']
+        direct = {pooled: plain for plain, pooled in POOLED_ENGINES.items()}.get(engine, engine)
+        if direct not in POOLED_ENGINES:
+            raise CommandError(f'No pooled backend for {engine}.')
+        return direct, POOLED_ENGINES[direct]
+
+    def _run(self, label, engine, settings_dict, options):
+        backend = load_backend(engine)
+        local = threading.local()
+        alias = f'load-test-{label}'
+
+        def request(_):
+            wrapper = getattr(local, 'wrapper', None)
+            if wrapper is None:
+                wrapper = local.wrapper = backend.DatabaseWrapper(settings_dict, alias)
+            start = time.perf_counter()
+            wrapper.ensure_connection()
+            with wrapper.cursor() as cursor:
+                cursor.execute(options['query'])
+                cursor.fetchall()
+            wrapper.close()
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(request, range(options['concurrency'])))  # warm-up (and fill the pool)
+            started = time.perf_counter()
+            latencies = [t * 1000 for t in executor.map(request, range(options['requests']))]
+            elapsed = time.perf_counter() - started
+
+        result = {
+            'per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(_percentile(latencies, 0.50), 2),
+            'p95_ms': round(_percentile(latencies, 0.95), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'max_ms': round(max(latencies), 2),
+        }
+        if 'POOL' in settings_dict:
+            pool = get_pool(alias, settings_dict['POOL'])
+            result['connections_opened'] = pool.opened
+            pool.close_idle()
+        else:
+            result['connections_opened'] = options['requests'] + options['concurrency']
+        return result
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+        direct, pooled = self._engines()
+        base = {**connections['default'].settings_dict, 'CONN_MAX_AGE': 0}
+        pool_options = dict(base.pop('POOL', None) or {})
+        if options['pool_size']:
+            pool_options['SIZE'] = options['pool_size']
+
+        report = {
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'pool_size': pool_options.get('SIZE', 10),
+            'direct': self._run('direct', direct, {**base, 'ENGINE': direct}, options),
+            'pooled': self._run('pooled', pooled, {**base, 'ENGINE': pooled, 'POOL': pool_options}, options),
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"{report['requests']} requests, {report['concurrency']} threads, pool size {report['pool_size']}"
+        )
+        self.stdout.write(f"{'mode':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'opened':>8}")
+        for mode in ('direct', 'pooled'):
+            r = report[mode]
+            self.stdout.write(
+                f"{mode:<8}{r['per_second']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+                f"{r['p99_ms']:>9}{r['max_ms']:>9}{r['connections_opened']:>8}"
+            )
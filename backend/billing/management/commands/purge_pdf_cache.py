@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from billing import pdf_cache
+
+
+class Command(BaseCommand):
+    help = 'Delete cached invoice/receipt PDFs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, metavar='DAYS',
+                            help='Only delete entries not downloaded in this many days.')
+        parser.add_argument('--trim', action='store_true',
+                            help='Only evict least-recently-used entries down to PDF_CACHE_MAX_MB.')
+
+    def handle(self, *args, **options):
+        if options['trim']:
+            removed = pdf_cache.evict()
+        elif options['older_than'] is not None:
+            removed = pdf_cache.purge(older_than=options['older_than'] * 86400)
+        else:
+            removed = pdf_cache.purge()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} cached PDF(s).'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from billing.ledger import outstanding_subquery
+from properties.models import TenantProfile
+
+
+class Command(BaseCommand):
+    help = 'Verify and rebuild the stored TenantProfile.outstanding_balance from invoices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--verify', action='store_true',
+                            help='Report mismatched balances without writing.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        profiles = TenantProfile.objects.annotate(expected=outstanding_subquery())
+        last_pk = 0
+        mismatched = 0
+        fixed = 0
+        while True:
+            pks = list(
+                TenantProfile.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            stale = profiles.filter(pk__in=pks).exclude(outstanding_balance=F('expected'))
+            if options['verify']:
+                for row in stale.values('pk', 'user__username', 'outstanding_balance', 'expected'):
+                    self.stdout.write(
+                        f"  {row['user__username']}: stored {row['outstanding_balance']}, "
+                        f"expected {row['expected']}"
+                    )
+                    mismatched += 1
+            else:
+                stale_pks = list(stale.values_list('pk', flat=True))
+                mismatched += len(stale_pks)
+                fixed += TenantProfile.objects.filter(pk__in=stale_pks).update(
+                    outstanding_balance=outstanding_subquery(),
+                )
+
+        if options['verify']:
+            style = self.style.WARNING if mismatched else self.style.SUCCESS
+            self.stdout.write(style(f'{mismatched} tenant balance(s) out of date.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {fixed} tenant balance(s).'))
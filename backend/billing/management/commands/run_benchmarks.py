@@ -0,0 +1,203 @@
+import json
+import math
+import platform
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from billing.endpoint_suite import ENDPOINTS, EndpointSuite, quiet_request_logs, settings_overrides
+from billing.models import Invoice, Payment
+from billing.pdf_utils import generate_invoice_pdf, generate_receipt_pdf
+from billing.sample_data import create_portfolios
+from rental_system.query_budget import track_queries
+
+# Portfolio sizes; apartments are per landlord and units per apartment. The
+# endpoints are called as the first landlord (and that landlord's first tenant).
+SCALES = {
+    'small': {'landlords': 1, 'apartments': 1, 'units_per_apartment': 8, 'months': 3},
+    'medium': {'landlords': 3, 'apartments': 4, 'units_per_apartment': 25, 'months': 6},
+    'large': {'landlords': 5, 'apartments': 10, 'units_per_apartment': 40, 'months': 12},
+}
+
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every API endpoint (through the test client) and the PDF generators '
+        'against synthetic portfolios at several scales, rolled back afterwards. Reports '
+        'p50/p95 latency, queries and peak Python memory per call, and compares them '
+        'with a baseline written by an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='small,medium',
+                            help=f'Comma-separated scales to run ({", ".join(SCALES)}).')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per endpoint.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed calls per endpoint first.')
+        parser.add_argument('--endpoint', action='append', default=[],
+                            help='Only run endpoints whose label contains this text (repeatable).')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare with the JSON results of an earlier run.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 / memory increase over the baseline, as a fraction.')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Ignore p95 increases smaller than this (timer noise).')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    # ── measuring ──────────────────────────────────────────────────────────────
+
+    def _measure(self, call, repeat, warmup):
+        for _ in range(warmup):
+            call()
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            with track_queries() as stats:
+                start = time.perf_counter()
+                result = call()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, stats.count)
+        # Measured separately: tracing allocations slows every call down.
+        tracemalloc.start()
+        try:
+            call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result, {
+            'p50_ms': round(_percentile(timings, 0.50), 2),
+            'p95_ms': round(_percentile(timings, 0.95), 2),
+            'queries': queries,
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def _run_scale(self, scale, options):
+        portfolios = create_portfolios(f'bench-{scale}', **SCALES[scale])
+        ids = portfolios[0]
+        suite = EndpointSuite(ids, scale)
+        counter = iter(range(10 ** 9))
+        results = {}
+
+        for endpoint in ENDPOINTS:
+            label, _, _, name = endpoint[:4]
+            if options['endpoint'] and not any(text in label for text in options['endpoint']):
+                continue
+            response, stats = self._measure(
+                lambda: suite.request(endpoint, next(counter)), options['repeat'], options['warmup'],
+            )
+            if response.status_code >= 500 or response.status_code in (401, 403):
+                raise CommandError(f'{scale} / {label}: unexpected HTTP {response.status_code}')
+            results[label] = {'url_name': name, 'status': response.status_code, **stats}
+
+        invoice = Invoice.objects.for_detail().get(pk=ids['invoices'][0])
+        payment = Payment.objects.select_related(
+            'invoice__unit__apartment', 'invoice__tenant', 'recorded_by',
+        ).get(pk=ids['payments'][0])
+        for label, render in (('pdf: invoice', lambda: generate_invoice_pdf(invoice)),
+                              ('pdf: receipt', lambda: generate_receipt_pdf(payment))):
+            if options['endpoint'] and not any(text in label for text in options['endpoint']):
+                continue
+            _, stats = self._measure(render, options['repeat'], options['warmup'])
+            results[label] = {'url_name': None, 'status': None, **stats}
+
+        portfolio = {'landlords': len(portfolios)}
+        for key in ('apartments', 'units', 'tenants', 'invoices', 'payments'):
+            portfolio[key] = sum(len(p[key]) for p in portfolios)
+        return {'portfolio': portfolio, 'results': results}
+
+    # ── comparing ──────────────────────────────────────────────────────────────
+
+    def _compare(self, report, baseline, tolerance, min_delta_ms):
+        """Regressions against ``baseline`` as (scale, label, message) tuples."""
+        regressions = []
+        for scale, data in report['scales'].items():
+            base_results = baseline.get('scales', {}).get(scale, {}).get('results', {})
+            for label, current in data['results'].items():
+                base = base_results.get(label)
+                if base is None:
+                    continue
+                current['baseline_p95_ms'] = base['p95_ms']
+                if (current['p95_ms'] > base['p95_ms'] * (1 + tolerance)
+                        and current['p95_ms'] - base['p95_ms'] >= min_delta_ms):
+                    regressions.append((scale, label, f"p95 {base['p95_ms']} -> {current['p95_ms']} ms"))
+                if current['queries'] > base['queries']:
+                    regressions.append((scale, label, f"queries {base['queries']} -> {current['queries']}"))
+                if current['peak_kib'] > base['peak_kib'] * (1 + tolerance) + 64:
+                    regressions.append((scale, label, f"peak {base['peak_kib']} -> {current['peak_kib']} KiB"))
+        return regressions
+
+    def handle(self, *args, **options):
+        scales = [s.strip() for s in options['scales'].split(',') if s.strip()]
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise CommandError(f'Unknown scale(s): {", ".join(sorted(unknown))}.')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read baseline: {exc}')
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'warmup': options['warmup'],
+            },
+            'scales': {},
+        }
+        for scale in scales:
+            started = time.perf_counter()
+            with quiet_request_logs(), override_settings(**settings_overrides(f'bench-{scale}-1')), transaction.atomic():
+                report['scales'][scale] = self._run_scale(scale, options)
+                transaction.set_rollback(True)
+            if not options['json']:
+                self.stderr.write(f'{scale}: done in {time.perf_counter() - started:.1f}s')
+
+        regressions = []
+        if baseline is not None:
+            regressions = self._compare(report, baseline, options['tolerance'], options['min_delta_ms'])
+            report['regressions'] = [
+                {'scale': scale, 'endpoint': label, 'detail': detail} for scale, label, detail in regressions
+            ]
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for scale, data in report['scales'].items():
+                sizes = ', '.join(f'{v} {k}' for k, v in data['portfolio'].items())
+                self.stdout.write(f'\n{scale} ({sizes})')
+                self.stdout.write(f"  {'endpoint':<28} {'p50 ms':>8} {'p95 ms':>8} {'queries':>7} "
+                                  f"{'peak KiB':>9} {'base p95':>9}")
+                for label, row in data['results'].items():
+                    base = row.get('baseline_p95_ms', '')
+                    self.stdout.write(
+                        f"  {label:<28} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['queries']:>7} "
+                        f"{row['peak_kib']:>9} {base:>9}"
+                    )
+            for scale, label, detail in regressions:
+                self.stdout.write(self.style.WARNING(f'REGRESSION {scale} / {label}: {detail}'))
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}.')
+        if baseline is not None and not options['json']:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
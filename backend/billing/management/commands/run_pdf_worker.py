@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from billing import jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued PDF render jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Render processes (default: PDF_WORKER_CONCURRENCY; 0 renders inline).')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Only delete jobs older than PDF_JOB_RETENTION and exit.')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted = jobs.cleanup()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} old PDF job(s).'))
+            return
+        self.stdout.write('PDF worker started.')
+        jobs.run_worker(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+        )
@@ -0,0 +1,58 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from billing.sample_data import PASSWORD, create_portfolios
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Create synthetic landlords with apartments, units, tenants and months of invoices, '
+        'line items and payments, using bulk inserts. Sizes are per landlord '
+        '(apartments per landlord, units per apartment, tenants per landlord).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='demo', help='Landlords are named <prefix>-1, <prefix>-2, ...')
+        parser.add_argument('--landlords', type=int, default=1)
+        parser.add_argument('--apartments', type=int, default=2, help='Apartments per landlord.')
+        parser.add_argument('--units', type=int, default=10, help='Units per apartment.')
+        parser.add_argument('--tenants', type=int,
+                            help='Occupied units per landlord (default: 75%% of the units).')
+        parser.add_argument('--months', type=int, default=6, help='Months of invoices, ending this month.')
+        parser.add_argument('--json', action='store_true', help='Print the created ids as JSON.')
+
+    def handle(self, *args, **options):
+        for name in ('landlords', 'apartments', 'units', 'months'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1.')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users named "{prefix}-..." already exist; choose another --prefix.')
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            portfolios = create_portfolios(
+                prefix,
+                landlords=options['landlords'],
+                apartments=options['apartments'],
+                units_per_apartment=options['units'],
+                tenants=options['tenants'],
+                months=options['months'],
+            )
+        elapsed = time.perf_counter() - start
+
+        if options['json']:
+            self.stdout.write(json.dumps(portfolios))
+            return
+        totals = {key: sum(len(p[key]) for p in portfolios)
+                  for key in ('apartments', 'units', 'tenants', 'invoices', 'payments')}
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(portfolios)} landlord(s), {totals['apartments']} apartments, "
+            f"{totals['units']} units, {totals['tenants']} tenants, {totals['invoices']} invoices "
+            f"and {totals['payments']} payments in {elapsed:.1f}s."
+        ))
+        self.stdout.write(f'Log in as {prefix}-1 (or any tenant, e.g. {prefix}-1-t1) with password "{PASSWORD}".')
@@ -0,0 +1,83 @@
+import json
+import random
+import statistics
+import string
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Local stand-in for the M-Pesa C2B service: post synthetic confirmation callbacks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Callback URL, e.g. http://localhost:8000/api/mpesa/callback/<token>/')
+        parser.add_argument('--shortcode', required=True)
+        parser.add_argument('--count', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--account', action='append', default=[],
+                            help='BillRefNumber to use (repeatable; picked at random).')
+        parser.add_argument('--msisdn', action='append', default=[],
+                            help='Payer phone number to use (repeatable; picked at random).')
+        parser.add_argument('--amount', type=str, default='1000.00')
+        parser.add_argument('--duplicates', type=float, default=0.0,
+                            help='Fraction of callbacks re-sent with an already used TransID.')
+
+    def _payload(self, options, trans_id):
+        return {
+            'TransactionType': 'Pay Bill',
+            'TransID': trans_id,
+            'TransTime': time.strftime('%Y%m%d%H%M%S'),
+            'TransAmount': options['amount'],
+            'BusinessShortCode': options['shortcode'],
+            'BillRefNumber': random.choice(options['account'] or ['']),
+            'InvoiceNumber': '',
+            'OrgAccountBalance': '',
+            'ThirdPartyTransID': '',
+            'MSISDN': random.choice(options['msisdn'] or ['254700000000']),
+            'FirstName': 'Test',
+        }
+
+    def _post(self, url, payload):
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                code = response.status
+        except urllib.error.HTTPError as exc:
+            code = exc.code
+        return code, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError('--count must be positive.')
+        ids = []
+        payloads = []
+        for _ in range(options['count']):
+            if ids and random.random() < options['duplicates']:
+                trans_id = random.choice(ids)
+            else:
+                trans_id = 'SIM' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=7))
+                ids.append(trans_id)
+            payloads.append(self._payload(options, trans_id))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(lambda p: self._post(options['url'], p), payloads))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(t * 1000 for _, t in results)
+        failures = sum(1 for code, _ in results if code != 200)
+        self.stdout.write(json.dumps({
+            'sent': len(results),
+            'failed': failures,
+            'per_second': round(len(results) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            'max_ms': round(latencies[-1], 2),
+        }, indent=2))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.overdue import run_daily_sweep
+
+
+class Command(BaseCommand):
+    help = 'Mark unpaid/partial invoices past their due date as overdue (once per local day).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timezone', default=None,
+                            help='Timezone whose local date is used (default: OVERDUE_SWEEP_TIMEZONE).')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--force', action='store_true', help='Sweep even if today already ran.')
+
+    def handle(self, *args, **options):
+        try:
+            run = run_daily_sweep(
+                tz_name=options['timezone'],
+                force=options['force'],
+                chunk_size=options['chunk_size'],
+            )
+        except KeyError as exc:
+            raise CommandError(f'Unknown timezone: {exc}')
+        if run is None:
+            self.stdout.write('Already swept (or sweeping) today; use --force to run again.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {run.swept} invoice(s) overdue for {run.run_date} ({run.timezone}).'
+        ))
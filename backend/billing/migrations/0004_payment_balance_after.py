@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_overduesweep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='balance_after',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_payment_balance_after'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['landlord', 'year', 'month', 'created_at', 'id'], name='invoice_landlord_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['tenant', 'year', 'month', 'created_at', 'id'], name='invoice_tenant_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date', 'created_at', 'id'], name='payment_order_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_pdfjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['reference_number'], name='payment_reference_idx'),
+        ),
+    ]
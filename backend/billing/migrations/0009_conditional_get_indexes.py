@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_paymentevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['landlord', 'updated_at'], name='invoice_landlord_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['tenant', 'updated_at'], name='invoice_tenant_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['invoice', 'created_at', 'id'], name='payment_invoice_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_conditional_get_indexes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='paymentevent',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'applied')), fields=('provider', 'transaction_id'), name='paymentevent_applied_txn_uniq'),
+        ),
+    ]
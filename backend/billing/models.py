@@ -2,9 +2,116 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.db import models
+from django.db.models.functions import Greatest, Now
+from django.db.models.lookups import GreaterThan
 from django.utils import timezone
 
 
+MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+ZERO = models.Value(Decimal('0.00'))
+
+
+class DaysBetween(models.Func):
+    """Whole days from the second date expression to the first."""
+    arity = 2
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = models.IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+
+def remaining_balance_expr():
+    """SQL counterpart of Invoice.remaining_balance."""
+    return Greatest(models.F('total_amount') - models.F('amount_paid'), ZERO, output_field=MONEY)
+
+
+def overpayment_expr():
+    """SQL counterpart of Invoice.overpayment."""
+    return Greatest(models.F('amount_paid') - models.F('total_amount'), ZERO, output_field=MONEY)
+
+
+def status_expr(amount_paid, today):
+    """SQL counterpart of Invoice.refresh_status for an ``amount_paid`` expression."""
+    return models.Case(
+        models.When(total_amount__lte=amount_paid, then=models.Value(Invoice.PAID)),
+        models.When(due_date__lt=today, then=models.Value(Invoice.OVERDUE)),
+        models.When(GreaterThan(amount_paid, ZERO), then=models.Value(Invoice.PARTIAL)),
+        default=models.Value(Invoice.UNPAID),
+        output_field=models.CharField(),
+    )
+
+
+class InvoiceQuerySet(models.QuerySet):
+    def with_balances(self, today=None):
+        """
+        Annotate ``balance_due``, ``excess_paid`` and ``days_overdue`` so
+        reports can filter, order and aggregate on them in the database.
+        """
+        today = today or timezone.localdate()
+        return self.annotate(
+            balance_due=remaining_balance_expr(),
+            excess_paid=overpayment_expr(),
+            days_overdue=Greatest(
+                DaysBetween(models.Value(today, output_field=models.DateField()), models.F('due_date')),
+                models.Value(0),
+            ),
+        )
+
+    def with_effective_status(self, today=None):
+        """
+        Annotate ``effective_status``: the stored status, except unpaid/partial
+        invoices past their due date read as overdue. Lets read endpoints report
+        the right status before the overdue sweeper has persisted it.
+        """
+        today = today or timezone.localdate()
+        return self.annotate(effective_status=models.Case(
+            models.When(
+                status__in=[Invoice.UNPAID, Invoice.PARTIAL],
+                due_date__lt=today,
+                then=models.Value(Invoice.OVERDUE),
+            ),
+            default=models.F('status'),
+            output_field=models.CharField(),
+        ))
+
+    def for_detail(self):
+        """Everything InvoiceDetailSerializer and the PDF renderer read, in two queries."""
+        return self.select_related('tenant', 'unit', 'unit__apartment').prefetch_related('line_items')
+
+    def apply_payment(self, amount, today=None):
+        """
+        Add ``amount`` to ``amount_paid`` and set the resulting status in one
+        UPDATE. Both are computed from the row as the database locks it, so
+        concurrent payments against the same invoice cannot lose each other.
+        """
+        today = today or timezone.localdate()
+        paid = models.F('amount_paid') + amount
+        return self.update(amount_paid=paid, status=status_expr(paid, today), updated_at=Now())
+
+    def apply_payment_totals(self, totals, today=None):
+        """
+        Batch form of ``apply_payment``: ``totals`` maps invoice id to the
+        amount to add. Applies them all with one grouped UPDATE.
+        """
+        if not totals:
+            return 0
+        today = today or timezone.localdate()
+        paid = models.F('amount_paid') + models.Case(
+            *[models.When(pk=pk, then=models.Value(amount)) for pk, amount in totals.items()],
+            output_field=MONEY,
+        )
+        return self.filter(pk__in=list(totals)).update(
+            amount_paid=paid, status=status_expr(paid, today), updated_at=Now(),
+        )
+
+
 class Invoice(models.Model):
     UNPAID = 'unpaid'
     PARTIAL = 'partial'
@@ -42,9 +149,21 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InvoiceQuerySet.as_manager()
+
     class Meta:
         ordering = ['-year', '-month', '-created_at']
         unique_together = ['unit', 'month', 'year']
+        indexes = [
+            # Keyset pagination over the default ordering, per landlord / tenant.
+            models.Index(fields=['landlord', 'year', 'month', 'created_at', 'id'],
+                         name='invoice_landlord_order_idx'),
+            models.Index(fields=['tenant', 'year', 'month', 'created_at', 'id'],
+                         name='invoice_tenant_order_idx'),
+            # Index-only COUNT(*) / MAX(updated_at) for conditional GETs (billing.conditional).
+            models.Index(fields=['landlord', 'updated_at'], name='invoice_landlord_updated_idx'),
+            models.Index(fields=['tenant', 'updated_at'], name='invoice_tenant_updated_idx'),
+        ]
 
     def __str__(self):
         from calendar import month_name
@@ -60,6 +179,15 @@ class Invoice(models.Model):
         excess = self.amount_paid - self.total_amount
         return max(excess, Decimal('0.00'))
 
+    @property
+    def current_status(self):
+        """Effective status, preferring the ``with_effective_status`` annotation."""
+        if hasattr(self, 'effective_status'):
+            return self.effective_status
+        if self.status in (self.UNPAID, self.PARTIAL) and self.due_date < timezone.localdate():
+            return self.OVERDUE
+        return self.status
+
     def refresh_status(self):
         today = timezone.now().date()
         if self.amount_paid >= self.total_amount:
@@ -89,6 +217,23 @@ class InvoiceLineItem(models.Model):
         return f'{self.description}: {self.amount}'
 
 
+class PaymentQuerySet(models.QuerySet):
+    def with_running_balance(self):
+        """
+        Annotate ``running_balance``: the invoice balance after each payment,
+        ordered by (created_at, id) within the invoice. The window only sees
+        rows in this queryset, so filter by whole invoices before using it.
+        """
+        paid_so_far = models.Window(
+            expression=models.Sum('amount'),
+            partition_by=[models.F('invoice_id')],
+            order_by=[models.F('created_at').asc(), models.F('id').asc()],
+        )
+        return self.annotate(running_balance=Greatest(
+            models.F('invoice__total_amount') - paid_so_far, ZERO, output_field=MONEY,
+        ))
+
+
 class Payment(models.Model):
     CASH = 'cash'
     BANK_TRANSFER = 'bank_transfer'
@@ -115,20 +260,144 @@ class Payment(models.Model):
         null=True,
         related_name='recorded_payments',
     )
+    # Invoice balance right after this payment; set when the payment is
+    # recorded (see backfill_payment_balances for rows that predate it).
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PaymentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-payment_date', '-created_at']
+        indexes = [
+            models.Index(fields=['payment_date', 'created_at', 'id'], name='payment_order_idx'),
+            # Statement imports and provider callbacks dedupe on the reference.
+            models.Index(fields=['reference_number'], name='payment_reference_idx'),
+            # Index-only validator for the payment lists (billing.conditional).
+            models.Index(fields=['invoice', 'created_at', 'id'], name='payment_invoice_created_idx'),
+        ]
 
     def __str__(self):
         return f'Payment of {self.amount} for {self.invoice} on {self.payment_date}'
 
-    @property
-    def balance_after(self):
-        """Running balance on the invoice after this payment."""
-        payments_before = self.invoice.payments.filter(
-            created_at__lt=self.created_at
-        ).aggregate(total=models.Sum('amount'))['total'] or Decimal('0.00')
-        paid_so_far = payments_before + self.amount
-        balance = self.invoice.total_amount - paid_so_far
-        return max(balance, Decimal('0.00'))
+
+class OverdueSweep(models.Model):
+    """One row per local day and timezone the overdue sweeper has run for."""
+    run_date = models.DateField()
+    timezone = models.CharField(max_length=64)
+    swept = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-run_date', 'timezone']
+        unique_together = ['run_date', 'timezone']
+
+    def __str__(self):
+        return f'Overdue sweep {self.run_date} ({self.timezone}): {self.swept}'
+
+
+class PdfJob(models.Model):
+    """A queued invoice/receipt PDF render, processed by `manage.py run_pdf_worker`."""
+    INVOICE = 'invoice'
+    RECEIPT = 'receipt'
+    KIND_CHOICES = [
+        (INVOICE, 'Invoice'),
+        (RECEIPT, 'Receipt'),
+    ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    fingerprint = models.CharField(max_length=64)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='pdf_jobs',
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    filename = models.CharField(max_length=200)
+    file_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='pdfjob_status_idx'),
+            models.Index(fields=['kind', 'object_id', 'fingerprint'], name='pdfjob_document_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} PDF #{self.object_id} ({self.status})'
+
+
+class PaymentEvent(models.Model):
+    """
+    A raw payment-provider callback, stored as received. The intake endpoint
+    only appends rows; `manage.py apply_payment_events` turns them into
+    Payments in batches.
+    """
+    MPESA = 'mpesa'
+    PROVIDER_CHOICES = [
+        (MPESA, 'M-Pesa'),
+    ]
+
+    PENDING = 'pending'
+    APPLIED = 'applied'
+    DUPLICATE = 'duplicate'
+    UNMATCHED = 'unmatched'
+    INVALID = 'invalid'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (APPLIED, 'Applied'),
+        (DUPLICATE, 'Duplicate'),
+        (UNMATCHED, 'Unmatched'),
+        (INVALID, 'Invalid'),
+    ]
+
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES, default=MPESA)
+    transaction_id = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='events',
+    )
+    detail = models.CharField(max_length=200, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='paymentevent_status_idx'),
+            models.Index(fields=['transaction_id'], name='paymentevent_txn_idx'),
+        ]
+        constraints = [
+            # One applied event per provider transaction, even when two
+            # appliers claim copies of it in concurrent batches.
+            models.UniqueConstraint(
+                fields=['provider', 'transaction_id'], condition=models.Q(status='applied'),
+                name='paymentevent_applied_txn_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.get_provider_display()} {self.transaction_id} ({self.status})'
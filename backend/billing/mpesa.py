@@ -0,0 +1,233 @@
+"""
+M-Pesa C2B confirmation callbacks: fast intake, deferred batched application.
+
+The callback endpoint only validates the payload and appends a PaymentEvent
+row, so it answers within milliseconds even during month-start spikes.
+``apply_events`` then claims pending events in batches (``SKIP LOCKED``, so
+an applier never blocks intake). It dedupes them by transaction id against
+recorded payments and earlier events, matches them to invoices like the
+statement importer does, and writes the Payments and invoice updates in a
+few set-based queries per batch.
+
+Two appliers can still claim copies of one transaction id in concurrent
+batches. A partial unique index allows one applied event per transaction
+id, so the second batch fails on commit of the first; it is rolled back and
+re-run, and then finds the id already applied and marks its copy duplicate.
+
+An event that matches no open invoice is left ``unmatched``, typically a
+payment that arrived before the month's invoices were generated.
+``requeue_unmatched`` (``apply_payment_events --retry-unmatched``, or the
+admin's requeue action) sends such events back to the applier.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from users.models import User
+
+from .ledger import recompute_outstanding
+from .models import Invoice, Payment, PaymentEvent
+from .payment_import import SKIP_UNMATCHED, PaymentMatcher
+from .signals import invoices_changed
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('TransID', 'TransTime', 'TransAmount', 'BusinessShortCode')
+BATCH_ATTEMPTS = 3  # tries per batch when another applier applied the same transaction id
+
+_applier = None
+
+
+def validate_callback(payload):
+    """Return an error message for a malformed C2B confirmation, else None."""
+    if not isinstance(payload, dict):
+        return 'Payload must be a JSON object.'
+    missing = [f for f in REQUIRED_FIELDS if not str(payload.get(f) or '').strip()]
+    if missing:
+        return f'Missing field(s): {", ".join(missing)}.'
+    try:
+        if Decimal(str(payload['TransAmount'])) <= 0:
+            return 'TransAmount must be positive.'
+    except InvalidOperation:
+        return 'TransAmount must be a number.'
+    if str(payload['BusinessShortCode']) not in settings.MPESA_SHORTCODES:
+        return 'Unknown BusinessShortCode.'
+    return None
+
+
+def record_callback(payload):
+    """Append a validated callback to the event table."""
+    return PaymentEvent.objects.create(
+        provider=PaymentEvent.MPESA,
+        transaction_id=str(payload['TransID']).strip(),
+        payload=payload,
+    )
+
+
+def _payment_date(trans_time):
+    """TransTime is ``YYYYMMDDHHMMSS`` in Kenyan local time."""
+    try:
+        return datetime.strptime(str(trans_time)[:8], '%Y%m%d').date()
+    except ValueError:
+        return timezone.localdate()
+
+
+def _payer_name(payload):
+    return ' '.join(
+        str(payload.get(f) or '').strip() for f in ('FirstName', 'MiddleName', 'LastName')
+    ).strip()
+
+
+def apply_events(batch_size=None):
+    """
+    Turn one batch of pending events into payments. Returns a dict of counts
+    by resulting event status (empty when nothing was pending).
+    """
+    batch_size = batch_size or settings.MPESA_APPLIER_BATCH_SIZE
+    for attempt in range(1, BATCH_ATTEMPTS + 1):
+        try:
+            return _apply_batch(batch_size)
+        except IntegrityError:
+            if attempt == BATCH_ATTEMPTS:
+                raise
+            logger.info('Another applier applied a transaction in this batch; retrying it')
+
+
+def _apply_batch(batch_size):
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=PaymentEvent.PENDING).order_by('id')[:batch_size]
+        )
+        if not events:
+            return {}
+
+        txn_ids = {e.transaction_id for e in events}
+        seen = set(Payment.objects.filter(reference_number__in=txn_ids).values_list(
+            'reference_number', flat=True,
+        ))
+        # Only applied copies count: an unmatched copy must not turn a retry into a duplicate.
+        seen.update(PaymentEvent.objects.filter(
+            transaction_id__in=txn_ids, status=PaymentEvent.APPLIED,
+        ).values_list('transaction_id', flat=True))
+
+        usernames = settings.MPESA_SHORTCODES
+        landlords = {
+            u.username: u for u in User.objects.filter(
+                role=User.LANDLORD, username__in=set(usernames.values()),
+            )
+        }
+
+        by_landlord = defaultdict(list)
+        for event in events:
+            event.processed_at = timezone.now()
+            landlord = landlords.get(usernames.get(str(event.payload.get('BusinessShortCode'))))
+            if event.transaction_id in seen:
+                event.status = PaymentEvent.DUPLICATE
+            elif landlord is None:
+                event.status = PaymentEvent.INVALID
+                event.detail = 'No landlord configured for this short code.'
+            else:
+                seen.add(event.transaction_id)
+                by_landlord[landlord].append(event)
+
+        payments = []
+        totals = defaultdict(Decimal)
+        tenant_ids = set()
+        for landlord, group in by_landlord.items():
+            matcher = PaymentMatcher(landlord)
+            targets = {
+                event.id: matcher.target({
+                    'account': str(event.payload.get('BillRefNumber') or ''),
+                    'phone': str(event.payload.get('MSISDN') or ''),
+                })
+                for event in group
+            }
+            matcher.load([t for t in targets.values() if t[0]])
+            for event in group:
+                kind, value = targets[event.id]
+                invoice_id, reason = matcher.invoice_for(kind, value) if kind else (None, value)
+                if invoice_id is None:
+                    event.status = PaymentEvent.UNMATCHED
+                    event.detail = reason or SKIP_UNMATCHED
+                    continue
+                amount = Decimal(str(event.payload['TransAmount'])).quantize(Decimal('0.01'))
+                payer = _payer_name(event.payload)
+                event.status = PaymentEvent.APPLIED
+                event.payment = Payment(
+                    invoice_id=invoice_id,
+                    amount=amount,
+                    payment_date=_payment_date(event.payload.get('TransTime')),
+                    method=Payment.MPESA,
+                    reference_number=event.transaction_id,
+                    notes=f'M-Pesa from {payer or "payer"} ({event.payload.get("MSISDN", "")})'.strip(),
+                    balance_after=matcher.apply(invoice_id, amount),
+                )
+                payments.append(event.payment)
+                totals[invoice_id] += amount
+                tenant_ids.add(matcher.invoices[invoice_id][2])
+
+        Payment.objects.bulk_create(payments)
+        Invoice.objects.apply_payment_totals(totals)
+        recompute_outstanding(tenant_ids)
+        if payments:
+            invoices_changed.send(sender=Payment, landlord_ids=[landlord.id for landlord in by_landlord])
+        PaymentEvent.objects.bulk_update(events, ['status', 'payment', 'detail', 'processed_at'])
+
+    counts = defaultdict(int)
+    for event in events:
+        counts[event.status] += 1
+    return dict(counts)
+
+
+def requeue_unmatched():
+    """Send unmatched events back to the applier; returns how many were requeued."""
+    return PaymentEvent.objects.filter(status=PaymentEvent.UNMATCHED).update(
+        status=PaymentEvent.PENDING, detail='', processed_at=None,
+    )
+
+
+def run_applier(batch_size=None, poll_interval=1.0, once=False):
+    """Apply batches until the queue is empty (``once``) or forever."""
+    totals = defaultdict(int)
+    while True:
+        counts = apply_events(batch_size)
+        for key, value in counts.items():
+            totals[key] += value
+        if not counts:
+            if once:
+                return dict(totals)
+            time.sleep(poll_interval)
+        close_old_connections()
+
+
+def start_applier(interval=None):
+    """Start the in-process applier thread (idempotent per process)."""
+    from .overdue import _is_management_command
+
+    global _applier
+    if _applier is not None or _is_management_command():
+        return _applier
+    interval = interval or settings.MPESA_APPLIER_INTERVAL
+
+    def loop():
+        while True:
+            try:
+                while apply_events():
+                    pass
+            except Exception:
+                logger.exception('Applying payment events failed')
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+    _applier = threading.Thread(target=loop, name='payment-event-applier', daemon=True)
+    _applier.start()
+    return _applier
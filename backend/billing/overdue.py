@@ -0,0 +1,118 @@
+"""
+Overdue sweeper: persists unpaid/partial -> overdue once per local day.
+
+Read endpoints no longer write; they annotate ``effective_status`` instead
+(see ``InvoiceQuerySet.with_effective_status``). This module brings the
+stored ``status`` column in line, in primary-key chunks so no single UPDATE
+holds row locks for long while payments are being recorded.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Invoice, OverdueSweep
+
+logger = logging.getLogger(__name__)
+
+_scheduler = None
+
+
+def local_today(tz_name):
+    return timezone.localdate(timezone=ZoneInfo(tz_name))
+
+
+def sweep_overdue(today, chunk_size=None):
+    """Mark every unpaid/partial invoice due before ``today`` as overdue."""
+    chunk_size = chunk_size or settings.OVERDUE_SWEEP_CHUNK_SIZE
+    pending = Invoice.objects.filter(
+        status__in=[Invoice.UNPAID, Invoice.PARTIAL], due_date__lt=today,
+    )
+    swept = 0
+    last_pk = 0
+    while True:
+        ids = list(
+            pending.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        last_pk = ids[-1]
+        # Re-check the status in the UPDATE so a payment landing between the
+        # SELECT and here is not overwritten.
+        swept += pending.filter(pk__in=ids).update(
+            status=Invoice.OVERDUE, updated_at=timezone.now(),
+        )
+    return swept
+
+
+def run_daily_sweep(tz_name=None, force=False, chunk_size=None):
+    """
+    Sweep for the current local day in ``tz_name``.
+
+    The (run_date, timezone) unique constraint on OverdueSweep makes this
+    safe to call from every worker: only the first caller each day sweeps.
+    A sweep that started OVERDUE_SWEEP_RETRY_AFTER seconds ago and never
+    finished (it failed, or its process died) is claimed and run again by
+    the next caller. Returns the OverdueSweep row, or None if today's sweep
+    already ran or is still running.
+    """
+    tz_name = tz_name or settings.OVERDUE_SWEEP_TIMEZONE
+    today = local_today(tz_name)
+    try:
+        with transaction.atomic():
+            run = OverdueSweep.objects.create(run_date=today, timezone=tz_name)
+    except IntegrityError:
+        run = OverdueSweep.objects.get(run_date=today, timezone=tz_name)
+        if not force and not _claim_stalled(run):
+            return None
+
+    run.swept += sweep_overdue(today, chunk_size)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['swept', 'finished_at'])
+    logger.info('Overdue sweep for %s (%s): %d invoice(s) marked overdue', today, tz_name, run.swept)
+    return run
+
+
+def _claim_stalled(run):
+    """Take over ``run`` if it never finished and was started long enough ago."""
+    now = timezone.now()
+    claimed = OverdueSweep.objects.filter(
+        pk=run.pk, finished_at__isnull=True,
+        started_at__lte=now - timedelta(seconds=settings.OVERDUE_SWEEP_RETRY_AFTER),
+    ).update(started_at=now)  # one UPDATE, so only one caller wins the retry
+    if claimed:
+        logger.warning('Overdue sweep for %s (%s) did not finish; running it again', run.run_date, run.timezone)
+    return bool(claimed)
+
+
+def _is_management_command():
+    return os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1:2] != ['runserver']
+
+
+def start_scheduler(interval=None):
+    """Start the in-process daily sweeper thread (idempotent per process)."""
+    global _scheduler
+    if _scheduler is not None or _is_management_command():
+        return _scheduler
+    interval = interval or settings.OVERDUE_SWEEP_INTERVAL
+
+    def loop():
+        while True:
+            try:
+                run_daily_sweep()
+            except Exception:
+                logger.exception('Overdue sweep failed')
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+    _scheduler = threading.Thread(target=loop, name='overdue-sweeper', daemon=True)
+    _scheduler.start()
+    return _scheduler
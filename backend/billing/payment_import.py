@@ -0,0 +1,307 @@
+"""
+Bulk payment import from bank / M-Pesa statement CSV files.
+
+Each statement row is matched to one of the landlord's invoices:
+
+1. an ``INV-00012`` style invoice number in the account column (as printed
+   on the invoice PDF);
+2. otherwise a unit number, from the account or unit column;
+3. otherwise the payer's phone number, against tenants' ``User.phone``.
+
+Matches by unit or phone go to the tenant's oldest invoice that still has a
+balance, including amounts from earlier rows in the same file. Rows are
+processed in batches. Each batch costs one indexed lookup of its
+references against the landlord's existing payments (another landlord's
+statement may reuse a bank reference), one invoice query and one
+``bulk_create``. Invoice totals and statuses are updated at the end with
+one grouped UPDATE per chunk, instead of once per row. The whole import is
+a single transaction.
+"""
+import bisect
+import csv
+import io
+import re
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from properties.models import TenantProfile, Unit
+
+from .ledger import recompute_outstanding
+from .models import Invoice, Payment
+from .signals import invoices_changed
+
+BATCH_SIZE = 1000
+
+SKIP_DUPLICATE = 'duplicate'
+SKIP_UNMATCHED = 'unmatched'
+SKIP_NO_OPEN_INVOICE = 'no_open_invoice'
+SKIP_AMBIGUOUS = 'ambiguous'
+SKIP_INVALID = 'invalid'
+
+# Accepted header names (lower-cased) for each field, covering our own
+# template, M-Pesa paybill statements and common bank exports.
+COLUMN_ALIASES = {
+    'reference': ('reference', 'reference_number', 'receipt no.', 'receipt no', 'transaction id',
+                  'transaction reference'),
+    'amount': ('amount', 'paid in', 'credit', 'credit amount'),
+    'date': ('date', 'payment_date', 'completion time', 'transaction date', 'value date'),
+    'account': ('account', 'a/c no.', 'account no.', 'account reference', 'bill reference', 'invoice'),
+    'unit': ('unit', 'unit_number', 'unit number'),
+    'phone': ('phone', 'msisdn', 'phone number', 'other party info'),
+    'notes': ('notes', 'details', 'description', 'narrative'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%m/%d/%Y')
+INVOICE_NUMBER = re.compile(r'^INV-?0*(\d+)$', re.IGNORECASE)
+PHONE_DIGITS = re.compile(r'\d{9,}')
+
+
+class ImportFileError(ValueError):
+    """The file cannot be read as a statement (bad encoding or missing columns)."""
+
+
+def normalize_phone(value):
+    """Last nine digits of a phone number, so 07.., 2547.. and +2547.. compare equal."""
+    match = PHONE_DIGITS.search((value or '').replace(' ', '').replace('-', ''))
+    return match.group()[-9:] if match else None
+
+
+def _parse_amount(value):
+    cleaned = re.sub(r'[^\d.\-]', '', value or '')
+    try:
+        amount = Decimal(cleaned).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    return amount if amount > 0 else None
+
+
+def _parse_date(value):
+    token = (value or '').strip().split(' ')[0].split('T')[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(token, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _column_map(fieldnames):
+    headers = {name.strip().lower(): name for name in fieldnames or [] if name}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[field] = headers[alias]
+                break
+    missing = {'reference', 'amount', 'date'} - set(columns)
+    if missing:
+        raise ImportFileError(f'Missing column(s): {", ".join(sorted(missing))}.')
+    if not {'account', 'unit', 'phone'} & set(columns):
+        raise ImportFileError('Need an account, unit or phone column to match payments.')
+    return columns
+
+
+def _batches(reader, size):
+    batch = []
+    for row in reader:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PaymentMatcher:
+    """
+    Resolves payer details (``account``, ``unit``, ``phone``) to one landlord's
+    invoices, tracking balances across a run. Also used by billing.mpesa.
+    With ``lock`` the loaded invoices are locked until the transaction ends.
+    """
+
+    def __init__(self, landlord, lock=True):
+        self.landlord = landlord
+        self.lock = lock
+        self.units = defaultdict(list)
+        for unit_id, number in Unit.objects.filter(apartment__landlord=landlord).values_list(
+            'id', 'unit_number',
+        ):
+            self.units[number.strip().upper()].append(unit_id)
+        self.phones = defaultdict(set)
+        for user_id, phone in TenantProfile.objects.filter(landlord=landlord).values_list(
+            'user_id', 'user__phone',
+        ):
+            key = normalize_phone(phone)
+            if key:
+                self.phones[key].add(user_id)
+        # invoice id -> [total_amount, amount_paid, tenant_id], including this file's payments.
+        self.invoices = {}
+        # unit / tenant id -> sorted [(year, month, invoice id)] of open invoices, oldest first.
+        self.open_by_unit = defaultdict(list)
+        self.open_by_tenant = defaultdict(list)
+
+    def target(self, row):
+        """``('invoice'|'unit'|'tenant', id)`` or ``(None, reason)``."""
+        account = row.get('account', '').strip()
+        match = INVOICE_NUMBER.match(account)
+        if match:
+            return 'invoice', int(match.group(1))
+        for number in (account, row.get('unit', '').strip()):
+            unit_ids = self.units.get(number.upper()) if number else None
+            if unit_ids and len(unit_ids) == 1:
+                return 'unit', unit_ids[0]
+        phone = normalize_phone(row.get('phone'))
+        tenant_ids = self.phones.get(phone) if phone else None
+        if tenant_ids and len(tenant_ids) == 1:
+            return 'tenant', next(iter(tenant_ids))
+        if (tenant_ids and len(tenant_ids) > 1) or any(
+            len(self.units.get(n.upper(), ())) > 1 for n in (account, row.get('unit', '')) if n
+        ):
+            return None, SKIP_AMBIGUOUS
+        return None, SKIP_UNMATCHED
+
+    def load(self, targets):
+        """Fetch the invoices this batch may pay, in one query."""
+        invoice_ids = {v for k, v in targets if k == 'invoice'} - set(self.invoices)
+        unit_ids = {v for k, v in targets if k == 'unit'}
+        tenant_ids = {v for k, v in targets if k == 'tenant'}
+        if not (invoice_ids or unit_ids or tenant_ids):
+            return
+        open_invoices = Q(amount_paid__lt=F('total_amount')) & (
+            Q(unit_id__in=unit_ids) | Q(tenant_id__in=tenant_ids)
+        )
+        invoices = Invoice.objects.select_for_update() if self.lock else Invoice.objects.all()
+        rows = invoices.filter(landlord=self.landlord).filter(
+            Q(pk__in=invoice_ids) | open_invoices,
+        ).order_by('year', 'month', 'id').values_list(
+            'id', 'unit_id', 'tenant_id', 'year', 'month', 'total_amount', 'amount_paid',
+        )
+        for pk, unit_id, tenant_id, year, month, total, paid in rows:
+            # An invoice seen in an earlier batch keeps its in-memory balance,
+            # which includes this file's payments, but may not be in the open
+            # lists yet (it was loaded by invoice number, or for its unit
+            # rather than its tenant), so the lists are checked every time.
+            entry = self.invoices.setdefault(pk, [total, paid, tenant_id])
+            if entry[1] < entry[0]:
+                key = (year, month, pk)
+                for candidates in (self.open_by_unit[unit_id], self.open_by_tenant[tenant_id]):
+                    if key not in candidates:
+                        bisect.insort(candidates, key)
+
+    def invoice_for(self, kind, value):
+        if kind == 'invoice':
+            return (value, None) if value in self.invoices else (None, SKIP_UNMATCHED)
+        candidates = self.open_by_unit[value] if kind == 'unit' else self.open_by_tenant[value]
+        for _, _, pk in candidates:
+            total, paid, _ = self.invoices[pk]
+            if paid < total:
+                return pk, None
+        return None, SKIP_NO_OPEN_INVOICE
+
+    def apply(self, invoice_id, amount):
+        """Record ``amount`` against the invoice and return its balance afterwards."""
+        entry = self.invoices[invoice_id]
+        entry[1] += amount
+        return max(entry[0] - entry[1], Decimal('0.00'))
+
+
+def import_payments(fileobj, landlord, method, recorded_by=None, dry_run=False,
+                    batch_size=BATCH_SIZE):
+    """
+    Import a statement CSV (``fileobj`` opened in binary or text mode).
+
+    Returns a report dict with counts, the total imported and one entry per
+    skipped row. Raises ImportFileError if the file is unreadable.
+    """
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(fileobj)
+    try:
+        columns = _column_map(reader.fieldnames)
+    except UnicodeDecodeError:
+        raise ImportFileError('File must be UTF-8 encoded CSV.')
+
+    matcher = PaymentMatcher(landlord, lock=not dry_run)  # a dry run writes nothing to protect
+    seen_refs = set()
+    skipped = []
+    totals = defaultdict(Decimal)
+    row_count = created_count = 0
+    total_amount = Decimal('0.00')
+
+    with transaction.atomic():
+        try:
+            for batch in _batches(reader, batch_size):
+                parsed = []
+                for raw in batch:
+                    row_count += 1
+                    line = row_count + 1  # the header is line 1
+                    row = {field: (raw.get(col) or '') for field, col in columns.items()}
+                    reference = row['reference'].strip()
+                    amount = _parse_amount(row['amount'])
+                    payment_date = _parse_date(row['date'])
+                    if not reference or amount is None or payment_date is None:
+                        skipped.append({'row': line, 'reference': reference, 'reason': SKIP_INVALID})
+                        continue
+                    if reference in seen_refs:
+                        skipped.append({'row': line, 'reference': reference, 'reason': SKIP_DUPLICATE})
+                        continue
+                    seen_refs.add(reference)
+                    parsed.append((line, reference, amount, payment_date, row))
+
+                existing = set(Payment.objects.filter(
+                    invoice__landlord=landlord, reference_number__in=[p[1] for p in parsed],
+                ).values_list('reference_number', flat=True))
+                targets = {}
+                for line, reference, _, _, row in parsed:
+                    if reference not in existing:
+                        targets[line] = matcher.target(row)
+                matcher.load([t for t in targets.values() if t[0]])
+
+                payments = []
+                for line, reference, amount, payment_date, row in parsed:
+                    if reference in existing:
+                        skipped.append({'row': line, 'reference': reference, 'reason': SKIP_DUPLICATE})
+                        continue
+                    kind, value = targets[line]
+                    invoice_id, reason = matcher.invoice_for(kind, value) if kind else (None, value)
+                    if invoice_id is None:
+                        skipped.append({'row': line, 'reference': reference, 'reason': reason})
+                        continue
+                    totals[invoice_id] += amount
+                    total_amount += amount
+                    payments.append(Payment(
+                        invoice_id=invoice_id,
+                        amount=amount,
+                        payment_date=payment_date,
+                        method=method,
+                        reference_number=reference,
+                        notes=row.get('notes', '').strip(),
+                        recorded_by=recorded_by,
+                        balance_after=matcher.apply(invoice_id, amount),
+                    ))
+                created_count += len(payments)
+                if payments and not dry_run:
+                    Payment.objects.bulk_create(payments, batch_size=batch_size)
+        except UnicodeDecodeError:
+            raise ImportFileError('File must be UTF-8 encoded CSV.')
+
+        if totals and not dry_run:
+            invoice_ids = list(totals)
+            for start in range(0, len(invoice_ids), batch_size):
+                chunk = invoice_ids[start:start + batch_size]
+                Invoice.objects.apply_payment_totals({pk: totals[pk] for pk in chunk})
+            recompute_outstanding({matcher.invoices[pk][2] for pk in invoice_ids})
+            invoices_changed.send(sender=Payment, landlord_ids=[landlord.id])
+
+    return {
+        'dry_run': dry_run,
+        'rows': row_count,
+        'created_count': created_count,
+        'skipped_count': len(skipped),
+        'total_amount': str(total_amount),
+        'invoices_updated': len(totals),
+        'skipped': sorted(skipped, key=lambda entry: entry['row']),
+    }
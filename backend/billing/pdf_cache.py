@@ -0,0 +1,213 @@
+"""
+Content-addressed on-disk cache for rendered invoice and receipt PDFs.
+
+Entries live under PDF_CACHE_DIR as ``<kind>/<id>-<fingerprint>.pdf``. The
+fingerprint hashes everything the document shows (invoice/payment fields,
+line items, payment totals, unit, apartment and tenant details), so any
+change produces a new key and stale entries are simply never read again.
+Total size is bounded by PDF_CACHE_MAX_BYTES with least-recently-used
+eviction, using file mtimes (refreshed on every hit) as the access clock.
+Each process keeps a running estimate of the cache size (one scan of the
+tree when it first stores, then the sizes it writes and deletes) and scans
+and evicts only once that estimate passes the limit, so a miss does not
+cost a walk over the whole cache. Entries written by other processes are
+counted at the next scan; ``purge_pdf_cache --trim`` trims on demand.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .pdf_utils import generate_invoice_pdf, generate_receipt_pdf
+
+INVOICE = 'invoice'
+RECEIPT = 'receipt'
+
+_estimated_bytes = None  # this process's view of the cache size; None until the first scan
+_estimate_lock = threading.Lock()
+
+
+def cache_dir():
+    return Path(settings.PDF_CACHE_DIR)
+
+
+def _digest(parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode())
+        h.update(b'\x1f')
+    return h.hexdigest()[:32]
+
+
+def _context_parts(invoice):
+    unit = invoice.unit
+    apartment = unit.apartment
+    tenant = invoice.tenant
+    return [
+        unit.unit_number, unit.updated_at.isoformat(),
+        apartment.name, apartment.address, apartment.city, apartment.updated_at.isoformat(),
+        tenant.get_full_name(), tenant.email, tenant.phone,
+    ]
+
+
+def invoice_fingerprint(invoice):
+    # .all() uses the for_detail() prefetch; same tuples as values_list(), so keys are unchanged.
+    line_items = [(item.description, item.amount, item.order) for item in invoice.line_items.all()]
+    paid = invoice.payments.aggregate(count=Count('id'), total=Sum('amount'))
+    return _digest([
+        invoice.updated_at.isoformat(), invoice.current_status,
+        invoice.total_amount, invoice.amount_paid, invoice.notes,
+        _digest(line_items), paid['count'], paid['total'],
+        *_context_parts(invoice),
+    ])
+
+
+def receipt_fingerprint(payment):
+    invoice = payment.invoice
+    return _digest([
+        payment.amount, payment.payment_date, payment.method, payment.reference_number,
+        payment.notes, invoice.updated_at.isoformat(), invoice.total_amount, invoice.amount_paid,
+        *_context_parts(invoice),
+    ])
+
+
+def _entry_path(kind, obj_id, fingerprint):
+    return cache_dir() / kind / f'{obj_id}-{fingerprint}.pdf'
+
+
+def _store(path, pdf_bytes):
+    """Write an entry; returns the bytes freed by removing older versions of it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename so readers never see a partial PDF.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(pdf_bytes)
+    os.replace(tmp, path)
+    # Older versions of the same document can never be hit again.
+    freed = 0
+    for stale in path.parent.glob(f'{path.name.split("-", 1)[0]}-*.pdf'):
+        if stale != path:
+            try:
+                freed += stale.stat().st_size
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+    return freed
+
+
+def _grow(delta):
+    """Add ``delta`` bytes to the size estimate (scanning on first use) and return it."""
+    global _estimated_bytes
+    with _estimate_lock:
+        if _estimated_bytes is None:
+            _estimated_bytes = sum(size for _, size, _ in _entries())
+        else:
+            _estimated_bytes += delta
+        return _estimated_bytes
+
+
+def _reset_estimate(total=None):
+    global _estimated_bytes
+    with _estimate_lock:
+        _estimated_bytes = total
+
+
+def lookup(kind, obj_id, fingerprint):
+    """Path of a cached entry (marking it recently used), or None on a miss."""
+    path = _entry_path(kind, obj_id, fingerprint)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def store(kind, obj_id, fingerprint, pdf_bytes):
+    """Add an entry, evicting least-recently-used ones once the cache looks over budget."""
+    path = _entry_path(kind, obj_id, fingerprint)
+    freed = _store(path, pdf_bytes)
+    if _grow(len(pdf_bytes) - freed) > settings.PDF_CACHE_MAX_BYTES:
+        evict()
+    return path
+
+
+def _cached(kind, obj_id, fingerprint, render):
+    # Open the entry here rather than hand back a path: another request's
+    # store() or evict() may delete it at any moment, but an open handle
+    # stays readable after the file is unlinked.
+    path = lookup(kind, obj_id, fingerprint)
+    if path is not None:
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            pass
+    pdf_bytes = render()
+    path = store(kind, obj_id, fingerprint, pdf_bytes)
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        return io.BytesIO(pdf_bytes)
+
+
+def cached_invoice_pdf(invoice):
+    """The rendered PDF for ``invoice`` as an open binary file, rendering it on a miss."""
+    return _cached(INVOICE, invoice.id, invoice_fingerprint(invoice),
+                   lambda: generate_invoice_pdf(invoice))
+
+
+def cached_receipt_pdf(payment):
+    """The rendered receipt for ``payment`` as an open binary file, rendering it on a miss."""
+    return _cached(RECEIPT, payment.id, receipt_fingerprint(payment),
+                   lambda: generate_receipt_pdf(payment))
+
+
+def fingerprint(kind, obj):
+    return invoice_fingerprint(obj) if kind == INVOICE else receipt_fingerprint(obj)
+
+
+def _entries():
+    root = cache_dir()
+    if not root.exists():
+        return []
+    entries = []
+    for path in root.glob('*/*.pdf'):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def evict(max_bytes=None):
+    """Delete least-recently-used entries until the cache fits in ``max_bytes``."""
+    max_bytes = settings.PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    _reset_estimate(total)
+    return removed
+
+
+def purge(older_than=None):
+    """Delete every entry, or only those not used in the last ``older_than`` seconds."""
+    cutoff = time.time() - older_than if older_than is not None else None
+    removed = 0
+    for mtime, _, path in _entries():
+        if cutoff is None or mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    _reset_estimate()
+    return removed
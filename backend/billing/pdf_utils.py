@@ -16,6 +16,8 @@ from reportlab.platypus import (
     TableStyle,
 )
 
+from rental_system.metrics import PDF_RENDER_DURATION
+
 # ── Colour palette ─────────────────────────────────────────────────────────────
 PRIMARY = colors.HexColor('#1e40af')   # blue-800
 LIGHT_BG = colors.HexColor('#eff6ff')  # blue-50
@@ -49,6 +51,7 @@ def _info_table(rows, col_widths):
     return Table(rows, colWidths=col_widths, style=style)
 
 
+@PDF_RENDER_DURATION.time(kind='invoice')
 def generate_invoice_pdf(invoice):
     """Return bytes of a PDF invoice for the given Invoice instance."""
     buf = io.BytesIO()
@@ -91,7 +94,7 @@ def generate_invoice_pdf(invoice):
         [Paragraph(f'Period: {period}', v), Paragraph(str(invoice.due_date), v)],
         [Paragraph(f'Phone: {invoice.tenant.phone or "—"}', small), Paragraph('STATUS', l)],
         [Paragraph(invoice.tenant.email, small),
-         Paragraph(invoice.get_status_display().upper(), v)],
+         Paragraph(dict(invoice.STATUS_CHOICES)[invoice.current_status].upper(), v)],
     ]
     story.append(_info_table(bill_rows, [W*0.55, W*0.45]))
     story.append(Spacer(1, 0.5*cm))
@@ -157,6 +160,7 @@ def generate_invoice_pdf(invoice):
     return buf.read()
 
 
+@PDF_RENDER_DURATION.time(kind='receipt')
 def generate_receipt_pdf(payment):
     """Return bytes of a PDF receipt for the given Payment instance."""
     buf = io.BytesIO()
@@ -0,0 +1,152 @@
+"""
+Synthetic portfolios for query-budget checks, benchmarks and local testing.
+
+Everything is written with ``bulk_create``, so even large portfolios need only
+a handful of INSERTs per table. The data is deterministic for a given prefix.
+"""
+import zlib
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from properties.models import Apartment, TenantProfile, Unit
+from users.models import User
+
+from .invoicing import default_dates
+from .ledger import recompute_outstanding
+from .models import Invoice, InvoiceLineItem, Payment
+from .signals import invoices_changed
+
+BATCH_SIZE = 1000
+PASSWORD = 'password'
+WATER = Decimal('500.00')
+
+
+def _months_back(count, today):
+    month, year = today.month, today.year
+    periods = []
+    for _ in range(count):
+        periods.append((month, year))
+        month -= 1
+        if month == 0:
+            month, year = 12, year - 1
+    return list(reversed(periods))
+
+
+def create_portfolio(prefix, apartments=1, units_per_apartment=4, months=3, occupancy=0.75,
+                     tenants=None, password_hash=None, today=None):
+    """
+    Create landlord ``prefix`` with its apartments, units, tenants and
+    ``months`` of invoices (with a water line item) and payments.
+
+    ``tenants`` sets the number of occupied units, spread evenly across the
+    apartments; by default it is ``occupancy`` of the units.
+
+    About one in four occupied units carry an unpaid balance, and the current
+    month is part-paid. Every user's password is ``password``. Returns a dict
+    of the created objects' ids, keyed by model.
+    """
+    today = today or timezone.localdate()
+    password_hash = password_hash or make_password(PASSWORD)
+
+    landlord = User.objects.create(
+        username=prefix, email=f'{prefix}@example.com', password=password_hash,
+        role=User.LANDLORD, first_name=prefix.title(), last_name='Landlord',
+    )
+    apartment_objs = Apartment.objects.bulk_create([
+        Apartment(landlord=landlord, name=f'{prefix.title()} Court {a + 1}',
+                  address=f'{a + 1} Sample Road', city='Nairobi')
+        for a in range(apartments)
+    ])
+
+    if tenants is None:
+        occupied_counts = [round(units_per_apartment * occupancy)] * apartments
+    else:
+        tenants = min(tenants, apartments * units_per_apartment)
+        occupied_counts = [tenants // apartments + (a < tenants % apartments) for a in range(apartments)]
+    unit_objs = Unit.objects.bulk_create([
+        Unit(apartment=apartment, unit_number=f'{chr(65 + u % 26)}{u + 1}',
+             base_rent=Decimal('10000.00') + 500 * (u % 5),
+             status=Unit.OCCUPIED if u < count else Unit.VACANT)
+        for apartment, count in zip(apartment_objs, occupied_counts)
+        for u in range(units_per_apartment)
+    ], batch_size=BATCH_SIZE)
+    occupied = [u for u in unit_objs if u.status == Unit.OCCUPIED]
+
+    tenant_objs = User.objects.bulk_create([
+        User(username=f'{prefix}-t{i + 1}', email=f'{prefix}-t{i + 1}@example.com',
+             password=password_hash, role=User.TENANT, first_name=f'Tenant{i + 1}',
+             last_name=prefix.title(), phone=f'07{zlib.crc32(prefix.encode()) % 100:02d}{i + 1:06d}')
+        for i in range(len(occupied))
+    ], batch_size=BATCH_SIZE)
+    profile_objs = TenantProfile.objects.bulk_create([
+        TenantProfile(user=tenant, unit=unit, landlord=landlord, id_number=f'{prefix}{i + 1:08d}',
+                      move_in_date=date(today.year - 1, 1, 1))
+        for i, (tenant, unit) in enumerate(zip(tenant_objs, occupied))
+    ], batch_size=BATCH_SIZE)
+
+    periods = _months_back(months, today)
+    invoices = []
+    for tenant, unit in zip(tenant_objs, occupied):
+        for month, year in periods:
+            invoice_date, due_date = default_dates(month, year)
+            invoices.append(Invoice(
+                unit=unit, tenant=tenant, landlord=landlord, month=month, year=year,
+                invoice_date=invoice_date, due_date=due_date, base_rent=unit.base_rent,
+                total_amount=unit.base_rent + WATER,
+            ))
+    Invoice.objects.bulk_create(invoices, batch_size=BATCH_SIZE)
+    InvoiceLineItem.objects.bulk_create([
+        InvoiceLineItem(invoice=invoice, description='Water', amount=WATER, order=0)
+        for invoice in invoices
+    ], batch_size=BATCH_SIZE)
+
+    payments = []
+    current = periods[-1]
+    for n, invoice in enumerate(invoices):
+        tenant_index = n // len(periods)
+        if tenant_index % 4 == 3 and (invoice.month, invoice.year) != periods[0]:
+            paid = Decimal('0.00')  # in arrears since the first month
+        elif (invoice.month, invoice.year) == current:
+            paid = (invoice.total_amount / 2).quantize(Decimal('0.01'))
+        else:
+            paid = invoice.total_amount
+        if paid:
+            payments.append(Payment(
+                invoice=invoice, amount=paid, payment_date=invoice.due_date,
+                method=(Payment.MPESA, Payment.BANK_TRANSFER, Payment.CASH)[n % 3],
+                reference_number=f'{prefix.upper()}{n + 1:08d}', recorded_by=landlord,
+                balance_after=max(invoice.total_amount - paid, Decimal('0.00')),
+            ))
+        invoice.amount_paid = paid
+        if paid >= invoice.total_amount:
+            invoice.status = Invoice.PAID
+        elif invoice.due_date < today:
+            invoice.status = Invoice.OVERDUE
+        else:
+            invoice.status = Invoice.PARTIAL if paid else Invoice.UNPAID
+    Payment.objects.bulk_create(payments, batch_size=BATCH_SIZE)
+    Invoice.objects.bulk_update(invoices, ['amount_paid', 'status'], batch_size=BATCH_SIZE)
+    recompute_outstanding([t.id for t in tenant_objs])
+    invoices_changed.send(sender=Invoice, landlord_ids=[landlord.id])
+
+    return {
+        'landlord': landlord.id,
+        'apartments': [a.id for a in apartment_objs],
+        'units': [u.id for u in unit_objs],
+        'tenants': [t.id for t in tenant_objs],
+        'profiles': [p.id for p in profile_objs],
+        'invoices': [i.id for i in invoices],
+        'payments': [p.id for p in payments],
+    }
+
+
+def create_portfolios(prefix, landlords=1, **options):
+    """
+    ``landlords`` portfolios named ``<prefix>-1``, ``<prefix>-2``, ... with
+    the same ``create_portfolio`` options. Returns their id dicts in order.
+    """
+    options.setdefault('password_hash', make_password(PASSWORD))
+    return [create_portfolio(f'{prefix}-{n + 1}', **options) for n in range(landlords)]
@@ -1,10 +1,13 @@
 from decimal import Decimal
 
+from django.db import transaction
 from rest_framework import serializers
 
 from properties.models import TenantProfile, Unit
+from rental_system.fieldsets import SparseFieldsMixin
 from users.serializers import UserSerializer
 
+from .ledger import adjust_outstanding
 from .models import Invoice, InvoiceLineItem, Payment
 
 
@@ -14,12 +17,19 @@ class InvoiceLineItemSerializer(serializers.ModelSerializer):
         fields = ('id', 'description', 'amount', 'order')
 
 
-class InvoiceListSerializer(serializers.ModelSerializer):
+class InvoiceListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_relations = {
+        'unit_display': ('unit__apartment',),
+        'apartment_name': ('unit__apartment',),
+        'tenant_name': ('tenant',),
+    }
+
     tenant_name = serializers.CharField(source='tenant.get_full_name', read_only=True)
     unit_display = serializers.CharField(source='unit.__str__', read_only=True)
     apartment_name = serializers.CharField(source='unit.apartment.name', read_only=True)
     remaining_balance = serializers.ReadOnlyField()
     month_name = serializers.SerializerMethodField()
+    status = serializers.CharField(source='current_status', read_only=True)
 
     class Meta:
         model = Invoice
@@ -47,6 +57,7 @@ class InvoiceDetailSerializer(serializers.ModelSerializer):
     apartment_address = serializers.CharField(source='unit.apartment.address', read_only=True)
     apartment_city = serializers.CharField(source='unit.apartment.city', read_only=True)
     month_name = serializers.SerializerMethodField()
+    status = serializers.CharField(source='current_status', read_only=True)
 
     class Meta:
         model = Invoice
@@ -102,23 +113,60 @@ class InvoiceCreateSerializer(serializers.ModelSerializer):
         extras = sum(Decimal(str(item['amount'])) for item in line_items_data)
         total = base_rent + extras
 
-        invoice = Invoice.objects.create(
-            landlord=landlord,
-            total_amount=total,
-            **validated_data,
-        )
+        with transaction.atomic():
+            invoice = Invoice.objects.create(
+                landlord=landlord,
+                total_amount=total,
+                **validated_data,
+            )
+
+            InvoiceLineItem.objects.bulk_create([
+                InvoiceLineItem(invoice=invoice, **{**item, 'order': i})
+                for i, item in enumerate(line_items_data)
+            ])
 
-        for i, item in enumerate(line_items_data):
-            InvoiceLineItem.objects.create(invoice=invoice, order=i, **item)
+            adjust_outstanding(invoice.tenant_id, invoice.remaining_balance)
 
         return invoice
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class InvoiceGenerateSerializer(serializers.Serializer):
+    """Input for bulk monthly invoice generation."""
+    month = serializers.IntegerField(min_value=1, max_value=12)
+    year = serializers.IntegerField(min_value=2000, max_value=2100)
+    invoice_date = serializers.DateField(required=False)
+    due_date = serializers.DateField(required=False)
+    dry_run = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        invoice_date = data.get('invoice_date')
+        due_date = data.get('due_date')
+        if invoice_date and due_date and due_date < invoice_date:
+            raise serializers.ValidationError({'due_date': 'Due date cannot be before invoice date.'})
+        return data
+
+
+class PaymentImportSerializer(serializers.Serializer):
+    """Input for bulk payment import from a statement file."""
+    file = serializers.FileField()
+    method = serializers.ChoiceField(choices=Payment.METHOD_CHOICES)
+    dry_run = serializers.BooleanField(required=False, default=False)
+
+
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_relations = {
+        'invoice_display': ('invoice__unit__apartment',),
+        'tenant_name': ('invoice__tenant',),
+        'recorded_by_name': ('recorded_by',),
+    }
+
     invoice_display = serializers.CharField(source='invoice.__str__', read_only=True)
     tenant_name = serializers.CharField(source='invoice.tenant.get_full_name', read_only=True)
     recorded_by_name = serializers.CharField(source='recorded_by.get_full_name', read_only=True)
-    balance_after = serializers.ReadOnlyField()
+    # A JSON number, as it was when the balance was computed per row.
+    balance_after = serializers.DecimalField(
+        max_digits=12, decimal_places=2, coerce_to_string=False, read_only=True,
+    )
 
     class Meta:
         model = Payment
@@ -128,7 +176,7 @@ class PaymentSerializer(serializers.ModelSerializer):
             'notes', 'recorded_by', 'recorded_by_name',
             'balance_after', 'created_at',
         )
-        read_only_fields = ('id', 'recorded_by', 'created_at')
+        read_only_fields = ('id', 'recorded_by', 'balance_after', 'created_at')
 
 
 class PaymentCreateSerializer(serializers.ModelSerializer):
@@ -144,7 +192,7 @@ class PaymentCreateSerializer(serializers.ModelSerializer):
     def validate(self, data):
         invoice = data.get('invoice')
         landlord = self.context['request'].user
-        if invoice.landlord != landlord:
+        if invoice.landlord_id != landlord.id:
             raise serializers.ValidationError({'invoice': 'Invoice not found.'})
         return data
 
@@ -152,14 +200,18 @@ class PaymentCreateSerializer(serializers.ModelSerializer):
         invoice = validated_data['invoice']
         amount = validated_data['amount']
 
-        payment = Payment.objects.create(
-            recorded_by=self.context['request'].user,
-            **validated_data,
-        )
-
-        # Update invoice
-        invoice.amount_paid += amount
-        invoice.save(update_fields=['amount_paid', 'updated_at'])
-        invoice.refresh_status()
+        with transaction.atomic():
+            # One UPDATE applies the payment and status, then we read back the
+            # row it locked; the in-memory invoice may be stale under concurrency.
+            Invoice.objects.filter(pk=invoice.pk).apply_payment(amount)
+            invoice.refresh_from_db(fields=['total_amount', 'amount_paid', 'status', 'updated_at'])
+            balance_before = max(invoice.total_amount - (invoice.amount_paid - amount), Decimal('0.00'))
+            adjust_outstanding(invoice.tenant_id, invoice.remaining_balance - balance_before)
+
+            payment = Payment.objects.create(
+                recorded_by=self.context['request'].user,
+                balance_after=invoice.remaining_balance,
+                **validated_data,
+            )
 
         return payment
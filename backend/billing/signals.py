@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after set-based writes that bypass post_save / post_delete (bulk_create,
+# queryset updates) on invoices or payments. ``landlord_ids``: landlords affected.
+invoices_changed = Signal()
@@ -0,0 +1,717 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import ExitStack
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.db.models import F
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from properties.models import Apartment, TenantProfile, Unit
+from properties.serializers import UnitSerializer
+from rental_system.fieldsets import load_related
+from rental_system.query_budget import query_budget, track_queries
+from reports.views import _payment_rows
+from users.models import User
+
+from .endpoint_suite import (
+    BUDGET_SCALES, ENDPOINTS, EndpointSuite, quiet_request_logs, settings_overrides, uncovered_url_names,
+)
+from . import jobs, mpesa, pdf_cache
+from .ledger import recompute_outstanding
+from .list_values import InvoiceListValues, PaymentValues
+from .management.commands.benchmark_list_serialization import _payment_rows_in_python
+from .models import Invoice, InvoiceLineItem, Payment, PaymentEvent, PdfJob
+from .payment_import import SKIP_DUPLICATE, SKIP_UNMATCHED, import_payments
+from .sample_data import create_portfolio
+from .serializers import InvoiceListSerializer, PaymentSerializer
+
+_module_context = ExitStack()
+
+
+def create_tenancy(prefix, rent='1000.00'):
+    """A landlord with one apartment and one occupied unit; returns (landlord, tenant profile)."""
+    landlord = User.objects.create_user(f'{prefix}-landlord', password='x', role=User.LANDLORD)
+    tenant = User.objects.create_user(f'{prefix}-tenant', password='x', role=User.TENANT, phone='0700000001')
+    apartment = Apartment.objects.create(
+        landlord=landlord, name=f'{prefix.title()} Court', address='1 Test Road', city='Nairobi',
+    )
+    unit = Unit.objects.create(
+        apartment=apartment, unit_number=f'{prefix.upper()}1', base_rent=Decimal(rent), status=Unit.OCCUPIED,
+    )
+    profile = TenantProfile.objects.create(
+        user=tenant, unit=unit, landlord=landlord, id_number=f'{prefix}-0001', move_in_date=date(2020, 1, 1),
+    )
+    return landlord, profile
+
+
+def create_invoice(profile, month=None, year=None, total='1000.00'):
+    """An unpaid invoice for ``profile``, due in 30 days, with the tenant's balance updated."""
+    today = date.today()
+    invoice = Invoice.objects.create(
+        unit=profile.unit, tenant=profile.user, landlord=profile.landlord,
+        month=month or today.month, year=year or today.year,
+        invoice_date=today, due_date=today + timedelta(days=30),
+        base_rent=Decimal(total), total_amount=Decimal(total),
+    )
+    recompute_outstanding([profile.user_id])
+    return invoice
+
+
+def setUpModule():
+    # QueryTimingMiddleware logs a JSON line per request.
+    _module_context.enter_context(quiet_request_logs())
+
+
+def tearDownModule():
+    _module_context.close()
+
+
+@override_settings(**settings_overrides('qb-large'))
+class QueryBudgetTests(TestCase):
+    """Every endpoint in billing.endpoint_suite.ENDPOINTS stays within its query budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.portfolios = {run: create_portfolio(f'qb-{run}', **scale) for run, scale in BUDGET_SCALES.items()}
+
+    def test_every_endpoint_has_a_budget(self):
+        self.assertEqual(uncovered_url_names(), set())
+
+    def test_endpoints_within_budget(self):
+        suites = {run: EndpointSuite(ids, run) for run, ids in self.portfolios.items()}
+        for endpoint in ENDPOINTS:
+            label, budget = endpoint[0], endpoint[-1]
+            with self.subTest(label):
+                # request() reads streamed bodies (CSV/NDJSON, ZIP) to the end,
+                # so the queries made while they stream count too.
+                with track_queries() as small:
+                    suites['small'].request(endpoint)
+                with query_budget(budget, label) as large:
+                    response = suites['large'].request(endpoint)
+                self.assertLess(response.status_code, 500)
+                self.assertNotIn(response.status_code, (401, 403))
+                self.assertLessEqual(large.count, small.count, f'{label} makes more queries as the data grows')
+
+
+class SparseFieldsTests(TestCase):
+    """``?fields=`` / ``?omit=`` (rental_system.fieldsets) on the list and detail views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = create_portfolio('sparse', units_per_apartment=2, months=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.ids['landlord']))
+
+    def _rows(self, url, **params):
+        response = self.client.get(url, {'paginate': 'false', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fields_keeps_only_the_named_fields(self):
+        rows = self._rows('/api/invoices/', fields='id, total_amount,status')
+        self.assertTrue(rows)
+        self.assertEqual({frozenset(row) for row in rows}, {frozenset({'id', 'total_amount', 'status'})})
+        unit = self.client.get(f'/api/units/{self.ids["units"][0]}/', {'fields': 'id,unit_number'}).json()
+        self.assertEqual(set(unit), {'id', 'unit_number'})
+
+    def test_omit_drops_the_named_fields(self):
+        everything = set(PaymentSerializer().fields)
+        rows = self._rows('/api/payments/', omit='tenant_name,recorded_by_name')
+        self.assertEqual(set(rows[0]), everything - {'tenant_name', 'recorded_by_name'})
+        rows = self._rows('/api/payments/', fields='id,amount,tenant_name', omit='tenant_name')
+        self.assertEqual(set(rows[0]), {'id', 'amount'})
+
+    def test_unknown_field_names_are_rejected(self):
+        for params in ({'fields': 'id,nope'}, {'omit': 'bogus'}):
+            response = self.client.get('/api/invoices/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params.values())).split(',')[-1], response.data['fields'])
+
+    def test_omitted_fields_skip_their_joins_and_prefetches(self):
+        apartment_name = '"properties_apartment"."name"'
+        with CaptureQueriesContext(connection) as queries:
+            self._rows('/api/units/')
+        self.assertEqual(len(queries), 2)  # units, then their active tenants
+        self.assertIn(apartment_name, queries[0]['sql'])
+        with CaptureQueriesContext(connection) as queries:
+            self._rows('/api/units/', omit='active_tenant_name,apartment_name')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(apartment_name, queries[0]['sql'])
+
+        qs = load_related(Unit.objects.all(), UnitSerializer, {'id', 'apartment_name'})
+        self.assertEqual((qs.query.select_related, qs._prefetch_related_lookups), ({'apartment': {}}, ()))
+        qs = load_related(Unit.objects.all(), UnitSerializer, None)
+        self.assertEqual(len(qs._prefetch_related_lookups), 1)
+
+
+class ListValuesTests(TestCase):
+    """The values() list path (billing.list_values) renders the serializers' exact JSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        ids = create_portfolio('values', units_per_apartment=3, months=2)
+        # Rows the sample data lacks: a tenant without a name, overdue and
+        # partly paid invoices, and payments with no recorder or stored balance.
+        landlord, profile = create_tenancy('values-edge')
+        overdue = create_invoice(profile, month=1, year=2020)
+        Invoice.objects.filter(pk=overdue.pk).update(due_date=date(2020, 1, 5))
+        partial = create_invoice(profile, month=2, year=2020, total='1234.56')
+        Payment.objects.create(invoice=partial, amount=Decimal('0.01'), payment_date=date(2020, 2, 3),
+                               method=Payment.MPESA, notes='first', recorded_by=landlord,
+                               balance_after=Decimal('1234.55'))
+        Payment.objects.create(invoice=partial, amount=Decimal('100.00'), payment_date=date(2020, 2, 4),
+                               method=Payment.OTHER)
+        Invoice.objects.filter(pk=partial.pk).apply_payment(Decimal('100.01'))
+        cls.landlord_ids = [ids['landlord'], landlord.id]
+
+    def _assert_identical(self, serializer_class, values_class, queryset, fields=None):
+        render = JSONRenderer().render
+        expected = render(serializer_class(load_related(queryset, serializer_class, fields),
+                                           many=True, fields=fields).data)
+        values = values_class(fields)
+        self.assertEqual(render(values.serialize(values.queryset(queryset).iterator())), expected, fields)
+
+    def test_invoice_list(self):
+        for landlord_id in self.landlord_ids:
+            invoices = Invoice.objects.filter(landlord_id=landlord_id).with_effective_status()
+            for fields in (None, {'id', 'tenant_name', 'status'}, {'unit_display', 'remaining_balance'}):
+                self._assert_identical(InvoiceListSerializer, InvoiceListValues, invoices, fields)
+
+    def test_payment_list(self):
+        for landlord_id in self.landlord_ids:
+            payments = Payment.objects.filter(invoice__landlord_id=landlord_id)
+            for fields in (None, {'invoice_display', 'recorded_by_name'}, {'id', 'balance_after'}):
+                self._assert_identical(PaymentSerializer, PaymentValues, payments, fields)
+
+    def test_payment_report_rows(self):
+        for landlord_id in self.landlord_ids:
+            payments = Payment.objects.filter(invoice__landlord_id=landlord_id)
+            self.assertEqual(list(_payment_rows(payments)), list(_payment_rows_in_python(payments)))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locking between connections (PostgreSQL)')
+class ConcurrentPaymentTests(TransactionTestCase):
+    """Parallel POST /api/payments/ against one invoice must not lose updates."""
+
+    THREADS = 10
+
+    def setUp(self):
+        self.landlord, self.profile = create_tenancy('conc')
+        self.invoice = create_invoice(self.profile)
+
+    def _pay_in_parallel(self, amount):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def pay():
+            client = APIClient()
+            client.force_authenticate(self.landlord)
+            try:
+                barrier.wait()
+                response = client.post('/api/payments/', {
+                    'invoice': self.invoice.id, 'amount': str(amount),
+                    'payment_date': str(date.today()), 'method': Payment.CASH,
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_partial_payments_add_up(self):
+        statuses = self._pay_in_parallel(Decimal('35.50'))
+
+        self.assertEqual(statuses, [201] * self.THREADS)
+        self.invoice.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.invoice.amount_paid, Decimal('355.00'))
+        self.assertEqual(self.invoice.status, Invoice.PARTIAL)
+        self.assertEqual(self.profile.outstanding_balance, Decimal('645.00'))
+        # Every payment saw a different running balance.
+        balances = sorted(Payment.objects.filter(invoice=self.invoice).values_list('balance_after', flat=True))
+        self.assertEqual(balances, [Decimal('1000.00') - Decimal('35.50') * n for n in range(self.THREADS, 0, -1)])
+
+    def test_payments_settle_the_invoice_exactly(self):
+        statuses = self._pay_in_parallel(Decimal('100.00'))
+
+        self.assertEqual(statuses, [201] * self.THREADS)
+        self.invoice.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.invoice.amount_paid, Decimal('1000.00'))
+        self.assertEqual(self.invoice.status, Invoice.PAID)
+        self.assertEqual(self.profile.outstanding_balance, Decimal('0.00'))
+
+
+class ConditionalListTests(TestCase):
+    """List ETags change with writes in their own scope and only there."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ours = create_portfolio('etag-ours', units_per_apartment=2, months=2)
+        cls.theirs = create_portfolio('etag-theirs', units_per_apartment=2, months=2)
+
+    def setUp(self):
+        self.landlord = User.objects.get(pk=self.ours['landlord'])
+        self.tenant = User.objects.get(pk=self.ours['tenants'][0])
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def _etag(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def _status(self, client, url, etag):
+        return client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def _pay(self, ids, reference):
+        landlord = User.objects.get(pk=ids['landlord'])
+        invoice = Invoice.objects.filter(landlord=landlord, amount_paid__lt=F('total_amount')).first()
+        response = self._client(landlord).post('/api/payments/', {
+            'invoice': invoice.id, 'amount': '1.00', 'payment_date': str(date.today()),
+            'method': Payment.CASH, 'reference_number': reference,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_unchanged_list_is_not_modified(self):
+        client = self._client(self.landlord)
+        for url in ('/api/invoices/', '/api/payments/'):
+            self.assertEqual(self._status(client, url, self._etag(client, url)), 304)
+
+    def test_write_in_scope_changes_the_etag(self):
+        landlord, tenant = self._client(self.landlord), self._client(self.tenant)
+        etags = {url: self._etag(landlord, url) for url in ('/api/invoices/', '/api/payments/')}
+        portal = self._etag(tenant, '/api/tenant/invoices/')
+
+        self._pay(self.ours, 'ETAG-OURS')
+
+        for url, etag in etags.items():
+            self.assertEqual(self._status(landlord, url, etag), 200)
+        # Renaming the tenant's unit changes the display strings in their portal.
+        portal = self._etag(tenant, '/api/tenant/invoices/')
+        unit = Unit.objects.get(tenant_profiles__user=self.tenant)
+        unit.unit_number = 'Z9'
+        unit.save()
+        self.assertEqual(self._status(tenant, '/api/tenant/invoices/', portal), 200)
+
+    def test_write_in_another_scope_keeps_the_etag(self):
+        landlord, tenant = self._client(self.landlord), self._client(self.tenant)
+        urls = {landlord: ('/api/invoices/', '/api/payments/'), tenant: ('/api/tenant/invoices/',)}
+        etags = {(client, url): self._etag(client, url) for client, client_urls in urls.items() for url in client_urls}
+
+        self._pay(self.theirs, 'ETAG-THEIRS')
+        other_unit = Unit.objects.get(pk=self.theirs['units'][0])
+        other_unit.unit_number = 'Y8'
+        other_unit.save()
+
+        for (client, url), etag in etags.items():
+            self.assertEqual(self._status(client, url, etag), 304, url)
+
+
+class PaymentImportTests(TestCase):
+    """Statement rows are matched to the landlord's invoices, oldest first, once per reference."""
+
+    def setUp(self):
+        self.landlord, self.profile = create_tenancy('import')
+        self.older = create_invoice(self.profile, month=1, year=2030)
+        self.newer = create_invoice(self.profile, month=2, year=2030)
+        Payment.objects.create(invoice=self.newer, amount=Decimal('1.00'), payment_date=date(2030, 2, 1),
+                               method=Payment.BANK_TRANSFER, reference_number='PAID1')
+        Invoice.objects.filter(pk=self.newer.pk).apply_payment(Decimal('1.00'))
+        # Another landlord's statement used the same bank reference.
+        _, other = create_tenancy('other')
+        Payment.objects.create(invoice=create_invoice(other), amount=Decimal('5.00'),
+                               payment_date=date(2030, 1, 2), method=Payment.BANK_TRANSFER,
+                               reference_number='SHARED1')
+        recompute_outstanding([self.profile.user_id])
+
+    def _import(self, **kwargs):
+        rows = [
+            'reference,date,amount,account,unit,phone',
+            'R1,2030-01-03,600.00,,IMPORT1,',  # by unit: the older invoice
+            'R2,2030-01-04,400.00,,,+254 700 000001',  # by phone: settles the older invoice
+            f'R3,2030-01-05,300.00,INV-{self.newer.id:05d},,',  # by invoice number
+            'R4,2030-01-06,200.00,import1,,',  # by unit again: the older one is settled now
+            'SHARED1,2030-01-07,100.00,IMPORT1,,',
+            'PAID1,2030-01-08,100.00,IMPORT1,,',
+            'R1,2030-01-09,100.00,IMPORT1,,',
+            'R5,2030-01-10,100.00,NOPE,,',
+        ]
+        statement = io.BytesIO('\n'.join(rows).encode())
+        return import_payments(statement, self.landlord, Payment.BANK_TRANSFER, batch_size=2, **kwargs)
+
+    def test_rows_are_matched_oldest_first_and_deduplicated(self):
+        report = self._import()
+
+        self.assertEqual(report['created_count'], 5)
+        self.assertEqual(report['total_amount'], '1600.00')
+        self.assertEqual([(entry['reference'], entry['reason']) for entry in report['skipped']], [
+            ('PAID1', SKIP_DUPLICATE), ('R1', SKIP_DUPLICATE), ('R5', SKIP_UNMATCHED),
+        ])
+        placed = dict(Payment.objects.filter(invoice__landlord=self.landlord).values_list(
+            'reference_number', 'invoice_id',
+        ))
+        self.assertEqual(placed, {
+            'PAID1': self.newer.id, 'R1': self.older.id, 'R2': self.older.id,
+            'R3': self.newer.id, 'R4': self.newer.id, 'SHARED1': self.newer.id,
+        })
+        self.older.refresh_from_db()
+        self.newer.refresh_from_db()
+        self.assertEqual((self.older.amount_paid, self.older.status), (Decimal('1000.00'), Invoice.PAID))
+        self.assertEqual(self.newer.amount_paid, Decimal('601.00'))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.outstanding_balance, Decimal('399.00'))
+
+    def test_dry_run_writes_and_locks_nothing(self):
+        with mock.patch.object(Invoice.objects, 'select_for_update') as lock:
+            report = self._import(dry_run=True)
+        lock.assert_not_called()
+        self.assertEqual((report['created_count'], report['skipped_count']), (5, 3))
+        self.assertEqual(Payment.objects.filter(invoice__landlord=self.landlord).count(), 1)
+        self.older.refresh_from_db()
+        self.assertEqual(self.older.amount_paid, Decimal('0.00'))
+
+
+class PaymentBalanceBackfillTests(TestCase):
+    """backfill_payment_balances stores each payment's running invoice balance."""
+
+    def setUp(self):
+        self.landlord, profile = create_tenancy('backfill')
+        invoices = [create_invoice(profile, month=1, year=2030), create_invoice(profile, month=2, year=2030)]
+        # The third payment on the first invoice overpays it.
+        for invoice, amount in zip(invoices * 3, ('300.00', '50.00', '500.00', '25.00', '400.00', '25.00')):
+            Payment.objects.create(invoice=invoice, amount=Decimal(amount), payment_date=date(2030, 1, 10),
+                                   method=Payment.CASH)
+        self.invoice_ids = [invoice.id for invoice in invoices]
+
+    def _backfill(self):
+        call_command('backfill_payment_balances', '--chunk-size', '1', stdout=io.StringIO())
+
+    def test_backfill_matches_the_running_balance(self):
+        self._backfill()
+
+        stored = list(Payment.objects.order_by('id').values_list('invoice_id', 'balance_after'))
+        first, second = self.invoice_ids
+        self.assertEqual(stored, [
+            (first, Decimal('700.00')), (second, Decimal('950.00')), (first, Decimal('200.00')),
+            (second, Decimal('925.00')), (first, Decimal('0.00')), (second, Decimal('900.00')),
+        ])
+        running = Payment.objects.filter(invoice_id__in=self.invoice_ids).with_running_balance()
+        self.assertEqual(dict(running.values_list('id', 'running_balance')),
+                         dict(Payment.objects.values_list('id', 'balance_after')))
+
+    def test_balance_after_is_a_json_number(self):
+        self._backfill()
+        client = APIClient()
+        client.force_authenticate(self.landlord)
+        response = client.get('/api/payments/', {'paginate': 'false'})
+        self.assertEqual(response.status_code, 200)
+        balances = sorted(row['balance_after'] for row in response.json())
+        self.assertEqual(balances, [0, 200, 700, 900, 925, 950])
+        self.assertTrue(all(type(balance) is float for balance in balances))
+
+
+class OutstandingBalanceTests(TestCase):
+    """Every write path keeps TenantProfile.outstanding_balance equal to a full recompute."""
+
+    def setUp(self):
+        self.landlord, self.profile = create_tenancy('ledger')
+        self.client = APIClient()
+        self.client.force_authenticate(self.landlord)
+
+    def assert_consistent(self, step, expected):
+        self.profile.refresh_from_db()
+        stored = self.profile.outstanding_balance
+        recompute_outstanding([self.profile.user_id])
+        self.profile.refresh_from_db()
+        self.assertEqual(stored, Decimal(expected), step)
+        self.assertEqual(self.profile.outstanding_balance, stored, step)
+
+    def _post(self, url, body, **kwargs):
+        response = self.client.post(url, body, **kwargs)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def _create_invoice(self, month):
+        return self._post('/api/invoices/', {
+            'unit': self.profile.unit_id, 'tenant': self.profile.user_id, 'month': month, 'year': 2030,
+            'invoice_date': '2030-01-01', 'due_date': '2030-01-05', 'base_rent': '1000.00',
+            'line_items': [{'description': 'Water', 'amount': '100.00', 'order': 0}],
+        }, format='json')['id']
+
+    def test_write_paths(self):
+        first = self._create_invoice(1)
+        self.assert_consistent('invoice create', '1100.00')
+
+        self._post('/api/invoices/generate/', {'month': 2, 'year': 2030}, format='json')
+        second = Invoice.objects.get(tenant=self.profile.user, month=2, year=2030)
+        self.assert_consistent('invoice generation', '2100.00')
+
+        self._post('/api/payments/', {
+            'invoice': first, 'amount': '150.00', 'payment_date': '2030-01-10', 'method': Payment.CASH,
+        }, format='json')
+        self.assert_consistent('payment create', '1950.00')
+
+        rows = ['reference,date,amount,account', f'LEDGER1,2030-01-11,200.00,INV-{first:05d}']
+        statement = io.BytesIO('\n'.join(rows).encode())
+        statement.name = 'statement.csv'
+        self._post('/api/payments/import/', {'method': Payment.BANK_TRANSFER, 'file': statement}, format='multipart')
+        self.assert_consistent('payment import', '1750.00')
+
+        with override_settings(**{**MPESA_SETTINGS, 'MPESA_SHORTCODES': {'600123': self.landlord.username}}):
+            mpesa.record_callback(mpesa_callback('LEDGER2', f'INV-{second.id:05d}', amount='300.00'))
+            mpesa.run_applier(once=True)
+        self.assertEqual(PaymentEvent.objects.get(transaction_id='LEDGER2').status, PaymentEvent.APPLIED)
+        self.assert_consistent('M-Pesa apply', '1450.00')
+
+        third = self._create_invoice(3)
+        self.assert_consistent('invoice create', '2550.00')
+        response = self.client.delete(f'/api/invoices/{third}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent('invoice delete', '1450.00')
+
+
+MPESA_SETTINGS = {'MPESA_CALLBACK_TOKEN': 'test-callback', 'MPESA_SHORTCODES': {'600123': 'mpesa-landlord'}}
+
+
+def mpesa_callback(trans_id, account, amount='100.00'):
+    return {
+        'TransID': trans_id, 'TransTime': '20300105101500', 'TransAmount': amount,
+        'BusinessShortCode': '600123', 'BillRefNumber': account, 'MSISDN': '254700000001',
+    }
+
+
+def assert_balances(test, invoice, paid):
+    """``invoice`` has ``paid`` applied and its tenant's stored balance matches a recompute."""
+    invoice.refresh_from_db()
+    test.assertEqual(invoice.amount_paid, Decimal(paid))
+    profile = TenantProfile.objects.get(user_id=invoice.tenant_id)
+    stored = profile.outstanding_balance
+    recompute_outstanding([invoice.tenant_id])
+    profile.refresh_from_db()
+    test.assertEqual(stored, profile.outstanding_balance)
+    test.assertEqual(stored, max(invoice.total_amount - invoice.amount_paid, Decimal('0.00')))
+
+
+@override_settings(**MPESA_SETTINGS)
+class MpesaApplierTests(TestCase):
+    """Queued M-Pesa callbacks become payments once per transaction id."""
+
+    def setUp(self):
+        self.landlord, self.profile = create_tenancy('mpesa')
+        self.invoice = create_invoice(self.profile)
+
+    def test_duplicates_are_applied_once(self):
+        account = f'INV-{self.invoice.id:05d}'
+        Payment.objects.create(invoice=self.invoice, amount=Decimal('1.00'), payment_date=date.today(),
+                               method=Payment.MPESA, reference_number='RECORDED1')
+        Invoice.objects.filter(pk=self.invoice.pk).apply_payment(Decimal('1.00'))
+        recompute_outstanding([self.profile.user_id])
+        for trans_id in ('TX1', 'TX2', 'TX1', 'RECORDED1'):
+            mpesa.record_callback(mpesa_callback(trans_id, account))
+        mpesa.record_callback(mpesa_callback('TX3', account, amount='50.00'))
+
+        counts = mpesa.apply_events(batch_size=2)  # TX1 again in the next batch
+        counts.update(mpesa.run_applier(once=True))
+
+        statuses = sorted(PaymentEvent.objects.values_list('transaction_id', 'status'))
+        self.assertEqual(statuses, [
+            ('RECORDED1', PaymentEvent.DUPLICATE), ('TX1', PaymentEvent.APPLIED), ('TX1', PaymentEvent.DUPLICATE),
+            ('TX2', PaymentEvent.APPLIED), ('TX3', PaymentEvent.APPLIED),
+        ])
+        self.assertEqual(Payment.objects.filter(reference_number='TX1').count(), 1)
+        assert_balances(self, self.invoice, '251.00')
+        balances = list(Payment.objects.filter(reference_number__startswith='TX').order_by('id').values_list(
+            'balance_after', flat=True,
+        ))
+        self.assertEqual(balances, [Decimal('899.00'), Decimal('799.00'), Decimal('749.00')])
+
+    def test_unmatched_event_is_applied_after_retry(self):
+        # Paid by unit number before next month's invoice exists.
+        unit_number = self.profile.unit.unit_number
+        Invoice.objects.filter(pk=self.invoice.pk).apply_payment(self.invoice.total_amount)
+        mpesa.record_callback(mpesa_callback('EARLY1', unit_number))
+        mpesa.run_applier(once=True)
+        resent = mpesa.record_callback(mpesa_callback('EARLY1', unit_number))  # provider retry
+        mpesa.run_applier(once=True)
+        event = PaymentEvent.objects.get(transaction_id='EARLY1', pk__lt=resent.pk)
+        self.assertEqual(event.status, PaymentEvent.UNMATCHED)
+
+        today = date.today()
+        next_month = create_invoice(self.profile, month=today.month % 12 + 1, year=today.year + (today.month == 12))
+        mpesa.run_applier(once=True)
+        event.refresh_from_db()
+        self.assertEqual(event.status, PaymentEvent.UNMATCHED)  # not retried on its own
+
+        out = io.StringIO()
+        call_command('apply_payment_events', '--retry-unmatched', stdout=out)
+        self.assertIn('Requeued 2 unmatched event(s).', out.getvalue())
+        event.refresh_from_db()
+        resent.refresh_from_db()
+        self.assertEqual((event.status, resent.status), (PaymentEvent.APPLIED, PaymentEvent.DUPLICATE))
+        self.assertEqual(event.payment.invoice_id, next_month.id)
+        assert_balances(self, next_month, '100.00')
+
+
+@override_settings(**MPESA_SETTINGS)
+class SimulatedMpesaCallbackTests(LiveServerTestCase):
+    """simulate_mpesa_callbacks against the real callback URL, then the applier."""
+
+    def test_simulated_callbacks_with_resends(self):
+        landlord, profile = create_tenancy('mpesa', rent='100000.00')
+        invoice = create_invoice(profile, total='100000.00')
+        url = f'{self.live_server_url}/api/mpesa/callback/{MPESA_SETTINGS["MPESA_CALLBACK_TOKEN"]}/'
+        with quiet_request_logs():
+            call_command(
+                'simulate_mpesa_callbacks', url, '--shortcode', '600123', '--count', '40',
+                '--concurrency', '1', '--duplicates', '0.3', '--amount', '25.00',
+                '--account', f'INV-{invoice.id:05d}', stdout=io.StringIO(),
+            )
+        self.assertEqual(PaymentEvent.objects.count(), 40)
+        unique = PaymentEvent.objects.values('transaction_id').distinct().count()
+
+        counts = mpesa.run_applier(once=True)
+
+        self.assertEqual(counts.get(PaymentEvent.APPLIED), unique)
+        self.assertEqual(counts.get(PaymentEvent.DUPLICATE, 0), 40 - unique)
+        self.assertEqual(Payment.objects.filter(invoice=invoice).count(), unique)
+        assert_balances(self, invoice, Decimal('25.00') * unique)
+
+
+class PdfCacheTests(TestCase):
+    """Cached invoice PDFs: hits, invalidation by fingerprint and LRU eviction."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = override_settings(PDF_CACHE_DIR=directory, PDF_CACHE_ENABLED=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        pdf_cache._reset_estimate()
+        self.addCleanup(pdf_cache._reset_estimate)
+        self.landlord, profile = create_tenancy('pdf')
+        invoice = create_invoice(profile)
+        InvoiceLineItem.objects.create(invoice=invoice, description='Water', amount=Decimal('500.00'), order=1)
+        self.invoice_id = invoice.id
+        self.client = APIClient()
+        self.client.force_authenticate(self.landlord)
+
+    def _download(self):
+        response = self.client.get(f'/api/invoices/{self.invoice_id}/pdf/')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_second_download_is_a_hit(self):
+        with mock.patch.object(pdf_cache, 'generate_invoice_pdf', return_value=b'%PDF-1') as render:
+            self.assertEqual(self._download(), b'%PDF-1')
+            self.assertEqual(self._download(), b'%PDF-1')
+        self.assertEqual(render.call_count, 1)
+
+    def test_fingerprint_uses_the_line_item_prefetch(self):
+        invoice = Invoice.objects.for_detail().get(pk=self.invoice_id)
+        with self.assertNumQueries(1):  # the payments aggregate only
+            fingerprint = pdf_cache.invoice_fingerprint(invoice)
+        self.assertEqual(fingerprint, pdf_cache.invoice_fingerprint(Invoice.objects.get(pk=self.invoice_id)))
+
+    def test_change_renders_a_new_version_and_drops_the_old(self):
+        with mock.patch.object(pdf_cache, 'generate_invoice_pdf', side_effect=[b'%PDF-old', b'%PDF-new']):
+            self.assertEqual(self._download(), b'%PDF-old')
+            InvoiceLineItem.objects.filter(invoice_id=self.invoice_id).update(description='Water and sewer')
+            self.assertEqual(self._download(), b'%PDF-new')
+        entries = list((pdf_cache.cache_dir() / pdf_cache.INVOICE).glob('*.pdf'))
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].read_bytes(), b'%PDF-new')
+
+    def test_least_recently_used_entries_are_evicted_over_the_limit(self):
+        with override_settings(PDF_CACHE_MAX_BYTES=2500):
+            for n in range(1, 3):
+                pdf_cache.store(pdf_cache.RECEIPT, n, 'f', b'x' * 1000)
+            pdf_cache.lookup(pdf_cache.RECEIPT, 1, 'f')  # 1 is now more recent than 2
+            paths = [pdf_cache._entry_path(pdf_cache.RECEIPT, n, 'f') for n in range(1, 4)]
+            os.utime(paths[1], (1, 1))
+            with mock.patch.object(pdf_cache, '_entries', wraps=pdf_cache._entries) as scan:
+                pdf_cache.store(pdf_cache.RECEIPT, 3, 'f', b'x' * 1000)
+            self.assertEqual(scan.call_count, 1)  # over the limit: one scan to evict
+            self.assertEqual([p.exists() for p in paths], [True, False, True])
+
+            with mock.patch.object(pdf_cache, '_entries', wraps=pdf_cache._entries) as scan:
+                pdf_cache.store(pdf_cache.RECEIPT, 4, 'f', b'x' * 100)
+            self.assertEqual(scan.call_count, 0)  # under the limit: no scan
+
+
+class PdfJobTests(TestCase):
+    """Background PDF jobs: retries up to MAX_ATTEMPTS, and downloads of evicted files."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = override_settings(PDF_CACHE_DIR=directory, PDF_CACHE_ENABLED=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        pdf_cache._reset_estimate()
+        self.addCleanup(pdf_cache._reset_estimate)
+        self.landlord, profile = create_tenancy('jobs')
+        self.invoice = create_invoice(profile)
+        self.client = APIClient()
+        self.client.force_authenticate(self.landlord)
+
+    def _queue(self):
+        response = self.client.get(f'/api/invoices/{self.invoice.id}/pdf/', {'async': 'true'})
+        self.assertEqual(response.status_code, 202)
+        return PdfJob.objects.get(pk=response.data['job_id'])
+
+    def test_job_that_stops_its_worker_fails_after_max_attempts(self):
+        job = self._queue()
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            self.assertEqual([claimed.pk for claimed in jobs.claim(1)], [job.pk])
+            # The worker dies mid-render; housekeeping finds the job still running.
+            PdfJob.objects.filter(pk=job.pk).update(started_at=F('started_at') - timedelta(hours=1))
+            self.assertEqual(jobs.requeue_stale(timeout=60), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.attempts, job.status),
+                             (attempt, PdfJob.QUEUED if attempt < jobs.MAX_ATTEMPTS else PdfJob.FAILED))
+        self.assertIn(f'gave up after {jobs.MAX_ATTEMPTS} attempts', job.error)
+        self.assertEqual(jobs.claim(1), [])
+
+    def test_failing_render_is_retried_then_fails(self):
+        job = self._queue()
+        with mock.patch.object(jobs, 'render_document', side_effect=RuntimeError('bad font')) as render, \
+                mock.patch.object(jobs.logger, 'exception'):
+            jobs.run_worker(concurrency=0, once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (PdfJob.FAILED, jobs.MAX_ATTEMPTS, 'bad font'))
+        self.assertEqual(render.call_count, jobs.MAX_ATTEMPTS)
+
+    def test_download_of_an_evicted_file_is_gone(self):
+        job = self._queue()
+        with mock.patch.object(jobs, 'render_document', return_value=b'%PDF-job'):
+            jobs.run_worker(concurrency=0, once=True)
+        url = f'/api/pdf-jobs/{job.pk}/download/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-job')
+
+        pdf_cache.purge()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 410)
+        self.assertNotEqual(self._queue().pk, job.pk)  # asking again queues a new render
@@ -5,14 +5,24 @@ from . import views
 urlpatterns = [
     # Landlord invoice endpoints
     path('invoices/', views.invoice_list, name='invoice-list'),
+    path('invoices/generate/', views.invoice_generate, name='invoice-generate'),
+    path('invoices/export/', views.invoice_export, name='invoice-export'),
     path('invoices/<int:pk>/', views.invoice_detail, name='invoice-detail'),
     path('invoices/<int:pk>/pdf/', views.invoice_pdf, name='invoice-pdf'),
 
     # Landlord payment endpoints
     path('payments/', views.payment_list, name='payment-list'),
+    path('payments/import/', views.payment_import, name='payment-import'),
     path('payments/<int:pk>/', views.payment_detail, name='payment-detail'),
     path('payments/<int:pk>/receipt/', views.payment_receipt, name='payment-receipt'),
 
+    # Background PDF jobs (?async=true on the PDF endpoints)
+    path('pdf-jobs/<int:pk>/', views.pdf_job_status, name='pdf-job-status'),
+    path('pdf-jobs/<int:pk>/download/', views.pdf_job_download, name='pdf-job-download'),
+
+    # Payment provider callbacks
+    path('mpesa/callback/<str:token>/', views.mpesa_callback, name='mpesa-callback'),
+
     # Tenant portal
     path('tenant/invoices/', views.tenant_invoices, name='tenant-invoices'),
     path('tenant/invoices/<int:pk>/', views.tenant_invoice_detail, name='tenant-invoice-detail'),
@@ -1,18 +1,36 @@
+import hmac
 from calendar import month_name
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import Invoice, Payment
+from rental_system.db_routing import replica_reads
+from rental_system.fieldsets import load_related, requested_fields
+from rental_system.pagination import KeysetPagination
+
+from . import jobs, mpesa
+from .conditional import LANDLORD, TENANT, ListValidator
+from .invoicing import generate_monthly_invoices
+from .ledger import adjust_outstanding, recompute_outstanding
+from .list_values import InvoiceListValues, PaymentValues
+from .models import Invoice, Payment, PdfJob
+from .payment_import import ImportFileError, import_payments
+from .pdf_cache import cached_invoice_pdf, cached_receipt_pdf
+from .pdf_export import iter_invoice_zip
 from .pdf_utils import generate_invoice_pdf, generate_receipt_pdf
 from .serializers import (
     InvoiceCreateSerializer,
     InvoiceDetailSerializer,
+    InvoiceGenerateSerializer,
     InvoiceListSerializer,
     PaymentCreateSerializer,
+    PaymentImportSerializer,
     PaymentSerializer,
 )
 
@@ -26,6 +44,83 @@ def landlord_required(func):
     return wrapper
 
 
+def _pdf_response(pdf_bytes, filename):
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _pdf_file_response(fh, filename):
+    """Serve a cached PDF from its open file without reading it into memory."""
+    return FileResponse(fh, as_attachment=True, filename=filename, content_type='application/pdf')
+
+
+def _wants_async(request):
+    return request.query_params.get('async', '').lower() == 'true'
+
+
+def _job_payload(request, job):
+    data = {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('pdf-job-status', args=[job.id])),
+        'download_url': None,
+        'error': job.error or None,
+    }
+    if job.status == PdfJob.DONE:
+        data['download_url'] = request.build_absolute_uri(reverse('pdf-job-download', args=[job.id]))
+    return data
+
+
+def _queue_pdf(request, kind, obj):
+    """Queue a background render and answer 202 with where to poll for it."""
+    job = jobs.enqueue(kind, obj, request.user)
+    return Response(_job_payload(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+def _filter_invoices(qs, params):
+    """Apply the invoice_list query-string filters (qs must have effective_status)."""
+    apartment_id = params.get('apartment')
+    unit_id = params.get('unit')
+    tenant_id = params.get('tenant')
+    month = params.get('month')
+    year = params.get('year')
+    inv_status = params.get('status')
+
+    if apartment_id:
+        qs = qs.filter(unit__apartment_id=apartment_id)
+    if unit_id:
+        qs = qs.filter(unit_id=unit_id)
+    if tenant_id:
+        qs = qs.filter(tenant_id=tenant_id)
+    if month:
+        qs = qs.filter(month=month)
+    if year:
+        qs = qs.filter(year=year)
+    if inv_status:
+        qs = qs.filter(effective_status=inv_status)
+    return qs
+
+
+def _list_response(values_list, qs, request):
+    """Serialize a list from values() (billing.list_values), paginated on request."""
+    rows = values_list.queryset(qs)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(rows, request)
+    if page is not None:
+        return paginator.get_paginated_response(values_list.serialize(page))
+    return Response(values_list.serialize(rows.iterator(chunk_size=2000)))
+
+
+def _invoice_list_response(qs, request, fields):
+    return _list_response(InvoiceListValues(fields), qs, request)
+
+
+def _payment_list_response(qs, request, fields):
+    return _list_response(PaymentValues(fields), qs, request)
+
+
 # ── Invoices ──────────────────────────────────────────────────────────────────
 
 @api_view(['GET', 'POST'])
@@ -33,37 +128,12 @@ def landlord_required(func):
 @landlord_required
 def invoice_list(request):
     if request.method == 'GET':
-        qs = Invoice.objects.filter(landlord=request.user).select_related(
-            'unit', 'unit__apartment', 'tenant'
+        fields = requested_fields(request, InvoiceListSerializer)
+        qs = _filter_invoices(
+            Invoice.objects.filter(landlord=request.user).with_effective_status(), request.query_params,
         )
-        # Filters
-        apartment_id = request.query_params.get('apartment')
-        unit_id = request.query_params.get('unit')
-        tenant_id = request.query_params.get('tenant')
-        month = request.query_params.get('month')
-        year = request.query_params.get('year')
-        inv_status = request.query_params.get('status')
-
-        if apartment_id:
-            qs = qs.filter(unit__apartment_id=apartment_id)
-        if unit_id:
-            qs = qs.filter(unit_id=unit_id)
-        if tenant_id:
-            qs = qs.filter(tenant_id=tenant_id)
-        if month:
-            qs = qs.filter(month=month)
-        if year:
-            qs = qs.filter(year=year)
-        if inv_status:
-            qs = qs.filter(status=inv_status)
-
-        # Refresh overdue status for any unpaid/partial past-due invoices
-        from django.utils import timezone
-        today = timezone.now().date()
-        qs.filter(status__in=['unpaid', 'partial'], due_date__lt=today).update(status='overdue')
-
-        serializer = InvoiceListSerializer(qs, many=True)
-        return Response(serializer.data)
+        validator = ListValidator(request, qs, 'updated_at', (LANDLORD, request.user.pk))
+        return validator.not_modified() or validator.apply(_invoice_list_response(qs, request, fields))
 
     serializer = InvoiceCreateSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
@@ -72,12 +142,44 @@ def invoice_list(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@landlord_required
+def invoice_generate(request):
+    """Bill every occupied unit in the landlord's portfolio for one month."""
+    serializer = InvoiceGenerateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    report = generate_monthly_invoices(landlord=request.user, **serializer.validated_data)
+    code = status.HTTP_200_OK if report['dry_run'] else status.HTTP_201_CREATED
+    return Response(report, status=code)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@landlord_required
+def invoice_export(request):
+    """ZIP of PDFs for every invoice matching the invoice_list filters."""
+    qs = _filter_invoices(
+        Invoice.objects.filter(landlord=request.user).with_effective_status(),
+        request.query_params,
+    ).for_detail()
+    if not qs.exists():
+        return Response({'detail': 'No invoices match these filters.'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(
+        iter_invoice_zip(qs.iterator(chunk_size=100)), content_type='application/zip',
+    )
+    response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
+    return response
+
+
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 @landlord_required
 def invoice_detail(request, pk):
     try:
-        invoice = Invoice.objects.get(pk=pk, landlord=request.user)
+        invoice = Invoice.objects.for_detail().get(pk=pk, landlord=request.user)
     except Invoice.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -95,7 +197,10 @@ def invoice_detail(request, pk):
         serializer = InvoiceCreateSerializer(invoice, data=request.data,
                                              context={'request': request}, partial=partial)
         if serializer.is_valid():
-            invoice = serializer.save()
+            previous_tenant_id = invoice.tenant_id
+            with transaction.atomic():
+                invoice = serializer.save()
+                recompute_outstanding({previous_tenant_id, invoice.tenant_id})
             return Response(InvoiceDetailSerializer(invoice).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -104,27 +209,32 @@ def invoice_detail(request, pk):
             {'detail': 'Cannot delete an invoice that already has payments.'},
             status=status.HTTP_400_BAD_REQUEST,
         )
-    invoice.delete()
+    with transaction.atomic():
+        adjust_outstanding(invoice.tenant_id, -invoice.remaining_balance)
+        invoice.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def invoice_pdf(request, pk):
     """Landlord or the invoice's tenant can download the PDF."""
+    invoices = Invoice.objects.for_detail()
     try:
         if request.user.is_landlord:
-            invoice = Invoice.objects.get(pk=pk, landlord=request.user)
+            invoice = invoices.get(pk=pk, landlord=request.user)
         else:
-            invoice = Invoice.objects.get(pk=pk, tenant=request.user)
+            invoice = invoices.get(pk=pk, tenant=request.user)
     except Invoice.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    pdf_bytes = generate_invoice_pdf(invoice)
+    if _wants_async(request):
+        return _queue_pdf(request, PdfJob.INVOICE, invoice)
     filename = f'invoice-{invoice.id}-{month_name[invoice.month]}-{invoice.year}.pdf'
-    response = HttpResponse(pdf_bytes, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    if settings.PDF_CACHE_ENABLED:
+        return _pdf_file_response(cached_invoice_pdf(invoice), filename)
+    return _pdf_response(generate_invoice_pdf(invoice), filename)
 
 
 # ── Payments ──────────────────────────────────────────────────────────────────
@@ -134,9 +244,8 @@ def invoice_pdf(request, pk):
 @landlord_required
 def payment_list(request):
     if request.method == 'GET':
-        qs = Payment.objects.filter(invoice__landlord=request.user).select_related(
-            'invoice', 'invoice__tenant', 'invoice__unit', 'invoice__unit__apartment'
-        )
+        fields = requested_fields(request, PaymentSerializer)
+        qs = Payment.objects.filter(invoice__landlord=request.user)
         tenant_id = request.query_params.get('tenant')
         invoice_id = request.query_params.get('invoice')
         method = request.query_params.get('method')
@@ -154,69 +263,147 @@ def payment_list(request):
         if date_to:
             qs = qs.filter(payment_date__lte=date_to)
 
-        serializer = PaymentSerializer(qs, many=True)
-        return Response(serializer.data)
+        validator = ListValidator(request, qs, 'created_at', (LANDLORD, request.user.pk))
+        return validator.not_modified() or validator.apply(_payment_list_response(qs, request, fields))
 
     serializer = PaymentCreateSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         payment = serializer.save()
+        # Read back with its relations in one query (request.user only carries the token's fields).
+        payment = load_related(Payment.objects.all(), PaymentSerializer, None).get(pk=payment.pk)
         return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@landlord_required
+def payment_import(request):
+    """Record payments from an uploaded bank / M-Pesa statement CSV."""
+    serializer = PaymentImportSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    try:
+        report = import_payments(
+            data['file'], landlord=request.user, method=data['method'],
+            recorded_by=request.user, dry_run=data['dry_run'],
+        )
+    except ImportFileError as exc:
+        return Response({'file': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    code = status.HTTP_200_OK if report['dry_run'] else status.HTTP_201_CREATED
+    return Response(report, status=code)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @landlord_required
 def payment_detail(request, pk):
+    fields = requested_fields(request, PaymentSerializer)
     try:
-        payment = Payment.objects.get(pk=pk, invoice__landlord=request.user)
+        payment = load_related(Payment.objects.all(), PaymentSerializer, fields).get(
+            pk=pk, invoice__landlord=request.user,
+        )
     except Payment.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
-    return Response(PaymentSerializer(payment).data)
+    return Response(PaymentSerializer(payment, fields=fields).data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @landlord_required
+@replica_reads
 def payment_receipt(request, pk):
     try:
-        payment = Payment.objects.get(pk=pk, invoice__landlord=request.user)
+        payment = Payment.objects.select_related(
+            'invoice', 'invoice__unit', 'invoice__unit__apartment', 'invoice__tenant'
+        ).get(pk=pk, invoice__landlord=request.user)
     except Payment.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    pdf_bytes = generate_receipt_pdf(payment)
+    if _wants_async(request):
+        return _queue_pdf(request, PdfJob.RECEIPT, payment)
     filename = f'receipt-{payment.id}.pdf'
-    response = HttpResponse(pdf_bytes, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    if settings.PDF_CACHE_ENABLED:
+        return _pdf_file_response(cached_receipt_pdf(payment), filename)
+    return _pdf_response(generate_receipt_pdf(payment), filename)
+
+
+# ── Background PDF jobs ────────────────────────────────────────────────────────
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def pdf_job_status(request, pk):
+    """Poll a job queued with ``?async=true`` on the invoice PDF or receipt endpoints."""
+    try:
+        job = PdfJob.objects.get(pk=pk, requested_by=request.user)
+    except PdfJob.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(_job_payload(request, job))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def pdf_job_download(request, pk):
+    try:
+        job = PdfJob.objects.get(pk=pk, requested_by=request.user)
+    except PdfJob.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    if job.status != PdfJob.DONE:
+        return Response(_job_payload(request, job), status=status.HTTP_409_CONFLICT)
+    try:
+        return _pdf_file_response(open(job.file_path, 'rb'), job.filename)
+    except FileNotFoundError:
+        # Evicted from the PDF cache since; the client should request it again.
+        return Response({'detail': 'PDF has expired, please request it again.'},
+                        status=status.HTTP_410_GONE)
+
+
+# ── Payment provider callbacks ────────────────────────────────────────────────
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def mpesa_callback(request, token):
+    """
+    M-Pesa C2B confirmation URL. Only validates and queues the event; it is
+    applied to invoices later by `manage.py apply_payment_events`.
+    """
+    expected = settings.MPESA_CALLBACK_TOKEN
+    if not expected or not hmac.compare_digest(token, expected):
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    error = mpesa.validate_callback(request.data)
+    if error:
+        return Response({'ResultCode': 1, 'ResultDesc': error}, status=status.HTTP_400_BAD_REQUEST)
+    mpesa.record_callback(request.data)
+    return Response({'ResultCode': 0, 'ResultDesc': 'Accepted'})
 
 
 # ── Tenant portal endpoints ───────────────────────────────────────────────────
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def tenant_invoices(request):
     if not request.user.is_tenant:
         return Response({'detail': 'Tenant access only.'}, status=status.HTTP_403_FORBIDDEN)
 
-    from django.utils import timezone
-    today = timezone.now().date()
-    qs = Invoice.objects.filter(tenant=request.user).select_related('unit', 'unit__apartment')
-    # Refresh overdue
-    qs.filter(status__in=['unpaid', 'partial'], due_date__lt=today).update(status='overdue')
-
-    serializer = InvoiceListSerializer(qs, many=True)
-    return Response(serializer.data)
+    fields = requested_fields(request, InvoiceListSerializer)
+    qs = Invoice.objects.filter(tenant=request.user).with_effective_status()
+    validator = ListValidator(request, qs, 'updated_at', (TENANT, request.user.pk))
+    return validator.not_modified() or validator.apply(_invoice_list_response(qs, request, fields))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def tenant_invoice_detail(request, pk):
     if not request.user.is_tenant:
         return Response({'detail': 'Tenant access only.'}, status=status.HTTP_403_FORBIDDEN)
 
     try:
-        invoice = Invoice.objects.get(pk=pk, tenant=request.user)
+        invoice = Invoice.objects.for_detail().get(pk=pk, tenant=request.user)
     except Invoice.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -225,12 +412,12 @@ def tenant_invoice_detail(request, pk):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def tenant_payments(request):
     if not request.user.is_tenant:
         return Response({'detail': 'Tenant access only.'}, status=status.HTTP_403_FORBIDDEN)
 
-    qs = Payment.objects.filter(invoice__tenant=request.user).select_related(
-        'invoice', 'invoice__unit', 'invoice__unit__apartment'
-    )
-    serializer = PaymentSerializer(qs, many=True)
-    return Response(serializer.data)
+    fields = requested_fields(request, PaymentSerializer)
+    qs = Payment.objects.filter(invoice__tenant=request.user)
+    validator = ListValidator(request, qs, 'created_at', (TENANT, request.user.pk))
+    return validator.not_modified() or validator.apply(_payment_list_response(qs, request, fields))
@@ -14,8 +14,12 @@ class ApartmentAdmin(admin.ModelAdmin):
     list_display = ('name', 'city', 'landlord', 'total_units', 'occupied_units')
     list_filter = ('city',)
     search_fields = ('name', 'city', 'landlord__username')
+    list_select_related = ('landlord',)
     inlines = [UnitInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_unit_counts()
+
 
 @admin.register(Unit)
 class UnitAdmin(admin.ModelAdmin):
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:01
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def populate_outstanding_balance(apps, schema_editor):
+    Invoice = apps.get_model('billing', 'Invoice')
+    TenantProfile = apps.get_model('properties', 'TenantProfile')
+    zero = Value(Decimal('0.00'))
+    totals = Invoice.objects.filter(tenant_id=OuterRef('user_id')).order_by().values(
+        'tenant_id',
+    ).annotate(total=Sum(Greatest(F('total_amount') - F('amount_paid'), zero))).values('total')
+    TenantProfile.objects.update(outstanding_balance=Coalesce(
+        Subquery(totals, output_field=DecimalField(max_digits=12, decimal_places=2)), zero,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0002_initial'),
+        ('billing', '0004_payment_balance_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenantprofile',
+            name='outstanding_balance',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12),
+        ),
+        migrations.RunPython(populate_outstanding_balance, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,20 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.db import models
 
 
+class ApartmentQuerySet(models.QuerySet):
+    def with_unit_counts(self):
+        """Annotate active unit totals in one grouped query (see Apartment.total_units)."""
+        active = models.Q(units__is_active=True)
+        return self.annotate(
+            unit_total=models.Count('units', filter=active),
+            unit_occupied=models.Count('units', filter=active & models.Q(units__status='occupied')),
+            unit_vacant=models.Count('units', filter=active & models.Q(units__status='vacant')),
+        )
+
+
 class Apartment(models.Model):
     landlord = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -15,25 +28,51 @@ class Apartment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ApartmentQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
 
     def __str__(self):
         return f'{self.name} – {self.city}'
 
+    # The unit counts use the with_unit_counts() annotations when present
+    # and fall back to a COUNT query otherwise.
+
     @property
     def total_units(self):
+        if hasattr(self, 'unit_total'):
+            return self.unit_total
         return self.units.filter(is_active=True).count()
 
     @property
     def occupied_units(self):
+        if hasattr(self, 'unit_occupied'):
+            return self.unit_occupied
         return self.units.filter(is_active=True, status='occupied').count()
 
     @property
     def vacant_units(self):
+        if hasattr(self, 'unit_vacant'):
+            return self.unit_vacant
         return self.units.filter(is_active=True, status='vacant').count()
 
 
+def active_tenant_prefetch(lookup='tenant_profiles'):
+    """Prefetch a unit's active tenant profile (with user) into ``active_profiles``."""
+    return models.Prefetch(
+        lookup,
+        queryset=TenantProfile.objects.filter(is_active=True).select_related('user'),
+        to_attr='active_profiles',
+    )
+
+
+class UnitQuerySet(models.QuerySet):
+    def with_active_tenant(self):
+        """Load the apartment and active tenant up front (see Unit.active_tenant)."""
+        return self.select_related('apartment').prefetch_related(active_tenant_prefetch())
+
+
 class Unit(models.Model):
     OCCUPIED = 'occupied'
     VACANT = 'vacant'
@@ -51,6 +90,8 @@ class Unit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UnitQuerySet.as_manager()
+
     class Meta:
         ordering = ['unit_number']
         unique_together = ['apartment', 'unit_number']
@@ -60,6 +101,9 @@ class Unit(models.Model):
 
     @property
     def active_tenant(self):
+        """Active tenant profile, preferring the ``with_active_tenant`` prefetch."""
+        if hasattr(self, 'active_profiles'):
+            return self.active_profiles[0] if self.active_profiles else None
         return self.tenant_profiles.filter(is_active=True).first()
 
 
@@ -85,6 +129,11 @@ class TenantProfile(models.Model):
     id_number = models.CharField(max_length=50)
     move_in_date = models.DateField()
     is_active = models.BooleanField(default=True)
+    # Sum of remaining balances on the tenant's invoices, kept in step by
+    # billing.ledger whenever invoices or payments are written.
+    outstanding_balance = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
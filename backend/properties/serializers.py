@@ -1,10 +1,13 @@
+from functools import partial
+
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 
+from rental_system.fieldsets import SparseFieldsMixin
 from users.models import User
 from users.serializers import UserSerializer
 
-from .models import Apartment, TenantProfile, Unit
+from .models import Apartment, TenantProfile, Unit, active_tenant_prefetch
 
 
 class ApartmentSerializer(serializers.ModelSerializer):
@@ -22,7 +25,10 @@ class ApartmentSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at')
 
 
-class UnitSerializer(serializers.ModelSerializer):
+class UnitSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_relations = {'apartment_name': ('apartment',)}
+    field_prefetches = {'active_tenant_name': (active_tenant_prefetch,)}
+
     apartment_name = serializers.CharField(source='apartment.name', read_only=True)
     active_tenant_name = serializers.SerializerMethodField()
 
@@ -42,7 +48,10 @@ class UnitSerializer(serializers.ModelSerializer):
         return None
 
 
-class TenantProfileSerializer(serializers.ModelSerializer):
+class TenantProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_relations = {'user': ('user',), 'unit_detail': ('unit__apartment',)}
+    field_prefetches = {'unit_detail': (partial(active_tenant_prefetch, 'unit__tenant_profiles'),)}
+
     user = UserSerializer(read_only=True)
     unit_detail = UnitSerializer(source='unit', read_only=True)
     outstanding_balance = serializers.SerializerMethodField()
@@ -54,14 +63,11 @@ class TenantProfileSerializer(serializers.ModelSerializer):
             'id_number', 'move_in_date', 'is_active',
             'outstanding_balance', 'created_at', 'updated_at',
         )
-        read_only_fields = ('id', 'landlord', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'landlord', 'outstanding_balance', 'created_at', 'updated_at')
 
     def get_outstanding_balance(self, obj):
-        from decimal import Decimal
-        from billing.models import Invoice
-        invoices = Invoice.objects.filter(tenant=obj.user).exclude(status='paid')
-        total = sum(i.remaining_balance for i in invoices)
-        return str(total)
+        # Same string as when this was summed per request: "0" when nothing is owed.
+        return str(obj.outstanding_balance) if obj.outstanding_balance else '0'
 
 
 class TenantCreateSerializer(serializers.Serializer):
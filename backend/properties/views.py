@@ -3,6 +3,9 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from rental_system.fieldsets import load_related, requested_fields
+from rental_system.pagination import KeysetPagination
+
 from .models import Apartment, TenantProfile, Unit
 from .serializers import (
     ApartmentSerializer,
@@ -30,7 +33,11 @@ def landlord_required(func):
 @landlord_required
 def apartment_list(request):
     if request.method == 'GET':
-        apartments = Apartment.objects.filter(landlord=request.user)
+        apartments = Apartment.objects.filter(landlord=request.user).with_unit_counts()
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(apartments, request)
+        if page is not None:
+            return paginator.get_paginated_response(ApartmentSerializer(page, many=True).data)
         serializer = ApartmentSerializer(apartments, many=True)
         return Response(serializer.data)
 
@@ -46,7 +53,7 @@ def apartment_list(request):
 @landlord_required
 def apartment_detail(request, pk):
     try:
-        apartment = Apartment.objects.get(pk=pk, landlord=request.user)
+        apartment = Apartment.objects.with_unit_counts().get(pk=pk, landlord=request.user)
     except Apartment.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -73,14 +80,19 @@ def apartment_detail(request, pk):
 @landlord_required
 def unit_list(request):
     if request.method == 'GET':
-        qs = Unit.objects.filter(apartment__landlord=request.user)
+        fields = requested_fields(request, UnitSerializer)
+        qs = load_related(Unit.objects.filter(apartment__landlord=request.user), UnitSerializer, fields)
         apartment_id = request.query_params.get('apartment')
         if apartment_id:
             qs = qs.filter(apartment_id=apartment_id)
         active_only = request.query_params.get('active_only', 'true').lower() == 'true'
         if active_only:
             qs = qs.filter(is_active=True)
-        serializer = UnitSerializer(qs, many=True)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(qs, request)
+        if page is not None:
+            return paginator.get_paginated_response(UnitSerializer(page, many=True, fields=fields).data)
+        serializer = UnitSerializer(qs, many=True, fields=fields)
         return Response(serializer.data)
 
     # Ensure the apartment belongs to this landlord
@@ -101,13 +113,16 @@ def unit_list(request):
 @permission_classes([IsAuthenticated])
 @landlord_required
 def unit_detail(request, pk):
+    fields = requested_fields(request, UnitSerializer) if request.method == 'GET' else None
     try:
-        unit = Unit.objects.get(pk=pk, apartment__landlord=request.user)
+        unit = load_related(Unit.objects.all(), UnitSerializer, fields).get(
+            pk=pk, apartment__landlord=request.user,
+        )
     except Unit.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        serializer = UnitSerializer(unit)
+        serializer = UnitSerializer(unit, fields=fields)
         return Response(serializer.data)
 
     if request.method in ('PUT', 'PATCH'):
@@ -131,11 +146,18 @@ def unit_detail(request, pk):
 @landlord_required
 def tenant_list(request):
     if request.method == 'GET':
-        qs = TenantProfile.objects.filter(landlord=request.user).select_related('user', 'unit', 'unit__apartment')
+        fields = requested_fields(request, TenantProfileSerializer)
+        qs = load_related(TenantProfile.objects.filter(landlord=request.user), TenantProfileSerializer, fields)
         is_active = request.query_params.get('is_active')
         if is_active is not None:
             qs = qs.filter(is_active=is_active.lower() == 'true')
-        serializer = TenantProfileSerializer(qs, many=True)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(qs, request)
+        if page is not None:
+            return paginator.get_paginated_response(
+                TenantProfileSerializer(page, many=True, fields=fields).data
+            )
+        serializer = TenantProfileSerializer(qs, many=True, fields=fields)
         return Response(serializer.data)
 
     serializer = TenantCreateSerializer(data=request.data, context={'request': request})
@@ -149,13 +171,20 @@ def tenant_list(request):
 @permission_classes([IsAuthenticated])
 @landlord_required
 def tenant_detail(request, pk):
+    fields = None
+    if request.method == 'GET':
+        fields = requested_fields(request, TenantProfileSerializer)
+        profiles = load_related(TenantProfile.objects.all(), TenantProfileSerializer, fields)
+    else:
+        # Updates can change who is active on the unit, so only prefetch for reads.
+        profiles = TenantProfile.objects.select_related('user', 'unit', 'unit__apartment')
     try:
-        profile = TenantProfile.objects.get(pk=pk, landlord=request.user)
+        profile = profiles.get(pk=pk, landlord=request.user)
     except TenantProfile.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        serializer = TenantProfileSerializer(profile)
+        serializer = TenantProfileSerializer(profile, fields=fields)
         return Response(serializer.data)
 
     partial = request.method == 'PATCH'
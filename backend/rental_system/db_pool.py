@@ -0,0 +1,210 @@
+"""
+Per-process database connection pool.
+
+With ``DB_POOL=True`` the ``default`` database (and any replicas) use the
+``rental_system.pooled_postgresql`` engine. Django still "closes" its
+connection at the end of every request (CONN_MAX_AGE is 0), but closing
+hands the open connection back to a pool shared by the threads of the
+process, and the next connect takes it from there instead of opening a new
+one. The pool, configured by ``DATABASES[alias]['POOL']``:
+
+* opens at most SIZE connections and makes a connect wait up to TIMEOUT
+  seconds for one to come back, then fails with OperationalError;
+* checks a connection with ``SELECT 1`` before reuse if it has been idle
+  for CHECK_AFTER seconds or more (0 checks every time), and replaces it
+  when the check fails;
+* closes connections MAX_LIFETIME seconds after they were opened, when they
+  are next returned or taken, so that they are recycled regularly;
+* rolls back whatever a returned connection left open, and drops
+  connections returned inside an atomic block or in an unusable state.
+
+Pools are per process (re-created after a fork), so a deployment opens up
+to workers × SIZE connections per database. Keep that under PostgreSQL's
+``max_connections``. ``/metrics`` reports the connections by state
+(``db_pool_connections``), checkout waits (``db_pool_wait_seconds``) and
+opened/recycled/unhealthy/timeout events (``db_pool_connection_events_total``).
+"""
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from .metrics import DB_POOL_CONNECTIONS, DB_POOL_EVENTS, DB_POOL_WAIT
+
+# Pooled engine for each engine that has one; load_test_db_pool uses it to
+# compare the two.
+POOLED_ENGINES = {'django.db.backends.postgresql': 'rental_system.pooled_postgresql'}
+
+DEFAULTS = {'SIZE': 10, 'TIMEOUT': 10.0, 'MAX_LIFETIME': 1800.0, 'CHECK_AFTER': 30.0}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _ping(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    conn.rollback()  # in case the check opened a transaction
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """A bounded LIFO pool of DB-API connections for one database alias."""
+
+    def __init__(self, alias, size, timeout, max_lifetime, check_after):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.pid = os.getpid()
+        self.opened = 0  # connections opened over the pool's life
+        self._idle = deque()  # (connection, opened at, returned at)
+        self._in_use = {}  # id(connection) -> opened at
+        self._count = 0  # idle + in use
+        self._cond = threading.Condition()
+        DB_POOL_CONNECTIONS.set(size, database=alias, state='max')
+
+    def _record(self):
+        DB_POOL_CONNECTIONS.set(len(self._idle), database=self.alias, state='idle')
+        DB_POOL_CONNECTIONS.set(len(self._in_use), database=self.alias, state='in_use')
+
+    def _discard(self, conn, event):
+        """Close a connection taken out of the pool; call with the lock held."""
+        _close_quietly(conn)
+        self._count -= 1
+        DB_POOL_EVENTS.inc(database=self.alias, event=event)
+        self._cond.notify()
+
+    def acquire(self, connect):
+        """A connection from the pool, or a new one from ``connect()`` while under SIZE."""
+        start = time.monotonic()
+        with self._cond:
+            while not self._idle and self._count >= self.size:
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    DB_POOL_EVENTS.inc(database=self.alias, event='timeout')
+                    raise PoolTimeout(
+                        f'No connection to {self.alias!r} available within {self.timeout}s '
+                        f'({self.size} in use)'
+                    )
+                self._cond.wait(remaining)
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                self._count += 1
+        DB_POOL_WAIT.observe(time.monotonic() - start, database=self.alias)
+
+        conn = None
+        if entry is not None:
+            conn, opened_at, returned_at = entry
+            now = time.monotonic()
+            event = None
+            if now - opened_at >= self.max_lifetime:
+                event = 'recycled'
+            elif now - returned_at >= self.check_after:
+                try:
+                    _ping(conn)
+                except Exception:
+                    event = 'unhealthy'
+            if event is not None:
+                _close_quietly(conn)
+                DB_POOL_EVENTS.inc(database=self.alias, event=event)
+                conn = None
+        if conn is None:
+            try:
+                conn = connect()
+            except Exception:
+                with self._cond:
+                    self._count -= 1
+                    self._cond.notify()
+                    self._record()
+                raise
+            opened_at = time.monotonic()
+            self.opened += 1
+            DB_POOL_EVENTS.inc(database=self.alias, event='opened')
+        with self._cond:
+            self._in_use[id(conn)] = opened_at
+            self._record()
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return ``conn`` to the pool, or close it if ``discard`` or it cannot be reset."""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        now = time.monotonic()
+        with self._cond:
+            opened_at = self._in_use.pop(id(conn), None)
+            if opened_at is None:  # not ours (opened before a fork, or released twice)
+                _close_quietly(conn)
+            elif discard:
+                self._discard(conn, 'closed')
+            elif now - opened_at >= self.max_lifetime:
+                self._discard(conn, 'recycled')
+            else:
+                self._idle.append((conn, opened_at, now))
+                self._cond.notify()
+            # Connections that sat idle past their lifetime go too.
+            while self._idle and now - self._idle[0][1] >= self.max_lifetime:
+                self._discard(self._idle.popleft()[0], 'recycled')
+            self._record()
+
+    def close_idle(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.popleft()[0], 'closed')
+            self._record()
+
+
+def get_pool(alias, options):
+    """The pool for ``alias`` in this process, created from ``options`` on first use."""
+    pool = _pools.get(alias)
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None or pool.pid != os.getpid():
+                # Connections inherited across a fork belong to the parent; leave them be.
+                settings = {**DEFAULTS, **(options or {})}
+                pool = _pools[alias] = ConnectionPool(
+                    alias, int(settings['SIZE']), float(settings['TIMEOUT']),
+                    float(settings['MAX_LIFETIME']), float(settings['CHECK_AFTER']),
+                )
+    return pool
+
+
+class PooledDatabaseWrapperMixin:
+    """DatabaseWrapper mixin that takes connections from, and returns them to, ``get_pool``."""
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL'))
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.pool.acquire(partial(super().get_new_connection, conn_params))
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # Closed inside an atomic block: this wrapper keeps the
+                # connection object, so it must not be handed out again.
+                self.pool.release(self.connection, discard=self.in_atomic_block)
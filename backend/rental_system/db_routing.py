@@ -0,0 +1,133 @@
+"""
+Read replicas for the read-heavy endpoints.
+
+Views decorated with ``replica_reads`` (the reports, the tenant portal and
+the PDF downloads) run their queries on one of DATABASE_REPLICAS, picked
+per request. Everything else, and every write, uses ``default``.
+
+A replica may lag the primary, so a user who has just written should not
+read from one:
+
+* ``PrimaryPinMiddleware`` pins the user to the primary for
+  REPLICA_STICKY_SECONDS after any POST/PUT/PATCH/DELETE. The pin is kept in
+  Django's cache, which every worker must share (CACHE_DIR): with a
+  per-process cache the next request may land on a worker that never saw
+  the pin, so the middleware refuses to start with one.
+* a write inside a replica request sends the rest of that request's reads
+  to the primary.
+
+Streaming responses (CSV/NDJSON exports) read while the body is sent, after
+the view has returned; their iteration is routed to the same replica.
+
+Only ``default`` is migrated. Replicas get the schema by replication.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+from .metrics import REPLICA_ROUTING
+
+PIN_KEY = 'db:primary-pin:{}'
+
+# Cache backends that keep the pin in one process only.
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def pin_primary(user_id):
+    """Send ``user_id``'s replica reads to the primary for REPLICA_STICKY_SECONDS."""
+    if settings.DATABASE_REPLICAS and settings.REPLICA_STICKY_SECONDS > 0:
+        cache.set(PIN_KEY.format(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def check_pin_cache():
+    """Raise ImproperlyConfigured if pins are on but the cache is not shared between workers."""
+    if not settings.DATABASE_REPLICAS or settings.REPLICA_STICKY_SECONDS <= 0:
+        return
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in PER_PROCESS_CACHES:
+        raise ImproperlyConfigured(
+            f'DATABASE_REPLICAS needs a cache shared by all workers to pin writers to the '
+            f'primary, but the default cache is {backend}. Set CACHE_DIR (or another shared '
+            f'cache), or REPLICA_STICKY_SECONDS=0 to read from replicas without pinning.'
+        )
+
+
+def _choose_replica(request):
+    """The replica alias for ``request``, or None to stay on the primary."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return None
+    user_id = getattr(request.user, 'pk', None)
+    if user_id is not None and is_pinned(user_id):
+        REPLICA_ROUTING.inc(database=DEFAULT_DB_ALIAS, reason='pinned')
+        return None
+    alias = random.choice(replicas)
+    REPLICA_ROUTING.inc(database=alias, reason='replica')
+    return alias
+
+
+def _routed_stream(alias, content):
+    """Iterate ``content`` with reads routed to ``alias``, one chunk at a time."""
+    iterator = iter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+def replica_reads(func):
+    """View decorator: run the view's reads on a replica unless the user is pinned."""
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        alias = _choose_replica(request)
+        if alias is None:
+            return func(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            response = func(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+        if getattr(response, 'streaming', False) and not hasattr(response, 'file_to_stream'):
+            response.streaming_content = _routed_stream(alias, response.streaming_content)
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    """Reads go to the request's replica inside ``replica_reads``; writes and migrations to ``default``."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        if _read_alias.get() is not None:
+            _read_alias.set(None)  # read this request's own writes from the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,64 @@
+"""
+Sparse fieldsets (``?fields=a,b`` / ``?omit=c``) for the list and detail views.
+
+A serializer using ``SparseFieldsMixin`` takes ``fields=`` (a set of names,
+or None for all) and drops every other field before serializing. It also
+declares what each field reads beyond the row itself:
+
+* ``field_relations``: field -> select_related paths;
+* ``field_prefetches``: field -> callables returning Prefetch objects.
+
+``load_related`` applies only the paths and prefetches the kept fields need,
+so leaving out ``tenant_name`` removes its join, and leaving out
+``active_tenant_name`` removes its prefetch query.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fields(request, serializer_class):
+    """
+    The field names selected by ``?fields=`` and ``?omit=``, or None when the
+    request selects all of them. Unknown names are a 400.
+    """
+    params = request.query_params
+    if 'fields' not in params and 'omit' not in params:
+        return None
+    available = set(serializer_class().fields)
+    selected = _names(params['fields']) if 'fields' in params else set(available)
+    omitted = _names(params.get('omit', ''))
+    unknown = (selected | omitted) - available
+    if unknown:
+        raise ValidationError({'fields': f'Unknown field(s): {", ".join(sorted(unknown))}.'})
+    return selected - omitted
+
+
+def load_related(queryset, serializer_class, fields):
+    """``queryset`` with the joins and prefetches that ``fields`` (None for all) read."""
+    paths, prefetches = set(), []
+    for name, related in serializer_class.field_relations.items():
+        if fields is None or name in fields:
+            paths.update(related)
+    for name, factories in serializer_class.field_prefetches.items():
+        if fields is None or name in fields:
+            prefetches.extend(factory() for factory in factories)
+    if paths:  # select_related() without arguments would follow every relation
+        queryset = queryset.select_related(*sorted(paths))
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
+
+
+class SparseFieldsMixin:
+    """Serializer mixin: ``fields`` keeps only the named fields (None keeps all)."""
+    field_relations = {}
+    field_prefetches = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
@@ -0,0 +1,427 @@
+"""
+Minimal in-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms live in process memory and are updated
+under a lock. With several worker processes (gunicorn, the PDF process
+pool), set METRICS_MULTIPROC_DIR to a directory shared by all of them. Each
+process then snapshots its metrics to ``<dir>/<pid>-<start time>.json``, at most once per
+METRICS_FLUSH_INTERVAL seconds and at exit. ``/metrics`` merges every
+snapshot with the live values of the process serving the scrape:
+
+* counters and histograms are summed over all processes, including ones
+  that have exited, so they never go backwards when a worker is recycled;
+* gauges are summed over live processes only (``livesum``) or take the
+  maximum across them (``max``).
+
+The scrape folds the counters and histograms of exited processes into
+``<dir>/exited.json`` and deletes their snapshots (like prometheus_client's
+``mark_process_dead``), so a scrape reads one file per live process plus
+one, however often workers have been recycled.
+
+Without METRICS_MULTIPROC_DIR each process reports only its own values.
+"""
+import atexit
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXITED_FILE = 'exited.json'  # counters and histograms of processes that have exited
+EXITED_LOCK = 'exited.lock'
+
+_lock = threading.Lock()
+
+
+def _label_key(labelnames, labels):
+    REGISTRY.check_fork()
+    if set(labels) != set(labelnames):
+        raise ValueError(f'Expected labels {labelnames}, got {tuple(labels)}.')
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        REGISTRY.register(self)
+
+    def _reset(self):
+        self._values = {}
+
+    def snapshot(self):
+        """JSON-friendly copy of the current values: a list of [labels, value]."""
+        with _lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        REGISTRY.changed()
+
+    @staticmethod
+    def merge(values):
+        return sum(values)
+
+    def samples(self, key, value):
+        yield self.name + '_total', key, value
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='livesum'):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = value
+        REGISTRY.changed()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        REGISTRY.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def merge(self, values):
+        return max(values) if self.multiprocess_mode == 'max' else sum(values)
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+        REGISTRY.changed()
+
+    def time(self, **labels):
+        """Decorator observing the wrapped function's duration in seconds."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+
+    @staticmethod
+    def merge(values):
+        values = list(values)
+        return {
+            'buckets': [sum(col) for col in zip(*(v['buckets'] for v in values))],
+            'sum': sum(v['sum'] for v in values),
+            'count': sum(v['count'] for v in values),
+        }
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets, value['buckets']):
+            cumulative += count
+            yield self.name + '_bucket', key + (('le', _format_value(bound)),), cumulative
+        yield self.name + '_sum', key, value['sum']
+        yield self.name + '_count', key, value['count']
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._pid = os.getpid()
+        self._started = time.time_ns()  # with the pid, names this process's snapshot
+        self._last_flush = 0.0
+        self._pending = None
+        self._flush_lock = threading.Lock()  # guards _last_flush and _pending
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered.')
+        self.metrics[metric.name] = metric
+
+    # ── multi-process support ────────────────────────────────────────────
+
+    def directory(self):
+        try:
+            path = settings.METRICS_MULTIPROC_DIR
+        except (AttributeError, ImproperlyConfigured):
+            return None
+        return Path(path) if path else None
+
+    def check_fork(self):
+        # A forked worker inherits the parent's values; they are the parent's to report.
+        if os.getpid() != self._pid:
+            with _lock:
+                for metric in self.metrics.values():
+                    metric._reset()
+            self._pid = os.getpid()
+            self._started = time.time_ns()
+            self._flush_lock = threading.Lock()
+            self._last_flush = 0.0
+            self._pending = None
+
+    def changed(self):
+        directory = self.directory()
+        if directory is None:
+            return
+        with self._flush_lock:
+            wait = settings.METRICS_FLUSH_INTERVAL - (time.monotonic() - self._last_flush)
+            if wait > 0:
+                if self._pending is None:
+                    # Throttled: make sure the last update still reaches disk if the process goes idle.
+                    self._pending = threading.Timer(wait, self.flush, (directory,))
+                    self._pending.daemon = True
+                    self._pending.start()
+                return
+        self.flush(directory)
+
+    def flush(self, directory=None):
+        """Write this process's snapshot to the shared directory."""
+        directory = directory or self.directory()
+        if directory is None:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.cancel()
+        data = {
+            'pid': os.getpid(),
+            'started': self._started,
+            'metrics': {name: m.snapshot() for name, m in self.metrics.items() if m._values},
+        }
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(data, fh)
+        # Keyed by pid and start time, so a new process that is given a dead
+        # worker's pid does not overwrite the dead worker's totals.
+        os.replace(tmp, directory / f'{os.getpid()}-{self._started}.json')
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _read_directory(self, directory):
+        """
+        Snapshots in ``directory`` as (pid, start time, metrics), after folding
+        those of exited processes into EXITED_FILE; its totals come back with
+        pid None. The caller holds EXITED_LOCK.
+        """
+        exited_path = directory / EXITED_FILE
+        try:
+            exited = json.loads(exited_path.read_text())
+        except (OSError, ValueError):
+            exited = {'metrics': {}, 'folded': []}
+        snapshots = []
+        for path in directory.glob('*.json'):
+            if path.name == EXITED_FILE:
+                continue
+            if path.name in exited['folded']:
+                path.unlink(missing_ok=True)  # folded by a scrape that stopped before deleting it
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if (data.get('pid'), data.get('started')) != (os.getpid(), self._started):
+                snapshots.append((path, data['pid'], data.get('started', 0), data['metrics']))
+
+        # Only the latest process to use a pid can still be running.
+        latest = {}
+        for _, pid, started, _ in snapshots:
+            latest[pid] = max(latest.get(pid, started), started)
+        live, gone = [], []
+        for path, pid, started, metrics in snapshots:
+            if started == latest[pid] and self._alive(pid):
+                live.append((pid, started, metrics))
+            else:
+                gone.append((path, metrics))
+        if gone:
+            totals = {name: {tuple(key): value for key, value in values}
+                      for name, values in exited['metrics'].items()}
+            for _, metrics in gone:
+                for name, values in metrics.items():
+                    metric = self.metrics.get(name)
+                    if metric is None or metric.type == 'gauge':
+                        continue  # a gauge of an exited process is no longer reported
+                    per_key = totals.setdefault(name, {})
+                    for key, value in values:
+                        key = tuple(key)
+                        per_key[key] = metric.merge([per_key[key], value]) if key in per_key else value
+            exited = {
+                'metrics': {name: [[list(key), value] for key, value in per_key.items()]
+                            for name, per_key in totals.items()},
+                'folded': [path.name for path, _ in gone],
+            }
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(exited, fh)
+            # The totals and the names they include are replaced together, so
+            # a snapshot is never counted twice if the scrape stops here.
+            os.replace(tmp, exited_path)
+            for path, _ in gone:
+                path.unlink(missing_ok=True)
+        return [(None, 0, exited['metrics'])] + live
+
+    def _collect(self):
+        """{metric name: {label key: [values from each process]}}."""
+        self.check_fork()
+        collected = {name: {} for name in self.metrics}
+        own = {name: m.snapshot() for name, m in self.metrics.items()}
+        snapshots = [(os.getpid(), self._started, own)]
+        directory = self.directory()
+        if directory is not None and directory.exists():
+            # Workers answering scrapes at the same time must not fold the
+            # same snapshot twice.
+            with open(directory / EXITED_LOCK, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                snapshots += self._read_directory(directory)
+        for pid, _, metrics in snapshots:
+            for name, values in metrics.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and pid is None):
+                    continue
+                for key, value in values:
+                    collected[name].setdefault(tuple(key), []).append(value)
+        return collected
+
+    def render(self):
+        """All metrics in Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, per_key in sorted(self._collect().items()):
+            metric = self.metrics[name]
+            family = name + '_total' if metric.type == 'counter' else name
+            lines.append(f'# HELP {family} {metric.documentation}')
+            lines.append(f'# TYPE {family} {metric.type}')
+            for key in sorted(per_key):
+                labels = tuple(zip(metric.labelnames, key))
+                for sample, sample_labels, value in metric.samples(labels, metric.merge(per_key[key])):
+                    lines.append(f'{sample}{_format_labels(sample_labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# ── Application metrics ───────────────────────────────────────────────────────
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by URL name.',
+    ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries made per request, by URL name.',
+    ('view',), buckets=(1, 2, 3, 5, 8, 13, 21, 50, 100, 250),
+)
+PDF_RENDER_DURATION = Histogram(
+    'pdf_render_duration_seconds', 'Time to render one invoice or receipt PDF.',
+    ('kind',), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Application cache lookups, by cache and result (hit/miss).', ('cache', 'result'),
+)
+JWT_AUTHENTICATIONS = Counter(
+    'jwt_authentications', 'JWT authentication attempts, by outcome.', ('outcome',),
+)
+JWT_REFRESH_DURATION = Histogram(
+    'jwt_refresh_duration_seconds', 'Time to answer a token refresh, by outcome (ok/rejected).', ('outcome',),
+)
+TOKEN_TABLE_ROWS = Gauge(
+    'jwt_token_table_rows', 'Rows in the refresh-token tables, by table (re-counted periodically).', ('table',),
+    multiprocess_mode='max',
+)
+TOKENS_PRUNED = Counter(
+    'jwt_tokens_pruned', 'Expired refresh-token rows deleted, by table.', ('table',),
+)
+REPLICA_ROUTING = Counter(
+    'db_replica_routing', 'Replica-eligible requests, by the database read and why (replica/pinned).',
+    ('database', 'reason'),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Pooled database connections, by database and state (idle/in_use/max).',
+    ('database', 'state'),
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting to check a connection out of the pool.', ('database',),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0),
+)
+DB_POOL_EVENTS = Counter(
+    'db_pool_connection_events', 'Pooled connections opened, recycled, found unhealthy or closed, '
+    'and checkout timeouts, by database and event.', ('database', 'event'),
+)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        REGISTRY.flush()
+    except Exception:
+        pass
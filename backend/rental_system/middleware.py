@@ -0,0 +1,81 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from .db_routing import check_pin_cache, pin_primary
+from .metrics import REQUEST_DURATION, REQUEST_QUERIES
+from .query_budget import track_queries
+
+logger = logging.getLogger('rental_system.requests')
+
+
+class QueryTimingMiddleware:
+    """
+    Record the number of SQL queries and the time spent in the database for
+    each request. Both go out in a ``Server-Timing`` header (visible in the
+    browser's network panel) and a JSON log line on ``rental_system.requests``.
+    Requests over REQUEST_QUERY_WARNING queries are logged at WARNING. The
+    same figures feed the ``/metrics`` latency and query-count histograms,
+    labelled by URL name (``unmatched`` for paths that resolve to nothing).
+
+    Streaming responses are measured up to the first byte; queries made while
+    the body is generated are not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with track_queries() as stats:
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = stats.duration * 1000
+
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}'
+        )
+
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unmatched'
+        REQUEST_DURATION.observe(total_ms / 1000, view=view, method=request.method,
+                                 status=response.status_code)
+        REQUEST_QUERIES.observe(stats.count, view=view)
+
+        level = logging.WARNING if stats.count > settings.REQUEST_QUERY_WARNING else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_ms': round(db_ms, 2),
+                'total_ms': round(total_ms, 2),
+            }))
+        return response
+
+
+class PrimaryPinMiddleware:
+    """
+    Pin a user who sends a write (POST/PUT/PATCH/DELETE) to the primary
+    database for REPLICA_STICKY_SECONDS, so that their next reports and
+    portal pages read their own writes (see rental_system.db_routing).
+    """
+
+    UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+    def __init__(self, get_response):
+        check_pin_cache()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method in self.UNSAFE_METHODS and settings.DATABASE_REPLICAS:
+            # DRF copies the JWT-authenticated user onto the Django request.
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_primary(user.pk)
+        return response
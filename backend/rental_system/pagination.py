@@ -0,0 +1,125 @@
+"""Keyset (cursor) pagination for the function-based list views."""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination over the model's ``Meta.ordering`` plus pk.
+
+    Each page is fetched with a ``WHERE (keys) < (last row's keys)`` filter
+    instead of an OFFSET, so page N costs the same as page 1 and rows
+    inserted mid-scan never shift later pages. Cursors are opaque
+    base64-encoded key tuples.
+
+    Pagination is opt-in while clients migrate: it applies when the request
+    carries ``cursor`` or ``page_size``, or ``paginate=true``, or when
+    LIST_PAGINATION_DEFAULT is on. ``paginate=false`` forces the legacy
+    unpaginated list.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    paginate_query_param = 'paginate'
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def is_requested(self, request):
+        params = request.query_params
+        flag = params.get(self.paginate_query_param)
+        if flag is not None:
+            return flag.lower() == 'true'
+        if self.cursor_query_param in params or self.page_size_query_param in params:
+            return True
+        return getattr(settings, 'LIST_PAGINATION_DEFAULT', False)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, api_settings.PAGE_SIZE))
+        except (TypeError, ValueError):
+            size = api_settings.PAGE_SIZE
+        return max(1, min(size, self.max_page_size))
+
+    def get_keys(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not any(key.lstrip('-') in (pk_name, 'pk') for key in ordering):
+            # Tie-break on pk in the direction of the last key so the order is total.
+            desc = ordering[-1].startswith('-') if ordering else False
+            ordering.append(f'-{pk_name}' if desc else pk_name)
+        return [(key.lstrip('-'), key.startswith('-')) for key in ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.meta = queryset.model._meta
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(queryset)
+        queryset = queryset.order_by(*[f'-{f}' if desc else f for f, desc in self.keys])
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.after(self.decode_cursor(encoded)))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def after(self, values):
+        """Lexicographic "comes after" filter for the cursor's key tuple."""
+        condition = Q()
+        for i, (field, desc) in enumerate(self.keys):
+            prefix = {f: v for (f, _), v in zip(self.keys[:i], values[:i])}
+            prefix[f'{field}__{"lt" if desc else "gt"}'] = values[i]
+            condition |= Q(**prefix)
+        return condition
+
+    def encode_cursor(self, obj):
+        values = []
+        for field, _ in self.keys:
+            value = obj[field] if isinstance(obj, dict) else getattr(obj, field)
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, encoded):
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.keys):
+                raise ValueError
+            return [
+                self.meta.pk.to_python(v) if f == 'pk' else self.meta.get_field(f).to_python(v)
+                for (f, _), v in zip(self.keys, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'page_size': self.page_size,
+            'results': data,
+        })
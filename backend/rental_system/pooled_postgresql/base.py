@@ -0,0 +1,8 @@
+"""PostgreSQL backend whose connections come from rental_system.db_pool."""
+from django.db.backends.postgresql import base
+
+from rental_system.db_pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,56 @@
+"""
+SQL accounting for a block of code: query count and time spent in the database.
+
+``track_queries`` hooks every configured connection with an execute wrapper,
+so it works with DEBUG off and costs one ``perf_counter`` pair per query. The
+request middleware and the ``check_query_budgets`` command both build on it.
+"""
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+class QueryStats:
+    """Execute wrapper that counts queries and their wall time."""
+
+    def __init__(self, capture=False):
+        self.count = 0
+        self.duration = 0.0
+        self.capture = capture
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if self.capture:
+                self.statements.append(sql)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def track_queries(capture=False):
+    """Yield a QueryStats collecting every query run on any connection inside the block."""
+    stats = QueryStats(capture)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+@contextmanager
+def query_budget(limit, label='Block'):
+    """Raise QueryBudgetExceeded (listing the SQL) if the block runs more than ``limit`` queries."""
+    with track_queries(capture=True) as stats:
+        yield stats
+    if stats.count > limit:
+        raise QueryBudgetExceeded(
+            f'{label} ran {stats.count} queries (budget {limit}):\n' + '\n'.join(stats.statements)
+        )
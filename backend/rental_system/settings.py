@@ -33,11 +33,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'rental_system.middleware.QueryTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rental_system.middleware.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,9 +72,46 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Without the pool: keep each thread's connection open this many seconds.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'False') == 'True',
     }
 }
 
+# Per-process connection pool (rental_system.db_pool): requests return their
+# connection to the pool instead of closing it. Up to DB_POOL_SIZE
+# connections per process; a request waits DB_POOL_TIMEOUT seconds for one.
+# Connections idle for DB_POOL_CHECK_AFTER seconds are checked before reuse,
+# and every connection is replaced after DB_POOL_MAX_LIFETIME seconds.
+if os.environ.get('DB_POOL', 'False') == 'True':
+    DATABASES['default'].update({
+        'ENGINE': 'rental_system.pooled_postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': int(os.environ.get('DB_POOL_SIZE', '10')),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+            'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', '30')),
+        },
+    })
+
+# Read replicas (comma-separated host or host:port, same name and credentials
+# as the primary) for the reports, tenant portal and PDF downloads; see
+# rental_system.db_routing. A user who writes reads from the primary for the
+# next REPLICA_STICKY_SECONDS, which needs a shared cache (CACHE_DIR).
+DATABASE_REPLICAS = []
+for _n, _host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica{_n}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{_n}')
+DATABASE_ROUTERS = ['rental_system.db_routing.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -82,7 +121,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -91,6 +130,11 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 50,
 }
 
+# List endpoints paginate with rental_system.pagination.KeysetPagination when the
+# client sends ?cursor= or ?page_size=. Set True to paginate by default; clients
+# that still need the whole list can pass ?paginate=false.
+LIST_PAGINATION_DEFAULT = os.environ.get('LIST_PAGINATION_DEFAULT', 'False') == 'True'
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=2),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -98,6 +142,17 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+# Access tokens carry the user's role, and users.authentication builds the user
+# from them; each process re-checks is_active and role at most this often (seconds).
+JWT_USER_CACHE_TTL = int(os.environ.get('JWT_USER_CACHE_TTL', '30'))
+# Expired refresh tokens are deleted from the blacklist tables (users.blacklist)
+# by `manage.py prune_tokens` from cron, or set TOKEN_PRUNE_SCHEDULER=True to run
+# it in a background thread of the web process.
+TOKEN_PRUNE_SCHEDULER = os.environ.get('TOKEN_PRUNE_SCHEDULER', 'False') == 'True'
+TOKEN_PRUNE_INTERVAL = int(os.environ.get('TOKEN_PRUNE_INTERVAL', '3600'))  # seconds
+TOKEN_PRUNE_CHUNK_SIZE = int(os.environ.get('TOKEN_PRUNE_CHUNK_SIZE', '1000'))
+# /metrics re-counts both tables for jwt_token_table_rows at most this often (seconds).
+TOKEN_TABLE_SIZE_INTERVAL = int(os.environ.get('TOKEN_TABLE_SIZE_INTERVAL', '300'))
 
 CORS_ALLOWED_ORIGINS = [
     origin.strip()
@@ -117,4 +172,82 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered invoice/receipt PDFs are cached on disk (billing.pdf_cache).
+PDF_CACHE_ENABLED = os.environ.get('PDF_CACHE_ENABLED', 'True') == 'True'
+PDF_CACHE_DIR = MEDIA_ROOT / 'pdf_cache'
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_MB', '512')) * 1024 * 1024
+# Worker processes for bulk invoice PDF export (billing.pdf_export); 0 renders inline.
+PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Background PDF jobs (billing.jobs, `manage.py run_pdf_worker`).
+PDF_WORKER_CONCURRENCY = int(os.environ.get('PDF_WORKER_CONCURRENCY', '2'))
+PDF_JOB_TIMEOUT = int(os.environ.get('PDF_JOB_TIMEOUT', '300'))  # seconds before a running job is retried
+PDF_JOB_RETENTION = int(os.environ.get('PDF_JOB_RETENTION_HOURS', '24')) * 3600
+
+# Django's cache, used for the landlord dashboard (reports.cache). The default
+# locmem cache is per process; under several workers set CACHE_DIR to a shared
+# directory so that invalidations reach every worker.
+CACHE_DIR = os.environ.get('CACHE_DIR', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_DIR,
+    } if CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rental-system',
+    },
+}
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', '300'))  # seconds; 0 disables
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Day of the month that bulk-generated invoices fall due (the last day in
+# shorter months, so 31 means month end).
+INVOICE_DUE_DAY = int(os.environ.get('INVOICE_DUE_DAY', '5'))
+
+# Overdue sweeper: `manage.py sweep_overdue` from cron, or set
+# OVERDUE_SWEEP_SCHEDULER=True to run it in a background thread of the web process.
+OVERDUE_SWEEP_SCHEDULER = os.environ.get('OVERDUE_SWEEP_SCHEDULER', 'False') == 'True'
+OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', '300'))  # seconds
+OVERDUE_SWEEP_CHUNK_SIZE = int(os.environ.get('OVERDUE_SWEEP_CHUNK_SIZE', '1000'))
+OVERDUE_SWEEP_TIMEZONE = os.environ.get('OVERDUE_SWEEP_TIMEZONE', TIME_ZONE)
+# A day's sweep that has not finished this long after it started is taken
+# to have failed, and the next caller runs it again.
+OVERDUE_SWEEP_RETRY_AFTER = int(os.environ.get('OVERDUE_SWEEP_RETRY_AFTER', '1800'))  # seconds
+
+# M-Pesa C2B confirmation callbacks (billing.mpesa). The provider posts to
+# /api/mpesa/callback/<MPESA_CALLBACK_TOKEN>/; MPESA_SHORTCODES maps each paybill
+# or till number to the landlord it pays, e.g. "600100=jdoe,600200=asmith".
+MPESA_CALLBACK_TOKEN = os.environ.get('MPESA_CALLBACK_TOKEN', '')
+MPESA_SHORTCODES = dict(
+    pair.strip().split('=', 1)
+    for pair in os.environ.get('MPESA_SHORTCODES', '').split(',') if '=' in pair
+)
+MPESA_APPLIER_BATCH_SIZE = int(os.environ.get('MPESA_APPLIER_BATCH_SIZE', '500'))
+# Run the applier in a background thread of the web process instead of
+# `manage.py apply_payment_events --loop`.
+MPESA_APPLIER_SCHEDULER = os.environ.get('MPESA_APPLIER_SCHEDULER', 'False') == 'True'
+MPESA_APPLIER_INTERVAL = int(os.environ.get('MPESA_APPLIER_INTERVAL', '5'))  # seconds
+
+# Per-request SQL accounting (rental_system.middleware.QueryTimingMiddleware).
+REQUEST_QUERY_WARNING = int(os.environ.get('REQUEST_QUERY_WARNING', '50'))
+
+# Prometheus metrics at /metrics (rental_system.metrics). With several worker
+# processes, point METRICS_MULTIPROC_DIR at a directory shared by all of them
+# and empty it on deploy; each process writes its snapshot there.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # "Authorization: Bearer <token>"; required unless DEBUG
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))  # seconds
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'rental_system.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
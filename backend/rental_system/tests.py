@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from billing.endpoint_suite import quiet_request_logs
+from billing.models import Invoice, Payment
+from billing.sample_data import create_portfolio
+from users.models import User
+
+from .db_routing import pin_primary
+from .metrics import EXITED_FILE, REGISTRY
+
+REPLICA = 'replica-test'
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Read-replica routing against a second database alias. The alias is a
+    second connection to the test database (a shared in-memory SQLite
+    database, or the PostgreSQL test database), which stands in for a
+    replica that has caught up.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after setUpClass so that the replica is not one of the
+        # databases TransactionTestCase blocks or flushes.
+        connections.settings[REPLICA] = {**connections['default'].settings_dict}
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.overrides = override_settings(
+            DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=1,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cls.cache_dir,
+            }},
+        )
+        cls.overrides.enable()
+        cls.quiet = quiet_request_logs()
+        cls.quiet.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.quiet.__exit__(None, None, None)
+        cls.overrides.disable()
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    def setUp(self):
+        ids = create_portfolio('replica', units_per_apartment=2, months=2)
+        self.landlord = User.objects.get(pk=ids['landlord'])
+        self.tenant = User.objects.get(pk=ids['tenants'][0])
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def _queries(self, call):
+        """Run ``call()`` and return (queries on the primary, queries on the replica)."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            call()
+        return len(primary), len(replica)
+
+    def _get(self, client, name, **params):
+        def call():
+            response = client.get(reverse(name), params)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return call
+
+    def test_report_and_portal_reads_use_the_replica(self):
+        landlord, tenant = self._client(self.landlord), self._client(self.tenant)
+        for client, name in ((landlord, 'payment-report'), (landlord, 'outstanding-report'),
+                             (tenant, 'tenant-invoices'), (tenant, 'tenant-payments')):
+            primary, replica = self._queries(self._get(client, name))
+            self.assertEqual(primary, 0, name)
+            self.assertGreater(replica, 0, name)
+        # Endpoints without replica_reads stay on the primary.
+        primary, replica = self._queries(self._get(landlord, 'invoice-list'))
+        self.assertEqual((replica, primary > 0), (0, True))
+
+    def test_write_pins_the_user_to_the_primary(self):
+        client = self._client(self.landlord)
+        invoice = Invoice.objects.filter(landlord=self.landlord).first()
+        response = client.post(reverse('payment-list'), {
+            'invoice': invoice.id, 'amount': '1.00', 'payment_date': str(date.today()), 'method': Payment.CASH,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        primary, replica = self._queries(self._get(client, 'payment-report'))
+        self.assertEqual((replica, primary > 0), (0, True))
+        # Other users still read from the replica.
+        primary, replica = self._queries(self._get(self._client(self.tenant), 'tenant-invoices'))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+        time.sleep(1.1)  # REPLICA_STICKY_SECONDS
+        primary, replica = self._queries(self._get(client, 'payment-report'))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+    def test_streamed_export_stays_on_its_replica(self):
+        client = self._client(self.landlord)
+        response = client.get(reverse('payment-report'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        # A write after the view returned pins the user, but the export
+        # already started on the replica and finishes there.
+        pin_primary(self.landlord.pk)
+        primary, replica = self._queries(lambda: b''.join(response.streaming_content))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+
+class MultiprocessMetricsTests(SimpleTestCase):
+    """Snapshots in METRICS_MULTIPROC_DIR, including those of exited workers."""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        overrides = override_settings(METRICS_MULTIPROC_DIR=str(self.directory))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        self.exited_pid = worker.pid
+
+    def _snapshot(self, pid, started, hits, rows):
+        metrics = {
+            'cache_requests': [[['metrics-test', 'hit'], hits]],
+            'jwt_token_table_rows': [[['metrics-test'], rows]],
+        }
+        data = {'pid': pid, 'started': started, 'metrics': metrics}
+        (self.directory / f'{pid}-{started}.json').write_text(json.dumps(data))
+
+    def _scrape(self):
+        samples = {}
+        for line in REGISTRY.render().splitlines():
+            if 'metrics-test' in line:
+                sample, value = line.rsplit(' ', 1)
+                samples[sample.split('{')[0]] = float(value)
+        return samples
+
+    def test_exited_workers_are_folded_into_one_file(self):
+        self._snapshot(self.exited_pid, 1, hits=2, rows=70)
+        self._snapshot(self.exited_pid, 2, hits=3, rows=70)
+        self._snapshot(os.getppid(), 3, hits=4, rows=5)
+
+        self.assertEqual(self._scrape(), {'cache_requests_total': 9, 'jwt_token_table_rows': 5})
+        names = sorted(path.name for path in self.directory.glob('*.json'))
+        self.assertEqual(names, [f'{os.getppid()}-3.json', EXITED_FILE])
+
+        # Later scrapes read the totals back and add newly exited workers.
+        self._snapshot(self.exited_pid, 4, hits=1, rows=70)
+        self.assertEqual(self._scrape(), {'cache_requests_total': 10, 'jwt_token_table_rows': 5})
+        self.assertEqual(self._scrape(), {'cache_requests_total': 10, 'jwt_token_table_rows': 5})
+        self.assertEqual(len(list(self.directory.glob('*.json'))), 2)
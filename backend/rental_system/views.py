@@ -0,0 +1,25 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from users.blacklist import refresh_table_sizes
+
+from .metrics import REGISTRY
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint (text exposition format 0.0.4)."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), settings.METRICS_TOKEN.encode()):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    elif not settings.DEBUG:
+        # Never public in production: without a token the endpoint is off.
+        raise Http404
+    refresh_table_sizes()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
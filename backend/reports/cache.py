@@ -0,0 +1,59 @@
+"""
+Per-landlord cache of the assembled dashboard payload.
+
+Each landlord has a generation token in the cache, replaced whenever their
+invoices, payments, units or tenants change (see reports.signals), and once
+more when the writing transaction commits. A cached payload is served only
+while its generation and date still match, so a payload built from data
+read before a concurrent commit is never served after that commit.
+DASHBOARD_CACHE_TTL bounds staleness from writes that send no signal (for
+example renaming a tenant). Set it to 0 to disable the cache.
+
+Django's default cache is per process with locmem; with several workers,
+configure a shared backend (CACHE_DIR) so invalidations reach all of them.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from rental_system.metrics import CACHE_REQUESTS
+
+DATA_KEY = 'reports:dashboard:{}'
+GENERATION_KEY = 'reports:dashboard:{}:generation'
+
+
+def get_dashboard(landlord_id, today, build):
+    """Cached payload for ``landlord_id`` on ``today``, calling ``build()`` on a miss."""
+    ttl = settings.DASHBOARD_CACHE_TTL
+    if ttl <= 0:
+        return build()
+    data_key, generation_key = DATA_KEY.format(landlord_id), GENERATION_KEY.format(landlord_id)
+    found = cache.get_many([data_key, generation_key])
+    generation = found.get(generation_key)
+    cached = found.get(data_key)
+    if cached is not None and cached[0] == generation and cached[1] == today:
+        CACHE_REQUESTS.inc(cache='dashboard', result='hit')
+        return cached[2]
+
+    CACHE_REQUESTS.inc(cache='dashboard', result='miss')
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.add(generation_key, generation, None)
+    payload = build()
+    cache.set(data_key, (generation, today, payload), ttl)
+    return payload
+
+
+def invalidate_dashboard(landlord_ids):
+    """Drop the cached dashboards of ``landlord_ids``, now and again on commit."""
+    keys = [GENERATION_KEY.format(pk) for pk in set(landlord_ids) if pk is not None]
+    if not keys:
+        return
+
+    def bump():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    bump()
+    transaction.on_commit(bump)
@@ -0,0 +1,68 @@
+"""Streaming CSV / NDJSON export of report rows."""
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 2000
+
+
+class _StreamRenderer(BaseRenderer):
+    """
+    Lets ``?format=csv|ndjson`` pass DRF content negotiation. Report views
+    stream those formats themselves, so this only renders error payloads.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode(self.charset)
+
+
+class CSVRenderer(_StreamRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_StreamRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class _Echo:
+    """File-like object whose write() hands the CSV line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def stream_export(fmt, rows, columns, trailer, filename):
+    """
+    Stream ``rows`` (an iterator of dicts) as CSV or NDJSON.
+
+    ``trailer`` is called after the last row and returns the totals dict,
+    written as trailing ``key,value`` CSV rows or a final NDJSON line. Only
+    one row is held in memory at a time.
+    """
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+
+        def generate():
+            yield writer.writerow(columns)
+            for row in rows:
+                yield writer.writerow([row[c] for c in columns])
+            for key, value in trailer().items():
+                yield writer.writerow([key, value])
+
+        content_type = 'text/csv'
+    else:
+        def generate():
+            for row in rows:
+                yield json.dumps(row) + '\n'
+            yield json.dumps(trailer()) + '\n'
+
+        content_type = 'application/x-ndjson'
+
+    response = StreamingHttpResponse(generate(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
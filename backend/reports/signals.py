@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from billing.models import Invoice, Payment
+from billing.signals import invoices_changed
+from properties.models import Apartment, TenantProfile, Unit
+
+from .cache import invalidate_dashboard
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+@receiver([post_save, post_delete], sender=TenantProfile)
+def invoice_or_tenant_changed(sender, instance, **kwargs):
+    invalidate_dashboard([instance.landlord_id])
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def payment_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Invoice):
+        landlord_id = origin.landlord_id  # cascading from an invoice delete
+    elif Payment.invoice.is_cached(instance):
+        landlord_id = instance.invoice.landlord_id
+    else:
+        landlord_id = Invoice.objects.filter(pk=instance.invoice_id).values_list(
+            'landlord_id', flat=True,
+        ).first()
+    invalidate_dashboard([landlord_id])
+
+
+@receiver([post_save, post_delete], sender=Unit)
+def unit_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Apartment):
+        landlord_id = origin.landlord_id  # cascading from an apartment delete
+    elif Unit.apartment.is_cached(instance):
+        landlord_id = instance.apartment.landlord_id
+    else:
+        landlord_id = Apartment.objects.filter(pk=instance.apartment_id).values_list(
+            'landlord_id', flat=True,
+        ).first()
+    invalidate_dashboard([landlord_id])
+
+
+@receiver(invoices_changed)
+def invoices_bulk_changed(sender, landlord_ids, **kwargs):
+    invalidate_dashboard(landlord_ids)
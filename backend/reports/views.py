@@ -2,12 +2,18 @@ from decimal import Decimal
 
 from django.db.models import Count, Q, Sum
 from django.utils import timezone
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from billing.models import Invoice, Payment
+from billing.list_values import full_name, unit_display
+from billing.models import Invoice, Payment, remaining_balance_expr
 from properties.models import Apartment, TenantProfile, Unit
+from rental_system.db_routing import replica_reads
+
+from .cache import get_dashboard
+from .exports import CHUNK_SIZE, CSVRenderer, NDJSONRenderer, stream_export
 
 
 def landlord_required(func):
@@ -25,39 +31,41 @@ def landlord_required(func):
 @landlord_required
 def dashboard(request):
     today = timezone.now().date()
+    payload = get_dashboard(request.user.id, today, lambda: _dashboard_payload(request.user, today))
+    return Response(payload)
+
+
+def _dashboard_payload(landlord, today):
     current_month = today.month
     current_year = today.year
 
     # Unit stats
-    units = Unit.objects.filter(apartment__landlord=request.user, is_active=True)
-    total_units = units.count()
-    occupied = units.filter(status='occupied').count()
-    vacant = units.filter(status='vacant').count()
+    unit_stats = Unit.objects.filter(apartment__landlord=landlord, is_active=True).aggregate(
+        total=Count('id'),
+        occupied=Count('id', filter=Q(status='occupied')),
+        vacant=Count('id', filter=Q(status='vacant')),
+    )
 
     # Revenue this month
     monthly_payments = Payment.objects.filter(
-        invoice__landlord=request.user,
+        invoice__landlord=landlord,
         payment_date__year=current_year,
         payment_date__month=current_month,
     ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 
     # Total outstanding balance
-    outstanding_invoices = Invoice.objects.filter(
-        landlord=request.user,
-    ).exclude(status='paid')
-    total_outstanding = sum(inv.remaining_balance for inv in outstanding_invoices)
+    total_outstanding = Invoice.objects.filter(
+        landlord=landlord,
+    ).exclude(status='paid').aggregate(
+        total=Sum(remaining_balance_expr()),
+    )['total'] or Decimal('0.00')
 
     # Current-month invoice payment status breakdown
     current_invoices = Invoice.objects.filter(
-        landlord=request.user,
+        landlord=landlord,
         month=current_month,
         year=current_year,
-    ).select_related('tenant', 'unit', 'unit__apartment')
-
-    # Refresh overdue
-    current_invoices.filter(
-        status__in=['unpaid', 'partial'], due_date__lt=today
-    ).update(status='overdue')
+    ).with_effective_status(today).select_related('tenant', 'unit', 'unit__apartment')
 
     paid_tenants = []
     partial_tenants = []
@@ -71,19 +79,21 @@ def dashboard(request):
             'total_amount': str(inv.total_amount),
             'amount_paid': str(inv.amount_paid),
             'remaining_balance': str(inv.remaining_balance),
-            'status': inv.status,
+            'status': inv.effective_status,
         }
-        if inv.status == 'paid':
+        if inv.effective_status == 'paid':
             paid_tenants.append(entry)
-        elif inv.status in ('partial', 'overdue'):
+        elif inv.effective_status in ('partial', 'overdue'):
             partial_tenants.append(entry)
         else:
             unpaid_tenants.append(entry)
 
     # Recent payments (last 10)
     recent_payments = Payment.objects.filter(
-        invoice__landlord=request.user
-    ).select_related('invoice', 'invoice__tenant', 'invoice__unit').order_by('-created_at')[:10]
+        invoice__landlord=landlord
+    ).select_related(
+        'invoice', 'invoice__tenant', 'invoice__unit', 'invoice__unit__apartment',
+    ).order_by('-created_at')[:10]
 
     recent_payments_data = [
         {
@@ -97,11 +107,11 @@ def dashboard(request):
         for p in recent_payments
     ]
 
-    return Response({
+    return {
         'units': {
-            'total': total_units,
-            'occupied': occupied,
-            'vacant': vacant,
+            'total': unit_stats['total'],
+            'occupied': unit_stats['occupied'],
+            'vacant': unit_stats['vacant'],
         },
         'revenue_this_month': str(monthly_payments),
         'total_outstanding': str(total_outstanding),
@@ -113,16 +123,90 @@ def dashboard(request):
             'unpaid': unpaid_tenants,
         },
         'recent_payments': recent_payments_data,
-    })
+    }
+
+
+# ── Report rows ───────────────────────────────────────────────────────────────
+# Built from values() so JSON, CSV and NDJSON share one row shape and exports
+# can stream from a server-side cursor without instantiating models. Tenant
+# and unit display strings are concatenated in SQL (billing.list_values).
+
+PAYMENT_COLUMNS = (
+    'id', 'date', 'tenant', 'unit', 'apartment', 'amount', 'method', 'reference', 'invoice_id',
+)
+OUTSTANDING_COLUMNS = (
+    'invoice_id', 'tenant', 'unit', 'apartment', 'period', 'total_amount', 'amount_paid',
+    'remaining_balance', 'due_date', 'status', 'days_overdue',
+)
+EXPORT_RENDERERS = api_settings.DEFAULT_RENDERER_CLASSES + [CSVRenderer, NDJSONRenderer]
+
+
+def _payment_rows(qs):
+    method_labels = dict(Payment.METHOD_CHOICES)
+    values = qs.order_by('-payment_date').values(
+        'id', 'payment_date', 'amount', 'method', 'reference_number', 'invoice_id',
+        'invoice__unit__apartment__name',
+        tenant_name=full_name('invoice__tenant__'), unit_name=unit_display('invoice__unit__'),
+    )
+    for p in values.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'id': p['id'],
+            'date': str(p['payment_date']),
+            'tenant': p['tenant_name'],
+            'unit': p['unit_name'],
+            'apartment': p['invoice__unit__apartment__name'],
+            'amount': str(p['amount']),
+            'method': method_labels.get(p['method'], p['method']),
+            'reference': p['reference_number'],
+            'invoice_id': p['invoice_id'],
+        }
+
+
+def _outstanding_rows(qs):
+    values = qs.order_by('tenant__first_name', 'year', 'month').values(
+        'id', 'month', 'year', 'total_amount', 'amount_paid', 'due_date',
+        'balance_due', 'effective_status', 'days_overdue', 'unit__apartment__name',
+        tenant_name=full_name('tenant__'), unit_name=unit_display('unit__'),
+    )
+    for inv in values.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'invoice_id': inv['id'],
+            'tenant': inv['tenant_name'],
+            'unit': inv['unit_name'],
+            'apartment': inv['unit__apartment__name'],
+            'period': f"{inv['month']}/{inv['year']}",
+            'total_amount': str(inv['total_amount']),
+            'amount_paid': str(inv['amount_paid']),
+            'remaining_balance': str(inv['balance_due']),
+            'due_date': str(inv['due_date']),
+            'status': inv['effective_status'],
+            'days_overdue': inv['days_overdue'],
+        }
+
+
+def _export(request, rows, columns, sum_column, total_key, filename):
+    """Stream rows with a running total, for ?format=csv / ?format=ndjson."""
+    totals = {total_key: Decimal('0.00'), 'count': 0}
+
+    def counted():
+        for row in rows:
+            totals[total_key] += Decimal(row[sum_column])
+            totals['count'] += 1
+            yield row
+
+    def trailer():
+        return {total_key: str(totals[total_key]), 'count': totals['count']}
+
+    return stream_export(request.accepted_renderer.format, counted(), columns, trailer, filename)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 @landlord_required
+@replica_reads
 def payment_report(request):
-    qs = Payment.objects.filter(
-        invoice__landlord=request.user
-    ).select_related('invoice', 'invoice__tenant', 'invoice__unit', 'invoice__unit__apartment')
+    qs = Payment.objects.filter(invoice__landlord=request.user)
 
     # Filters
     apartment_id = request.query_params.get('apartment')
@@ -145,37 +229,26 @@ def payment_report(request):
     if method:
         qs = qs.filter(method=method)
 
-    total = qs.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    if request.accepted_renderer.format in ('csv', 'ndjson'):
+        return _export(request, _payment_rows(qs), PAYMENT_COLUMNS, 'amount', 'total', 'payments')
 
-    data = [
-        {
-            'id': p.id,
-            'date': str(p.payment_date),
-            'tenant': p.invoice.tenant.get_full_name(),
-            'unit': str(p.invoice.unit),
-            'apartment': p.invoice.unit.apartment.name,
-            'amount': str(p.amount),
-            'method': p.get_method_display(),
-            'reference': p.reference_number,
-            'invoice_id': p.invoice.id,
-        }
-        for p in qs.order_by('-payment_date')
-    ]
+    totals = qs.aggregate(total=Sum('amount'), count=Count('id'))
+    total = totals['total'] or Decimal('0.00')
+    data = list(_payment_rows(qs))
 
-    return Response({'payments': data, 'total': str(total), 'count': len(data)})
+    return Response({'payments': data, 'total': str(total), 'count': totals['count']})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 @landlord_required
+@replica_reads
 def outstanding_report(request):
     today = timezone.now().date()
     qs = Invoice.objects.filter(
         landlord=request.user,
-    ).exclude(status='paid').select_related('tenant', 'unit', 'unit__apartment')
-
-    # Refresh overdue
-    qs.filter(status__in=['unpaid', 'partial'], due_date__lt=today).update(status='overdue')
+    ).exclude(status='paid').with_effective_status(today).with_balances(today)
 
     apartment_id = request.query_params.get('apartment')
     unit_id = request.query_params.get('unit')
@@ -188,30 +261,20 @@ def outstanding_report(request):
     if tenant_id:
         qs = qs.filter(tenant_id=tenant_id)
 
-    data = [
-        {
-            'invoice_id': inv.id,
-            'tenant': inv.tenant.get_full_name(),
-            'unit': str(inv.unit),
-            'apartment': inv.unit.apartment.name,
-            'period': f'{inv.month}/{inv.year}',
-            'total_amount': str(inv.total_amount),
-            'amount_paid': str(inv.amount_paid),
-            'remaining_balance': str(inv.remaining_balance),
-            'due_date': str(inv.due_date),
-            'status': inv.status,
-            'days_overdue': (today - inv.due_date).days if inv.due_date < today else 0,
-        }
-        for inv in qs.order_by('tenant__first_name', 'year', 'month')
-    ]
+    if request.accepted_renderer.format in ('csv', 'ndjson'):
+        return _export(request, _outstanding_rows(qs), OUTSTANDING_COLUMNS,
+                       'remaining_balance', 'grand_total', 'outstanding')
 
-    grand_total = sum(Decimal(d['remaining_balance']) for d in data)
+    totals = qs.aggregate(grand_total=Sum('balance_due'), count=Count('id'))
+    grand_total = totals['grand_total'] or Decimal('0.00')
+    data = list(_outstanding_rows(qs))
 
-    return Response({'invoices': data, 'grand_total': str(grand_total), 'count': len(data)})
+    return Response({'invoices': data, 'grand_total': str(grand_total), 'count': totals['count']})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def tenant_dashboard(request):
     """Dashboard data for the logged-in tenant."""
     if not request.user.is_tenant:
@@ -219,26 +282,29 @@ def tenant_dashboard(request):
         return Response({'detail': 'Tenant access only.'}, status=drf_status.HTTP_403_FORBIDDEN)
 
     today = timezone.now().date()
-    invoices = Invoice.objects.filter(tenant=request.user).select_related('unit', 'unit__apartment')
-    # Refresh overdue
-    invoices.filter(status__in=['unpaid', 'partial'], due_date__lt=today).update(status='overdue')
+    invoices = Invoice.objects.filter(tenant=request.user).with_effective_status(today).select_related(
+        'unit', 'unit__apartment'
+    )
 
-    total_outstanding = sum(inv.remaining_balance for inv in invoices.exclude(status='paid'))
+    total_outstanding = invoices.exclude(status='paid').aggregate(
+        total=Sum(remaining_balance_expr()),
+    )['total'] or Decimal('0.00')
     recent_invoices = invoices.order_by('-year', '-month')[:5]
 
     payments = Payment.objects.filter(
         invoice__tenant=request.user
     ).select_related('invoice').order_by('-payment_date')[:10]
 
-    try:
-        profile = request.user.tenant_profile
+    profile = TenantProfile.objects.select_related('unit', 'unit__apartment').filter(
+        user=request.user,
+    ).first()
+    unit_info = {}
+    if profile is not None:
         unit_info = {
             'unit_number': profile.unit.unit_number if profile.unit else None,
             'apartment': profile.unit.apartment.name if profile.unit else None,
             'description': profile.unit.description if profile.unit else None,
         }
-    except Exception:
-        unit_info = {}
 
     return Response({
         'total_outstanding': str(total_outstanding),
@@ -250,7 +316,7 @@ def tenant_dashboard(request):
                 'total_amount': str(inv.total_amount),
                 'amount_paid': str(inv.amount_paid),
                 'remaining_balance': str(inv.remaining_balance),
-                'status': inv.status,
+                'status': inv.effective_status,
                 'due_date': str(inv.due_date),
             }
             for inv in recent_invoices
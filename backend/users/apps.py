@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class UsersConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'users'
+
+    def ready(self):
+        from . import authentication  # noqa: F401  (signal receivers)
+
+        if settings.TOKEN_PRUNE_SCHEDULER:
+            from .blacklist import start_pruner
+            start_pruner()
@@ -0,0 +1,111 @@
+"""
+JWT authentication without loading the user row on every request.
+
+Access tokens issued by ``FlexibleTokenSerializer`` carry the user's ``role``
+next to the user id. From those claims ``JWTAuthentication`` builds a
+lightweight ``User`` (id, role and is_active loaded; any other field is
+fetched from the database on first access), so views that only filter by
+``request.user`` and check ``is_landlord`` / ``is_tenant`` never query the
+``users`` table.
+
+Deactivation and role changes still take effect: each process remembers
+``(is_active, role)`` per user for JWT_USER_CACHE_TTL seconds and re-reads
+that one indexed row when the entry expires. Saving or deleting a user
+forgets it at once in the process that made the change; other processes
+notice within the TTL. Tokens issued before the role claim existed fall
+back to loading the full user.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import router
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from rental_system.metrics import CACHE_REQUESTS, JWT_AUTHENTICATIONS
+
+from .models import User
+
+ROLE_CLAIM = 'role'
+MAX_CACHED_USERS = 10000
+
+_states = {}  # user id -> (expires, (is_active, role) or None if the user is gone)
+_states_lock = threading.Lock()
+
+
+def user_state(user_id):
+    """``(is_active, role)`` for ``user_id``, or None if there is no such user."""
+    ttl = settings.JWT_USER_CACHE_TTL
+    now = time.monotonic()
+    entry = _states.get(user_id)
+    if entry is not None and entry[0] > now:
+        CACHE_REQUESTS.inc(cache='jwt_user', result='hit')
+        return entry[1]
+    CACHE_REQUESTS.inc(cache='jwt_user', result='miss')
+    state = User.objects.filter(pk=user_id).values_list('is_active', 'role').first()
+    if ttl > 0:
+        with _states_lock:
+            if len(_states) >= MAX_CACHED_USERS:
+                for key in [k for k, (expires, _) in _states.items() if expires <= now] or list(_states):
+                    del _states[key]
+            _states[user_id] = (now + ttl, state)
+    return state
+
+
+def forget_user(user_id):
+    with _states_lock:
+        _states.pop(user_id, None)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    simplejwt authentication that builds the user from the token claims and
+    counts outcomes in ``jwt_authentications_total``.
+    """
+
+    def authenticate(self, request):
+        try:
+            result = super().authenticate(request)
+        except InvalidToken:
+            JWT_AUTHENTICATIONS.inc(outcome='invalid_token')
+            raise
+        except AuthenticationFailed as exc:
+            code = exc.get_codes()
+            JWT_AUTHENTICATIONS.inc(outcome=code if isinstance(code, str) else 'failed')
+            raise
+        JWT_AUTHENTICATIONS.inc(outcome='success' if result else 'no_token')
+        return result
+
+    def get_user(self, validated_token):
+        role = validated_token.get(ROLE_CLAIM)
+        if role is None or api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        state = user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        is_active, current_role = state
+        if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if current_role != role:
+            raise AuthenticationFailed('User role has changed; log in again.', code='role_changed')
+
+        # A model instance with every other field deferred (loaded on access);
+        # from_db() takes the loaded fields in model field order.
+        return User.from_db(
+            router.db_for_read(User), ['id', 'is_active', 'role'], [user_id, is_active, role],
+        )
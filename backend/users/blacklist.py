@@ -0,0 +1,119 @@
+"""
+Pruning of the refresh-token blacklist tables.
+
+With ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION every refresh adds an
+OutstandingToken row and blacklists the old one, and simplejwt never removes
+them. Once a token has expired its signature check already rejects it, so
+its rows can go.
+
+simplejwt's ``flushexpiredtokens`` does that in one DELETE, which on a large
+table holds its locks for a long time. Here the rows are walked in
+primary-key order instead, a chunk per short transaction. ``expires_at`` is
+not indexed, but every refresh token gets the same lifetime, so it grows with
+the primary key: the walk stops at the first chunk without an expired token
+rather than scanning the rest of the table.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from rental_system.metrics import TOKEN_TABLE_ROWS, TOKENS_PRUNED
+
+logger = logging.getLogger(__name__)
+
+_pruner = None
+_sizes_recorded = None
+
+
+def record_table_sizes():
+    """Set the ``jwt_token_table_rows`` gauge; returns (outstanding, blacklisted)."""
+    global _sizes_recorded
+    outstanding = OutstandingToken.objects.count()
+    blacklisted = BlacklistedToken.objects.count()
+    TOKEN_TABLE_ROWS.set(outstanding, table='outstanding')
+    TOKEN_TABLE_ROWS.set(blacklisted, table='blacklisted')
+    _sizes_recorded = time.monotonic()
+    return outstanding, blacklisted
+
+
+def refresh_table_sizes():
+    """Re-count the tables for a metrics scrape, at most every TOKEN_TABLE_SIZE_INTERVAL seconds."""
+    if _sizes_recorded is None or time.monotonic() - _sizes_recorded >= settings.TOKEN_TABLE_SIZE_INTERVAL:
+        try:
+            record_table_sizes()
+        except DatabaseError:
+            logger.exception('Counting the refresh-token tables failed')
+
+
+def prune_expired_tokens(now=None, chunk_size=None, pause=0):
+    """
+    Delete outstanding tokens that expired before ``now`` together with their
+    blacklist entries, ``chunk_size`` at a time, sleeping ``pause`` seconds
+    between chunks. Returns (outstanding, blacklisted) rows deleted.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or settings.TOKEN_PRUNE_CHUNK_SIZE
+    deleted = {'outstanding': 0, 'blacklisted': 0}
+    last_pk = 0
+    while True:
+        rows = list(
+            OutstandingToken.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'expires_at')[:chunk_size]
+        )
+        expired = [pk for pk, expires_at in rows if expires_at < now]
+        if not expired:
+            break
+        last_pk = rows[-1][0]
+        with transaction.atomic():
+            # Blacklist rows go with their token (CASCADE, as one DELETE ... IN).
+            _, per_model = OutstandingToken.objects.filter(
+                pk__in=expired, expires_at__lt=now,
+            ).only('pk').delete()
+        for table, model in (('outstanding', OutstandingToken), ('blacklisted', BlacklistedToken)):
+            count = per_model.get(model._meta.label, 0)
+            deleted[table] += count
+            TOKENS_PRUNED.inc(count, table=table)
+        if len(rows) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted['outstanding'], deleted['blacklisted']
+
+
+def run_pruning(chunk_size=None, pause=0):
+    outstanding, blacklisted = prune_expired_tokens(chunk_size=chunk_size, pause=pause)
+    remaining = record_table_sizes()
+    logger.info(
+        'Pruned %d expired refresh token(s) and %d blacklist entries; %d and %d remain',
+        outstanding, blacklisted, *remaining,
+    )
+    return (outstanding, blacklisted), remaining
+
+
+def start_pruner(interval=None):
+    """Start the in-process pruning thread (idempotent per process)."""
+    from billing.overdue import _is_management_command
+
+    global _pruner
+    if _pruner is not None or _is_management_command():
+        return _pruner
+    interval = interval or settings.TOKEN_PRUNE_INTERVAL
+
+    def loop():
+        while True:
+            try:
+                run_pruning()
+            except Exception:
+                logger.exception('Pruning expired refresh tokens failed')
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+    _pruner = threading.Thread(target=loop, name='token-pruner', daemon=True)
+    _pruner.start()
+    return _pruner
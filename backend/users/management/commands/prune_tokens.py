@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.blacklist import record_table_sizes, run_pruning
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired refresh tokens and their blacklist entries in short chunked '
+        'transactions (schedule via cron, or set TOKEN_PRUNE_SCHEDULER=True).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Tokens deleted per transaction (default: TOKEN_PRUNE_CHUNK_SIZE).')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks, to leave room for other writers.')
+        parser.add_argument('--stats', action='store_true', help='Only report the table sizes.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        if options['stats']:
+            outstanding, blacklisted = record_table_sizes()
+            self.stdout.write(f'{outstanding} outstanding token(s), {blacklisted} blacklisted.')
+            return
+        (outstanding, blacklisted), (left, left_blacklisted) = run_pruning(
+            chunk_size=options['chunk_size'], pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {outstanding} expired token(s) and {blacklisted} blacklist entries; '
+            f'{left} outstanding and {left_blacklisted} blacklisted remain.'
+        ))
@@ -0,0 +1,128 @@
+import io
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from billing.endpoint_suite import quiet_request_logs
+
+from . import authentication
+from .authentication import ROLE_CLAIM
+from .blacklist import prune_expired_tokens
+from .models import User
+from .views import FlexibleTokenSerializer
+
+
+@override_settings(JWT_USER_CACHE_TTL=1)
+class JWTAuthenticationTests(TestCase):
+    """Users built from token claims, and how soon changes to the user take effect."""
+
+    def setUp(self):
+        authentication._states.clear()
+        self.addCleanup(authentication._states.clear)
+        quiet = quiet_request_logs()
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+        self.user = User.objects.create_user('jwt-landlord', password='x', role=User.LANDLORD)
+
+    def _client(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def _status(self, client):
+        return client.get('/api/apartments/').status_code
+
+    def _changed_elsewhere(self, **fields):
+        """Change the user the way another process would: no signal reaches this one."""
+        User.objects.filter(pk=self.user.pk).update(**fields)
+
+    def test_user_is_built_from_the_claims(self):
+        client = self._client(FlexibleTokenSerializer.get_token(self.user).access_token)
+        self.assertEqual(self._status(client), 200)
+        with self.assertNumQueries(1):  # the apartments; the user state is cached
+            self.assertEqual(self._status(client), 200)
+
+    def test_deactivation_takes_effect_within_the_ttl(self):
+        client = self._client(FlexibleTokenSerializer.get_token(self.user).access_token)
+        self.assertEqual(self._status(client), 200)
+        self._changed_elsewhere(is_active=False)
+        self.assertEqual(self._status(client), 200)  # cached until the TTL runs out
+        time.sleep(1.1)  # JWT_USER_CACHE_TTL
+        self.assertEqual(self._status(client), 401)
+
+    def test_role_change_takes_effect_within_the_ttl(self):
+        client = self._client(FlexibleTokenSerializer.get_token(self.user).access_token)
+        self.assertEqual(self._status(client), 200)
+        self._changed_elsewhere(role=User.TENANT)
+        time.sleep(1.1)  # JWT_USER_CACHE_TTL
+        response = client.get('/api/apartments/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'].code, 'role_changed')
+
+    def test_save_in_this_process_takes_effect_at_once(self):
+        client = self._client(FlexibleTokenSerializer.get_token(self.user).access_token)
+        self.assertEqual(self._status(client), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._status(client), 401)
+
+    def test_token_without_role_claim_loads_the_user(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertNotIn(ROLE_CLAIM, token)
+        client = self._client(token)
+        self.assertEqual(self._status(client), 200)
+        self._changed_elsewhere(is_active=False)
+        self.assertEqual(self._status(client), 401)  # read from the users table every time
+
+
+class PruneTokensTests(TestCase):
+    """Expired refresh tokens and their blacklist entries are deleted a chunk at a time."""
+
+    def setUp(self):
+        user = User.objects.create_user('prune-user', password='x', role=User.TENANT)
+        now = timezone.now()
+        # Every refresh token has the same lifetime, so expiry grows with the primary key.
+        for n in range(8):
+            token = OutstandingToken.objects.create(
+                user=user, jti=f'prune-{n}', token=f'token-{n}',
+                created_at=now, expires_at=now + timedelta(hours=n - 5, minutes=30),
+            )
+            if n % 2:
+                BlacklistedToken.objects.create(token=token)
+        self.now = now
+
+    def _token_deletes(self, queries):
+        table = OutstandingToken._meta.db_table
+        return [q for q in queries if q['sql'].startswith('DELETE') and f'"{table}"' in q['sql']]
+
+    def test_expired_tokens_are_deleted_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            deleted = prune_expired_tokens(now=self.now, chunk_size=2)
+
+        self.assertEqual(deleted, (5, 2))  # tokens 0-4, of which 1 and 3 were blacklisted
+        self.assertEqual(len(self._token_deletes(queries)), 3)
+        self.assertEqual(
+            list(OutstandingToken.objects.order_by('pk').values_list('jti', flat=True)),
+            ['prune-5', 'prune-6', 'prune-7'],
+        )
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ['prune-5', 'prune-7'])
+
+    def test_nothing_expired_stops_after_the_first_chunk(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(prune_expired_tokens(now=self.now - timedelta(days=1), chunk_size=2), (0, 0))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(OutstandingToken.objects.count(), 8)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('prune_tokens', '--chunk-size', '3', stdout=out)
+        # Tokens 0-4 expired at least half an hour before the command ran.
+        self.assertIn('Deleted 5 expired token(s) and 2 blacklist entries; 3 outstanding', out.getvalue())
@@ -1,10 +1,15 @@
+import time
+
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from rental_system.metrics import JWT_REFRESH_DURATION
 
+from .authentication import ROLE_CLAIM
 from .models import User
 from .serializers import ChangePasswordSerializer, UserSerializer
 
@@ -14,6 +19,13 @@ from .serializers import ChangePasswordSerializer, UserSerializer
 class FlexibleTokenSerializer(TokenObtainPairSerializer):
     """Allow users to authenticate with either their username or email address."""
 
+    @classmethod
+    def get_token(cls, user):
+        # Read by users.authentication to build request.user without a query.
+        token = super().get_token(user)
+        token[ROLE_CLAIM] = user.role
+        return token
+
     def validate(self, attrs):
         identifier = attrs.get(self.username_field, '').strip()
 
@@ -31,14 +43,31 @@ class FlexibleTokenObtainPairView(TokenObtainPairView):
     serializer_class = FlexibleTokenSerializer
 
 
+class TimedTokenRefreshView(TokenRefreshView):
+    """Token refresh timed in ``jwt_refresh_duration_seconds`` (it checks and grows the blacklist)."""
+
+    def post(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        outcome = 'rejected'
+        try:
+            response = super().post(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                outcome = 'ok'
+            return response
+        finally:
+            JWT_REFRESH_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+
+
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def me(request):
+    # request.user only has the fields carried by the token; load the rest at once.
+    user = User.objects.get(pk=request.user.pk)
     if request.method == 'GET':
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(user)
         return Response(serializer.data)
 
-    serializer = UserSerializer(request.user, data=request.data, partial=True)
+    serializer = UserSerializer(user, data=request.data, partial=True)
     if serializer.is_valid():
         serializer.save()
         return Response(serializer.data)
@@ -51,6 +80,6 @@ def change_password(request):
     serializer = ChangePasswordSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         request.user.set_password(serializer.validated_data['new_password'])
-        request.user.save()
+        request.user.save(update_fields=['password'])
         return Response({'detail': 'Password updated successfully.'})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)